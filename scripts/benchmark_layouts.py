@@ -0,0 +1,105 @@
+"""
+Compare the nested and affine strided-array layouts.
+
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+import sys
+import time
+import numpy
+
+from qy import (
+    StridedArrays,
+    StridedArrayArgument,
+    compile_kernel,
+    )
+
+layouts = [
+    ("nested",  dict(static = True, affine = False)),
+    ("affine",  dict(static = True, affine = True)),
+    ("dynamic", dict(static = False)),
+    ]
+
+def axpy_kernel(in_, out, **keywords):
+    """
+    Compile a kernel computing out = 2 * in + out, with some array layout.
+    """
+
+    argument_types = [
+        StridedArrayArgument.from_numpy(in_, **keywords),
+        StridedArrayArgument.from_numpy(out, **keywords),
+        ]
+
+    @compile_kernel(argument_types = argument_types, cache = None)
+    def kernel(in_, out):
+        arrays = StridedArrays({"in" : in_, "out" : out})
+
+        @arrays.loop_all()
+        def _(l):
+            (l.arrays["in"].data.load() * 2.0 + l.arrays["out"].data.load()).store(l.arrays["out"].data)
+
+    return kernel
+
+def time_kernel(kernel, in_, out, repeats):
+    """
+    Return the best-of-N run time of a kernel.
+    """
+
+    runs = []
+
+    for _ in xrange(repeats):
+        start = time.time()
+
+        kernel(in_, out)
+
+        runs.append(time.time() - start)
+
+    return min(runs)
+
+def main(size = 2048, repeats = 5):
+    """
+    Run the benchmark and print a report.
+    """
+
+    size    = int(size)
+    repeats = int(repeats)
+    base    = numpy.random.rand(size, 2 * size)
+    cases   = [
+        ("contiguous", base[:, :size], numpy.empty((size, size))),
+        ("strided",    base[:, ::2],   numpy.empty((size, size))),
+        ("transposed", base[:, :size], numpy.empty((size, size)).T),
+        ]
+
+    print "out = 2 * in + out over %i x %i float64:" % (size, size)
+
+    for (name, in_, out) in cases:
+        print "  %s:" % name
+
+        baseline = None
+
+        for (layout, keywords) in layouts:
+            start   = time.time()
+            kernel  = axpy_kernel(in_, out, **keywords)
+            compile = time.time() - start
+
+            out[...] = 0.0
+
+            kernel(in_, out)
+
+            assert numpy.all(out == 2.0 * in_)
+
+            run = time_kernel(kernel, in_, out, repeats)
+
+            if baseline is None:
+                baseline = run
+
+            print "    %-7s: compile %7.2f ms, run %8.2f ms, %6.2f GB/s, speedup %5.2fx" % (
+                layout,
+                compile * 1e3,
+                run * 1e3,
+                3.0 * in_.nbytes / run / 1e9,
+                baseline / run,
+                )
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
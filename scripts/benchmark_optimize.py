@@ -0,0 +1,115 @@
+"""
+Compare compile and run times across qy optimization levels.
+
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+import sys
+import time
+import numpy
+
+from qy import (
+    StridedArrays,
+    emit_module,
+    compile_module,
+    optimize_module,
+    format_pass_timings,
+    )
+
+def emit_lowloop_copy(in_, out):
+    """
+    Emit the strided copy loop from the lowloop tests.
+    """
+
+    arrays = StridedArrays.from_numpy({"in" : in_, "out" : out})
+
+    @arrays.loop_all()
+    def _(l):
+        (l.arrays["in"].data.load() * 2.0 + 1.0).store(l.arrays["out"].data)
+
+def emit_ln_gamma(xs, out):
+    """
+    Emit repeated log-gamma evaluations from the math tests.
+    """
+
+    from qy.math import ln_gamma
+
+    arrays = StridedArrays.from_numpy({"x" : xs, "out" : out})
+
+    @arrays.loop_all()
+    def _(l):
+        ln_gamma(l.arrays["x"].data.load()).store(l.arrays["out"].data)
+
+def time_level(emit, level, repeats):
+    """
+    Return compile and best-of-N run times for one level.
+    """
+
+    start    = time.time()
+    compiled = compile_module(emit_module(emit), optimize = level)
+    compile_ = time.time() - start
+    runs     = []
+
+    for _ in xrange(repeats):
+        start = time.time()
+
+        compiled.engine.run_function(compiled.main, [])
+
+        runs.append(time.time() - start)
+
+    return (compile_, min(runs), compiled.pass_timings)
+
+def time_pipeline(emit, level):
+    """
+    Return the time taken by one level's pipeline under a single pass manager.
+    """
+
+    [(_, seconds)] = optimize_module(emit_module(emit), level, per_pass = False)
+
+    return seconds
+
+def main(size = 2**22, repeats = 5):
+    """
+    Run the benchmarks and print a report.
+    """
+
+    size    = int(size)
+    repeats = int(repeats)
+    in_     = numpy.random.rand(size // 1024, 1024)
+    out     = numpy.empty_like(in_)
+    xs      = numpy.random.rand(size // 16) * 100.0 + 0.1
+    ys      = numpy.empty_like(xs)
+
+    benchmarks = [
+        ("lowloop copy", lambda: emit_lowloop_copy(in_, out)),
+        ("ln_gamma",     lambda: emit_ln_gamma(xs, ys)),
+        ]
+
+    for (name, emit) in benchmarks:
+        print "%s:" % name
+
+        baseline = None
+        details  = None
+
+        for level in ["O0", "O1", "O2", "O3", "Os"]:
+            (compile_, run, timings) = time_level(emit, level, repeats)
+
+            if baseline is None:
+                baseline = run
+
+            print "  %s: compile %8.2f ms, run %8.2f ms, speedup %5.2fx" % (
+                level,
+                compile_ * 1e3,
+                run * 1e3,
+                baseline / run,
+                )
+
+            if level == "O3":
+                details = timings
+
+        print "  O3 pass timings (approximate; each pass under its own pass manager):"
+        print "    " + format_pass_timings(details).replace("\n", "\n    ")
+        print "  O3 pipeline under one pass manager: %.3f ms" % (time_pipeline(emit, "O3") * 1e3)
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,80 @@
+"""
+Compare tiled and untiled strided loops on a transposing copy.
+
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+import sys
+import time
+import numpy
+
+from qy import (
+    StridedArrays,
+    StridedArrayArgument,
+    compile_kernel,
+    )
+
+def transpose_kernel(tile):
+    """
+    Compile a kernel copying one array into another of transposed layout.
+    """
+
+    argument = StridedArrayArgument(float, 2)
+
+    @compile_kernel(argument_types = [argument, argument], cache = None)
+    def kernel(in_, out):
+        arrays = StridedArrays({"in" : in_, "out" : out})
+
+        @arrays.loop_all(tile = tile)
+        def _(l):
+            l.arrays["in"].data.load().store(l.arrays["out"].data)
+
+    return kernel
+
+def time_kernel(kernel, in_, out, repeats):
+    """
+    Return the best-of-N run time of a kernel.
+    """
+
+    runs = []
+
+    for _ in xrange(repeats):
+        start = time.time()
+
+        kernel(in_, out)
+
+        runs.append(time.time() - start)
+
+    return min(runs)
+
+def main(size = 4096, repeats = 5):
+    """
+    Run the benchmark and print a report.
+    """
+
+    size    = int(size)
+    repeats = int(repeats)
+    in_     = numpy.random.rand(size, size)
+    out     = numpy.empty((size, size)).T
+
+    print "transposing copy of %i x %i float64 (%.0f MiB per array):" % (size, size, in_.nbytes / 2.0**20)
+
+    baseline = None
+
+    for tile in [None, 16, 32, 64, "auto"]:
+        run = time_kernel(transpose_kernel(tile), in_, out, repeats)
+
+        assert numpy.all(out == in_)
+
+        if baseline is None:
+            baseline = run
+
+        print "  tile %-6s: run %8.2f ms, %6.2f GB/s, speedup %5.2fx" % (
+            tile,
+            run * 1e3,
+            2.0 * in_.nbytes / run / 1e9,
+            baseline / run,
+            )
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -5,8 +5,23 @@
 from __future__ import absolute_import
 
 from .module     import *
+from .instrument import *
+from .cache      import *
+from .disk_cache import *
+from .optimize   import *
+from .target     import *
+from .kernel     import *
+from .pool       import *
+from .aot        import *
+from .aot_loader import *
 from .language   import *
 from .lowloop    import *
+from .parallel   import *
+from .reductions import *
+from .dispatcher import *
+from .ufuncs     import *
+from .fusion     import *
+from .streaming  import *
 from .statements import *
 
 from .values.base      import *
@@ -16,4 +31,5 @@ from .values.integer   import *
 from .values.real      import *
 from .values.variable  import *
 from .values.py_object import *
+from .values.vector    import *
 
@@ -0,0 +1,261 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "SharedLibrary",
+    ]
+
+import os
+import os.path
+import json
+import shutil
+import tempfile
+import subprocess
+import qy.llvm as llvm
+
+def describe_type(type_):
+    """
+    Return the manifest name of an LLVM scalar or pointer type.
+    """
+
+    if type_.kind == llvm.TYPE_VOID:
+        return "void"
+    elif type_.kind == llvm.TYPE_INTEGER:
+        return "i%i" % type_.width
+    elif type_.kind == llvm.TYPE_FLOAT:
+        return "f32"
+    elif type_.kind == llvm.TYPE_DOUBLE:
+        return "f64"
+    elif type_.kind == llvm.TYPE_POINTER:
+        return "ptr"
+    else:
+        raise ValueError("no ahead-of-time support for LLVM type %s" % type_)
+
+def describe_argument(argument, native_types):
+    """
+    Return the manifest entry of a kernel argument.
+    """
+
+    from qy import StridedArrayArgument
+
+    if isinstance(argument, StridedArrayArgument):
+        return {
+            "kind"    : "array",
+            "dtype"   : argument.dtype.str,
+            "ndim"    : argument.ndim,
+            "shape"   : None if argument.shape is None else list(argument.shape),
+            "strides" : None if argument.strides is None else list(argument.strides),
+            }
+    elif len(native_types) == 1:
+        return {
+            "kind" : "scalar",
+            "type" : describe_type(native_types[0]),
+            }
+    else:
+        raise TypeError("no ahead-of-time support for argument %r" % (argument,))
+
+class SharedLibrary(object):
+    """
+    Collection of kernels to be compiled ahead of time into a shared library.
+
+    The built library is accompanied by a JSON manifest of kernel signatures;
+    at run time, qy.aot_loader loads both with ctypes, without LLVM. Kernels
+    are emitted to run without the GIL, so qy.python() is unavailable, and
+    failed assertions are raised by the loader. Kernels must not embed
+    process-specific addresses, so array data must be bound with
+    StridedArrayArgument, and from_numpy() is unavailable.
+    """
+
+    def __init__(self, name):
+        """
+        Initialize.
+        """
+
+        self._name    = name
+        self._kernels = []
+
+    def kernel(self, return_type = None, argument_types = (), name = None):
+        """
+        Register a kernel emitter; the emitter is returned unchanged.
+
+        The arguments are as for qy.compile_kernel().
+        """
+
+        def decorator(emit):
+            """
+            Register the emitter.
+            """
+
+            kernel_name = emit.__name__ if name is None else name
+
+            if kernel_name in (k for (k, _, _, _) in self._kernels):
+                raise ValueError("duplicate kernel name \"%s\"" % kernel_name)
+
+            self._kernels.append((kernel_name, emit, return_type, list(argument_types)))
+
+            return emit
+
+        return decorator
+
+    def emit_modules(self, target = None):
+        """
+        Emit one module per kernel, for a target.
+
+        Returns (module, manifest entry) pairs.
+        """
+
+        from qy            import emit_module
+        from qy.kernel     import (
+            expand_argument_types,
+            group_argument_values,
+            )
+        from qy.language   import failed_assertion_name
+        from qy.disk_cache import has_baked_addresses
+
+        emitted = []
+
+        for (name, emit, return_type, argument_types) in self._kernels:
+            def emit_grouped(*values):
+                emit(*group_argument_values(argument_types, values))
+
+            module = emit_module(emit_grouped, return_type, expand_argument_types(argument_types), nogil = True, target = target)
+
+            if has_baked_addresses(module):
+                raise ValueError("kernel \"%s\" embeds a process-specific address" % name)
+
+            main      = module.get_function_named("main")
+            main_type = main.type.pointee
+            symbol    = "qy_%s_%s" % (self._name, name)
+            failed    = None
+
+            main.name = symbol
+
+            # give each kernel its own assertion record, to link them together
+            for variable in module.global_variables:
+                if variable.name == failed_assertion_name:
+                    failed        = "%s_failed_assertion" % symbol
+                    variable.name = failed
+
+            # match manifest arguments to their native types
+            arguments = []
+            position  = 0
+
+            for argument in argument_types:
+                count      = len(expand_argument_types([argument]))
+                arguments += [describe_argument(argument, main_type.args[position:position + count])]
+                position  += count
+
+            entry = {
+                "name"             : name,
+                "symbol"           : symbol,
+                "return"           : describe_type(main_type.return_type),
+                "arguments"        : arguments,
+                "native_arguments" : map(describe_type, main_type.args),
+                "failed_assertion" : failed,
+                }
+
+            emitted.append((module, entry))
+
+        return emitted
+
+    def build(self, path, optimize = "O2", target = None, cc = "cc", copy_loader = False):
+        """
+        Compile the kernels into a shared library at path.
+
+        The manifest is written beside it, and, optionally, a copy of the
+        standalone loader module. The target defaults to LLVM's generic CPU,
+        so that the library is portable. Returns the manifest path.
+        """
+
+        from qy import Target
+
+        from qy.optimize   import optimize_module
+        from qy.aot_loader import manifest_path_for
+
+        if target is None:
+            target = Target("", [])
+
+        machine = target.machine(reloc = llvm.RELOC_PIC)
+        staging = tempfile.mkdtemp()
+
+        try:
+            objects = []
+            entries = []
+
+            for (module, entry) in self.emit_modules(target):
+                module.verify()
+
+                module.triple      = machine.triple
+                module.data_layout = str(machine.target_data)
+
+                optimize_module(module, optimize, machine.target_data)
+
+                object_path = os.path.join(staging, "%s.o" % entry["name"])
+
+                with open(object_path, "wb") as object_file:
+                    object_file.write(machine.emit_object(module))
+
+                objects.append(object_path)
+                entries.append(entry)
+
+            subprocess.check_call([cc, "-shared", "-fPIC", "-o", path] + objects)
+        finally:
+            shutil.rmtree(staging)
+
+        manifest_path = manifest_path_for(path)
+
+        with open(manifest_path, "w") as manifest_file:
+            json.dump({"library" : self._name, "kernels" : entries}, manifest_file, indent = 4)
+
+        if copy_loader:
+            from qy import aot_loader
+
+            source = os.path.splitext(aot_loader.__file__)[0] + ".py"
+
+            shutil.copy(source, os.path.join(os.path.dirname(os.path.abspath(path)), "qy_aot_loader.py"))
+
+        return manifest_path
+
+    @property
+    def name(self):
+        """
+        The library name.
+        """
+
+        return self._name
+
+def main(argv = None):
+    """
+    Build a shared library from a qy.SharedLibrary object.
+    """
+
+    import argparse
+    import importlib
+
+    parser = argparse.ArgumentParser(prog = "python -m qy.aot", description = main.__doc__.strip())
+
+    parser.add_argument("library", help = "library object, as module.path:attribute")
+    parser.add_argument("output", help = "shared library path")
+    parser.add_argument("-O", "--optimize", default = "O2", help = "optimization level")
+    parser.add_argument("--cpu", default = "", help = "target CPU, or \"host\" (default: generic)")
+    parser.add_argument("--features", default = "", help = "target feature string")
+    parser.add_argument("--copy-loader", action = "store_true", help = "copy the standalone loader beside the library")
+
+    arguments = parser.parse_args(argv)
+
+    (module_name, _, attribute) = arguments.library.partition(":")
+
+    library = getattr(importlib.import_module(module_name), attribute)
+
+    from qy import Target
+
+    print library.build(
+        arguments.output,
+        optimize    = arguments.optimize,
+        target      = Target(arguments.cpu, arguments.features),
+        copy_loader = arguments.copy_loader,
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Load ahead-of-time compiled qy kernels.
+
+This module depends only on the standard library (and on numpy, for kernels
+with array arguments); it does not import qy or LLVM, and may be copied next to
+a built library and imported on its own.
+
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "LoadedKernel",
+    "LoadedLibrary",
+    "load_library",
+    ]
+
+import json
+import ctypes
+import os.path
+
+native_ctypes = {
+    "void" : None,
+    "i1"   : ctypes.c_bool,
+    "i8"   : ctypes.c_int8,
+    "i16"  : ctypes.c_int16,
+    "i32"  : ctypes.c_int32,
+    "i64"  : ctypes.c_int64,
+    "f32"  : ctypes.c_float,
+    "f64"  : ctypes.c_double,
+    "ptr"  : ctypes.c_void_p,
+    }
+
+def manifest_path_for(library_path):
+    """
+    Return the manifest path corresponding to a library path.
+    """
+
+    return os.path.splitext(library_path)[0] + ".json"
+
+class LoadedKernel(object):
+    """
+    Ahead-of-time compiled kernel.
+
+    An assertion that fails in the kernel is recorded in a library global,
+    and raised by the call as an AssertionError; the record is shared by
+    concurrent calls.
+    """
+
+    def __init__(self, library, entry):
+        """
+        Initialize.
+        """
+
+        self._name      = entry["name"]
+        self._arguments = entry["arguments"]
+        self._function  = getattr(library, entry["symbol"])
+
+        self._function.restype  = native_ctypes[entry["return"]]
+        self._function.argtypes = [native_ctypes[t] for t in entry["native_arguments"]]
+
+        if entry.get("failed_assertion") is None:
+            self._failed = None
+        else:
+            self._failed = ctypes.c_char_p.in_dll(library, entry["failed_assertion"])
+
+    def __call__(self, *arguments):
+        """
+        Run the kernel.
+        """
+
+        if len(arguments) != len(self._arguments):
+            raise TypeError(
+                "kernel %s expects %i arguments but received %i" % (
+                    self._name,
+                    len(self._arguments),
+                    len(arguments),
+                    ),
+                )
+
+        native = []
+
+        for (argument, value) in zip(self._arguments, arguments):
+            if argument["kind"] == "array":
+                native.extend(array_to_arguments(argument, value))
+            else:
+                native.append(value)
+
+        result = self._function(*native)
+
+        if self._failed is not None and self._failed.value is not None:
+            message = self._failed.value
+
+            self._failed.value = None
+
+            raise AssertionError(message)
+
+        return result
+
+    @property
+    def name(self):
+        """
+        The kernel name.
+        """
+
+        return self._name
+
+def array_to_arguments(argument, ndarray):
+    """
+    Return the native arguments describing an ndarray.
+    """
+
+    import numpy
+
+    if not isinstance(ndarray, numpy.ndarray):
+        raise TypeError("expected an ndarray, received a \"%s\" instance" % type(ndarray))
+    elif ndarray.dtype != numpy.dtype(argument["dtype"]):
+        raise TypeError("expected an array of dtype %s, received %s" % (argument["dtype"], ndarray.dtype))
+    elif ndarray.ndim != argument["ndim"]:
+        raise ValueError("expected an array of rank %i, received %i" % (argument["ndim"], ndarray.ndim))
+    elif argument["shape"] is not None and list(ndarray.shape) != argument["shape"]:
+        raise ValueError("expected an array of shape %s, received %s" % (argument["shape"], ndarray.shape))
+    elif argument["strides"] is not None and list(ndarray.strides) != argument["strides"]:
+        raise ValueError("expected an array of strides %s, received %s" % (argument["strides"], ndarray.strides))
+
+    (location, _) = ndarray.__array_interface__["data"]
+    arguments     = [location]
+
+    if argument["shape"] is None:
+        arguments += list(ndarray.shape)
+
+    if argument["strides"] is None:
+        arguments += list(ndarray.strides)
+
+    return arguments
+
+class LoadedLibrary(object):
+    """
+    Shared library of ahead-of-time compiled kernels.
+
+    Kernels are available as attributes, and by name through indexing.
+    """
+
+    def __init__(self, path, manifest_path = None):
+        """
+        Initialize.
+        """
+
+        if manifest_path is None:
+            manifest_path = manifest_path_for(path)
+
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+
+        # kernels do not call into Python, so release the GIL
+        self._library = ctypes.CDLL(os.path.abspath(path))
+        self._kernels = {}
+
+        for entry in manifest["kernels"]:
+            self._kernels[entry["name"]] = LoadedKernel(self._library, entry)
+
+    def __getattr__(self, name):
+        """
+        Look up a kernel.
+        """
+
+        try:
+            return self.__dict__["_kernels"][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, name):
+        """
+        Look up a kernel.
+        """
+
+        return self._kernels[name]
+
+    @property
+    def kernels(self):
+        """
+        Dictionary mapping names to kernels.
+        """
+
+        return dict(self._kernels)
+
+def load_library(path, manifest_path = None):
+    """
+    Load a shared library of ahead-of-time compiled kernels.
+    """
+
+    return LoadedLibrary(path, manifest_path)
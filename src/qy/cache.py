@@ -0,0 +1,145 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "module_hash",
+    "KernelCache",
+    "kernel_cache",
+    ]
+
+import hashlib
+import threading
+import collections
+
+def module_hash(module):
+    """
+    Return a canonical hash of an LLVM module's IR.
+    """
+
+    return hashlib.sha1(str(module)).hexdigest()
+
+class KernelCache(object):
+    """
+    Bounded LRU cache of compiled modules.
+    """
+
+    def __init__(self, capacity = 64):
+        """
+        Initialize.
+        """
+
+        if capacity < 1:
+            raise ValueError("cache capacity must be positive")
+
+        self._capacity  = capacity
+        self._entries   = collections.OrderedDict()
+        self._lock      = threading.Lock()
+        self._hits      = 0
+        self._misses    = 0
+        self._evictions = 0
+
+    def __len__(self):
+        """
+        Return the number of cached entries.
+        """
+
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """
+        Is an entry cached under this key?
+        """
+
+        return key in self._entries
+
+    def get(self, key):
+        """
+        Look up an entry, marking it most recently used; return None on a miss.
+        """
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is None:
+                self._misses += 1
+            else:
+                self._hits         += 1
+                self._entries[key]  = entry
+
+            return entry
+
+    def put(self, key, entry):
+        """
+        Insert an entry, evicting the least recently used if necessary.
+        """
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+            self._entries[key] = entry
+
+            while len(self._entries) > self._capacity:
+                self._entries.popitem(last = False)
+
+                self._evictions += 1
+
+    def clear(self):
+        """
+        Drop every entry and reset the counters.
+        """
+
+        with self._lock:
+            self._entries.clear()
+
+            self._hits      = 0
+            self._misses    = 0
+            self._evictions = 0
+
+    @property
+    def capacity(self):
+        """
+        The maximum number of cached entries.
+        """
+
+        return self._capacity
+
+    @property
+    def hits(self):
+        """
+        The number of successful lookups.
+        """
+
+        return self._hits
+
+    @property
+    def misses(self):
+        """
+        The number of failed lookups.
+        """
+
+        return self._misses
+
+    @property
+    def evictions(self):
+        """
+        The number of entries dropped to respect the capacity.
+        """
+
+        return self._evictions
+
+    @property
+    def stats(self):
+        """
+        A dictionary of the cache counters.
+        """
+
+        return {
+            "size"      : len(self._entries),
+            "capacity"  : self._capacity,
+            "hits"      : self._hits,
+            "misses"    : self._misses,
+            "evictions" : self._evictions,
+            }
+
+kernel_cache = KernelCache()
@@ -0,0 +1,275 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+from __future__ import absolute_import
+
+__all__ = [
+    "DiskCache",
+    "default_disk_cache",
+    ]
+
+import re
+import os
+import os.path
+import errno
+import hashlib
+import tempfile
+
+def llvm_version():
+    """
+    Return a string identifying the LLVM bindings in use.
+    """
+
+    import llvm
+
+    version = getattr(llvm, "version", None)
+
+    if version is None:
+        version = getattr(llvm, "__version__", "unknown")
+
+    return str(version)
+
+def host_signature():
+    """
+    Return a string identifying the host CPU and its features.
+    """
+
+    import platform
+
+    from qy.target import (
+        host_cpu_name,
+        host_cpu_features,
+        )
+
+    return "%s:%s:%s" % (platform.machine(), host_cpu_name(), ",".join(host_cpu_features()))
+
+def has_baked_addresses(module):
+    """
+    Does a module embed addresses valid only in the emitting process?
+
+    Such addresses appear as integer-to-pointer constants, as emitted by
+    StridedArray.from_numpy() and qy.python(), for example.
+    """
+
+    return re.search(r"inttoptr \(i\d+ [1-9-]", str(module)) is not None
+
+class DiskCache(object):
+    """
+    Directory of optimized module bitcode shared between processes.
+
+    Entries are keyed on a hash of the emitted IR (see compile_cached()), the
+    LLVM version, and the host CPU features. Writers stage each entry in a temporary file and rename
+    it into place, so concurrent processes never observe a partial entry; the
+    least recently used entries are deleted once the directory exceeds its size
+    bound.
+    """
+
+    suffix = ".bc"
+
+    def __init__(self, path, max_bytes = 256 * 2**20):
+        """
+        Initialize.
+        """
+
+        self._path      = path
+        self._max_bytes = max_bytes
+        self._salt      = "%s\0%s" % (llvm_version(), host_signature())
+
+        try:
+            os.makedirs(path)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+
+    def path_for(self, key):
+        """
+        Return the entry path for a cache key.
+        """
+
+        digest = hashlib.sha1("%r\0%s" % (key, self._salt)).hexdigest()
+
+        return os.path.join(self._path, digest + DiskCache.suffix)
+
+    def load(self, key):
+        """
+        Load a module from the cache; return None on a miss.
+        """
+
+        import qy.llvm as llvm
+
+        path = self.path_for(key)
+
+        try:
+            with open(path, "rb") as bitcode:
+                module = llvm.Module.from_bitcode(bitcode)
+        except IOError as error:
+            if error.errno == errno.ENOENT:
+                return None
+            else:
+                raise
+
+        # mark the entry as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return module
+
+    def store(self, key, module):
+        """
+        Atomically store a module in the cache.
+        """
+
+        (descriptor, staging_path) = tempfile.mkstemp(suffix = ".tmp", dir = self._path)
+
+        try:
+            with os.fdopen(descriptor, "wb") as staging:
+                module.to_bitcode(staging)
+
+            os.rename(staging_path, self.path_for(key))
+        except:
+            try:
+                os.unlink(staging_path)
+            except OSError:
+                pass
+
+            raise
+
+        self.evict()
+
+    def entries(self):
+        """
+        Return (path, size, last use) tuples, least recently used first.
+        """
+
+        entries = []
+
+        for name in os.listdir(self._path):
+            if name.endswith(DiskCache.suffix):
+                path = os.path.join(self._path, name)
+
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    # deleted by a concurrent evictor
+                    continue
+
+                entries.append((path, status.st_size, status.st_mtime))
+
+        return sorted(entries, key = lambda (_, __, m): m)
+
+    def evict(self, max_bytes = None):
+        """
+        Delete least recently used entries until the cache fits its bound.
+
+        Returns the number of entries deleted.
+        """
+
+        if max_bytes is None:
+            max_bytes = self._max_bytes
+
+        entries = self.entries()
+        total   = sum(s for (_, s, _) in entries)
+        deleted = 0
+
+        for (path, size, _) in entries:
+            if total <= max_bytes:
+                break
+
+            try:
+                os.unlink(path)
+
+                deleted += 1
+            except OSError as error:
+                if error.errno != errno.ENOENT:
+                    raise
+
+            total -= size
+
+        return deleted
+
+    def clear(self):
+        """
+        Delete every entry.
+        """
+
+        return self.evict(0)
+
+    @property
+    def path(self):
+        """
+        The cache directory.
+        """
+
+        return self._path
+
+    @property
+    def max_bytes(self):
+        """
+        The size bound of the cache directory.
+        """
+
+        return self._max_bytes
+
+    @property
+    def total_bytes(self):
+        """
+        The total size of the cached entries.
+        """
+
+        return sum(s for (_, s, _) in self.entries())
+
+def default_disk_cache():
+    """
+    Return the disk cache named by $QY_CACHE_DIR, or None.
+
+    The disk cache is never enabled implicitly; pass this to compile_kernel()
+    and friends to opt in to the environment's choice.
+    """
+
+    path = os.environ.get("QY_CACHE_DIR")
+
+    if path:
+        return DiskCache(path)
+    else:
+        return None
+
+def main(argv = None):
+    """
+    Inspect or prune a qy disk cache.
+    """
+
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(prog = "python -m qy.disk_cache", description = main.__doc__.strip())
+
+    parser.add_argument("--path", default = os.environ.get("QY_CACHE_DIR"), help = "cache directory (default: $QY_CACHE_DIR)")
+    parser.add_argument("command", choices = ["list", "stats", "evict", "clear"])
+    parser.add_argument("--max-bytes", type = int, default = None, help = "size bound for evict")
+
+    arguments = parser.parse_args(argv)
+
+    if not arguments.path:
+        parser.error("no cache directory given and $QY_CACHE_DIR is not set")
+
+    cache = DiskCache(arguments.path)
+
+    if arguments.command == "list":
+        for (path, size, used) in cache.entries():
+            print "%s %10i %s" % (time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(used)), size, os.path.basename(path))
+    elif arguments.command == "stats":
+        entries = cache.entries()
+
+        print "path:    %s" % cache.path
+        print "entries: %i" % len(entries)
+        print "bytes:   %i" % sum(s for (_, s, _) in entries)
+    elif arguments.command == "evict":
+        print "deleted %i entries" % cache.evict(arguments.max_bytes)
+    elif arguments.command == "clear":
+        print "deleted %i entries" % cache.clear()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "Dispatcher",
+    "dispatch",
+    ]
+
+import numpy
+
+class Dispatcher(object):
+    """
+    Kernel compiled on demand, in variants chosen by argument signature.
+
+    Array arguments are bound with StridedArrayArgument; scalar arguments are
+    passed as integers or reals. The emitter receives StridedArray and scalar
+    values. The policy controls how array shapes enter the compiled code:
+
+    - "static": every distinct shape and stride signature gets its own variant,
+      with extents and strides compiled in;
+    - "dynamic": one variant per dtype and rank signature, with extents and
+      strides passed at call time;
+    - "adaptive": the dynamic variant is used until a particular shape and
+      stride signature has been seen some number of times, after which it gets
+      a static variant of its own, up to a bounded number of such variants.
+
+    Static variants lay out their arrays in nested LLVM types unless affine is
+    set, in which case addresses are computed from the compiled-in strides;
+    see StridedArray. If nogil, variants release the GIL while they run; see
+    Kernel.
+    """
+
+    policies = ["static", "dynamic", "adaptive"]
+
+    def __init__(
+        self,
+        emit,
+        policy           = "dynamic",
+        specialize_after = 8,
+        max_variants     = 16,
+        return_type      = None,
+        optimize         = True,
+        target           = None,
+        nogil            = False,
+        affine           = False,
+        ):
+        """
+        Initialize.
+        """
+
+        if policy not in Dispatcher.policies:
+            raise ValueError("unknown specialization policy \"%s\"" % (policy,))
+
+        self._emit             = emit
+        self._policy           = policy
+        self._specialize_after = specialize_after
+        self._max_variants     = max_variants
+        self._return_type      = return_type
+        self._optimize         = optimize
+        self._target           = target
+        self._nogil            = nogil
+        self._affine           = affine
+        self._generic          = {}
+        self._specialized      = {}
+        self._sightings        = {}
+
+    def __call__(self, *arguments):
+        """
+        Run the variant matching these arguments.
+        """
+
+        return self.variant_for(*arguments)(*arguments)
+
+    def variant_for(self, *arguments):
+        """
+        Look up or compile the variant matching these arguments.
+        """
+
+        if self._policy == "dynamic":
+            return self._get_generic(arguments)
+        else:
+            signature = tuple(map(specific_signature, arguments))
+            kernel    = self._specialized.get(signature)
+
+            if kernel is not None:
+                return kernel
+            elif self._policy == "static":
+                return self._compile_specialized(signature, arguments)
+            else:
+                sightings = self._sightings.get(signature, 0) + 1
+
+                if sightings >= self._specialize_after and len(self._specialized) < self._max_variants:
+                    self._sightings.pop(signature, None)
+
+                    return self._compile_specialized(signature, arguments)
+                else:
+                    # bound the bookkeeping spent on rare shapes
+                    if len(self._sightings) >= 1024:
+                        self._sightings.clear()
+
+                    self._sightings[signature] = sightings
+
+                    return self._get_generic(arguments)
+
+    def _get_generic(self, arguments):
+        """
+        Look up or compile the dynamic-shape variant for these arguments.
+        """
+
+        signature = tuple(map(generic_signature, arguments))
+        kernel    = self._generic.get(signature)
+
+        if kernel is None:
+            kernel = self._compile([argument_type(a, False, self._affine) for a in arguments])
+
+            self._generic[signature] = kernel
+
+        return kernel
+
+    def _compile_specialized(self, signature, arguments):
+        """
+        Compile and store a static-shape variant.
+        """
+
+        kernel = self._compile([argument_type(a, True, self._affine) for a in arguments])
+
+        self._specialized[signature] = kernel
+
+        return kernel
+
+    def _compile(self, argument_types):
+        """
+        Compile one variant.
+        """
+
+        from qy import compile_kernel
+
+        # the dispatcher itself holds the variants
+        decorator = \
+            compile_kernel(
+                self._return_type,
+                argument_types,
+                optimize = self._optimize,
+                cache    = None,
+                target   = self._target,
+                nogil    = self._nogil,
+                )
+
+        return decorator(self._emit)
+
+    @property
+    def policy(self):
+        """
+        The specialization policy.
+        """
+
+        return self._policy
+
+    @property
+    def variants(self):
+        """
+        Dictionary mapping argument signatures to compiled variants.
+        """
+
+        variants = dict(self._generic)
+
+        variants.update(self._specialized)
+
+        return variants
+
+    @property
+    def specialized(self):
+        """
+        Dictionary mapping shape signatures to static-shape variants.
+        """
+
+        return dict(self._specialized)
+
+def generic_signature(argument):
+    """
+    Return the dtype and rank signature of a kernel argument.
+    """
+
+    if isinstance(argument, numpy.ndarray):
+        return ("array", argument.dtype.str, argument.ndim)
+    else:
+        return ("scalar", scalar_type(argument))
+
+def specific_signature(argument):
+    """
+    Return the full shape signature of a kernel argument.
+    """
+
+    if isinstance(argument, numpy.ndarray):
+        return ("array", argument.dtype.str, argument.shape, argument.strides)
+    else:
+        return ("scalar", scalar_type(argument))
+
+def scalar_type(value):
+    """
+    Return the kernel argument type used to pass a Python scalar.
+    """
+
+    if isinstance(value, (int, long, numpy.integer, numpy.bool_)):
+        return long
+    elif isinstance(value, (float, numpy.floating)):
+        return float
+    else:
+        raise TypeError("cannot pass a \"%s\" instance to a kernel" % type(value))
+
+def argument_type(argument, static, affine = False):
+    """
+    Return the kernel argument type used to pass a Python value.
+    """
+
+    from qy import StridedArrayArgument
+
+    if isinstance(argument, numpy.ndarray):
+        return StridedArrayArgument.from_numpy(argument, static = static, affine = affine or None)
+    else:
+        return scalar_type(argument)
+
+def dispatch(
+    policy           = "dynamic",
+    specialize_after = 8,
+    max_variants     = 16,
+    return_type      = None,
+    optimize         = True,
+    target           = None,
+    nogil            = False,
+    affine           = False,
+    ):
+    """
+    Build a Dispatcher around an emitter.
+    """
+
+    def decorator(emit):
+        """
+        Wrap the emitter.
+        """
+
+        return \
+            Dispatcher(
+                emit,
+                policy           = policy,
+                specialize_after = specialize_after,
+                max_variants     = max_variants,
+                return_type      = return_type,
+                optimize         = optimize,
+                target           = target,
+                nogil            = nogil,
+                affine           = affine,
+                )
+
+    return decorator
@@ -0,0 +1,921 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "Expression",
+    "lazy",
+    ]
+
+import numpy
+import qy
+import qy.llvm as llvm
+
+from qy.cache import KernelCache
+
+# fused-kernel dispatchers and their emitters, by expression structure
+fused_dispatchers = KernelCache()
+
+def storage_dtype(dtype):
+    """
+    Return the dtype with which values of a dtype are passed to kernels.
+
+    Booleans are passed as bytes; LLVM has no type matching their dtype.
+    """
+
+    if dtype == numpy.bool_:
+        return numpy.dtype(numpy.uint8)
+    else:
+        return dtype
+
+def broadcast_shapes(*shapes):
+    """
+    Return the shape to which shapes broadcast, as in NumPy.
+    """
+
+    ndim   = max(len(s) for s in shapes)
+    padded = [(1,) * (ndim - len(s)) + tuple(s) for s in shapes]
+    shape  = []
+
+    for extents in zip(*padded):
+        others = set(e for e in extents if e != 1)
+
+        if len(others) > 1:
+            raise ValueError("shapes %s cannot be broadcast together" % (shapes,))
+
+        shape.append(others.pop() if others else 1)
+
+    return tuple(shape)
+
+def convert(value, from_dtype, to_dtype):
+    """
+    Emit IR to convert a scalar or vector value between dtypes.
+    """
+
+    from qy import type_from_dtype
+
+    from qy.reductions import constant
+
+    if from_dtype == to_dtype:
+        return value
+
+    if to_dtype == numpy.bool_:
+        to_type = llvm.Type.int(1)
+    else:
+        to_type = type_from_dtype(to_dtype)
+
+    if value.type_.kind == llvm.TYPE_VECTOR:
+        to_type   = llvm.Type.vector(to_type, value.type_.count)
+        from_type = llvm.Type.vector(type_from_dtype(storage_dtype(from_dtype)), value.type_.count)
+    else:
+        from_type = type_from_dtype(storage_dtype(from_dtype))
+
+    if from_dtype == numpy.bool_:
+        return qy.select(value, constant(to_type, 1), constant(to_type, 0))
+    elif to_dtype == numpy.bool_:
+        return value != constant(from_type, 0)
+    elif from_dtype.kind == "u" and to_dtype.kind == "f":
+        return qy.Value.from_low(qy.get().builder.uitofp(value._value, to_type))
+    elif from_dtype.kind == "u" and to_dtype.kind in "iu" and to_dtype.itemsize > from_dtype.itemsize:
+        return qy.Value.from_low(qy.get().builder.zext(value._value, to_type))
+    else:
+        return value.cast_to(to_type)
+
+def floor_divide(a, b, dtype):
+    """
+    Emit integer division rounding toward negative infinity, as in NumPy.
+
+    Neither case that traps natively traps here: division by zero yields
+    zero, and division of the smallest signed integer by -1 wraps, as in
+    NumPy.
+    """
+
+    from qy.reductions import constant
+
+    zero    = constant(a.type_, 0)
+    one     = constant(a.type_, 1)
+    by_zero = b == zero
+
+    if dtype.kind == "u":
+        safe     = qy.select(by_zero, one, b)
+        quotient = qy.Value.from_low(qy.get().builder.udiv(a._value, safe._value))
+
+        return qy.select(by_zero, zero, quotient)
+
+    by_minus  = b == constant(a.type_, -1)
+    safe      = qy.select(by_zero | by_minus, one, b)
+    quotient  = qy.select(by_minus, qy.value_from_any(zero) - a, a / safe)
+    remainder = a % safe
+    inexact   = ~(remainder == zero) & ((remainder < zero) ^ (safe < zero))
+
+    return qy.select(by_zero, zero, qy.select(inexact, quotient - one, quotient))
+
+class Emission(object):
+    """
+    State of the emission of one element of a fused expression.
+    """
+
+    def __init__(self, arrays, constants):
+        """
+        Initialize.
+
+        The arrays are the rank-zero leaf arrays at the current element; if
+        their elements are vectors, so are the computed values. The constants
+        map constant identities to their kernel argument values.
+        """
+
+        self._leaves    = arrays
+        self._constants = constants
+        self._width     = 0
+        self._values    = {}
+
+        for array in arrays.values():
+            if array.element_type.kind == llvm.TYPE_VECTOR:
+                self._width = array.element_type.count
+
+    def value(self, node):
+        """
+        Emit IR to compute a node, once.
+        """
+
+        value = self._values.get(id(node))
+
+        if value is None:
+            value                  = node._emit(self)
+            self._values[id(node)] = value
+
+        return value
+
+    def leaf(self, array):
+        """
+        Emit IR to load an element of a leaf array.
+        """
+
+        return self._leaves[id(array)].data.load()
+
+    def constant(self, node):
+        """
+        Return the kernel argument value of a constant.
+        """
+
+        return self._constants[id(node)]
+
+    @property
+    def width(self):
+        """
+        The number of elements computed at once, if vectorized, or zero.
+        """
+
+        return self._width
+
+class Expression(object):
+    """
+    Lazily evaluated array expression.
+
+    Operators, log(), exp(), fusion.select(), and reductions build a graph
+    over ndarrays (see lazy()) and Python scalars. On evaluation, each
+    reduction nested inside the graph is computed first; the rest is fused
+    into one loop_all() kernel that makes a single pass over its leaf arrays,
+    without temporaries. Kernels are compiled once per graph structure and
+    leaf dtype and rank signature; scalar constants are passed to them at
+    call time. Types follow NumPy's promotion rules, and
+    integer division rounds toward negative infinity, as in NumPy; floor
+    division (//) is defined on integers only.
+    """
+
+    def __add__(self, other):
+        """
+        Build an addition.
+        """
+
+        return Apply("add", [self, other])
+
+    def __radd__(self, other):
+        """
+        Build an addition.
+        """
+
+        return Apply("add", [other, self])
+
+    def __sub__(self, other):
+        """
+        Build a subtraction.
+        """
+
+        return Apply("sub", [self, other])
+
+    def __rsub__(self, other):
+        """
+        Build a subtraction.
+        """
+
+        return Apply("sub", [other, self])
+
+    def __mul__(self, other):
+        """
+        Build a multiplication.
+        """
+
+        return Apply("mul", [self, other])
+
+    def __rmul__(self, other):
+        """
+        Build a multiplication.
+        """
+
+        return Apply("mul", [other, self])
+
+    def __div__(self, other):
+        """
+        Build a division.
+        """
+
+        return Apply("div", [self, other])
+
+    def __rdiv__(self, other):
+        """
+        Build a division.
+        """
+
+        return Apply("div", [other, self])
+
+    def __floordiv__(self, other):
+        """
+        Build a floor division.
+        """
+
+        return Apply("floordiv", [self, other])
+
+    def __rfloordiv__(self, other):
+        """
+        Build a floor division.
+        """
+
+        return Apply("floordiv", [other, self])
+
+    def __neg__(self):
+        """
+        Build a negation.
+        """
+
+        return Apply("neg", [self])
+
+    def __lt__(self, other):
+        """
+        Build a less-than comparison.
+        """
+
+        return Apply("lt", [self, other])
+
+    def __le__(self, other):
+        """
+        Build a less-than-or-equal comparison.
+        """
+
+        return Apply("le", [self, other])
+
+    def __gt__(self, other):
+        """
+        Build a greater-than comparison.
+        """
+
+        return Apply("gt", [self, other])
+
+    def __ge__(self, other):
+        """
+        Build a greater-than-or-equal comparison.
+        """
+
+        return Apply("ge", [self, other])
+
+    def log(self):
+        """
+        Build a natural logarithm.
+        """
+
+        return Apply("log", [self])
+
+    def exp(self):
+        """
+        Build an exponential.
+        """
+
+        return Apply("exp", [self])
+
+    def sum(self, axes = None, keepdims = False):
+        """
+        Build a sum along axes.
+        """
+
+        return Reduce("sum", self, axes, keepdims)
+
+    def prod(self, axes = None, keepdims = False):
+        """
+        Build a product along axes.
+        """
+
+        return Reduce("prod", self, axes, keepdims)
+
+    def min(self, axes = None, keepdims = False):
+        """
+        Build a minimum along axes.
+        """
+
+        return Reduce("min", self, axes, keepdims)
+
+    def max(self, axes = None, keepdims = False):
+        """
+        Build a maximum along axes.
+        """
+
+        return Reduce("max", self, axes, keepdims)
+
+    def argmin(self, axes = None, keepdims = False):
+        """
+        Build the flat index of the first minimum along axes.
+        """
+
+        return Reduce("argmin", self, axes, keepdims)
+
+    def argmax(self, axes = None, keepdims = False):
+        """
+        Build the flat index of the first maximum along axes.
+        """
+
+        return Reduce("argmax", self, axes, keepdims)
+
+    def evaluate(self, out = None, vector_width = None):
+        """
+        Compute this expression; return the output array.
+
+        If no output array is given, one is allocated, and an expression of
+        rank zero yields a scalar. The vector width is as for loop_all().
+        """
+
+        if out is None:
+            result = numpy.empty(self.shape, self.dtype)
+        elif out.shape != self.shape:
+            raise ValueError("output shape %s does not match expression shape %s" % (out.shape, self.shape))
+        else:
+            result = out
+
+        self._run(result, vector_width)
+
+        if out is None and result.shape == ():
+            return result[()]
+        else:
+            return result
+
+    def _materialized(self):
+        """
+        Return this expression with nested reductions replaced by their values.
+        """
+
+        return self
+
+    def _run(self, out, vector_width):
+        """
+        Run the fused kernel of this expression.
+        """
+
+        expression = self._materialized()
+        leaves     = []
+        constants  = []
+        key        = ("map", expression._key(leaves, constants), out.dtype.str, vector_width)
+        casts      = broadcast_leaves(leaves)
+
+        def emit(*arguments):
+            (arrays, values) = split_arguments(leaves, constants, arguments)
+
+            arrays = qy.StridedArrays(leaf_keys(leaves, arrays))
+
+            @arrays.loop_all(vector_width = vector_width, order = "auto", collapse = True)
+            def _(l):
+                emission = Emission(l.arrays, values)
+                value    = convert(emission.value(expression), expression.dtype, out.dtype)
+
+                store(value, out.dtype, l.arrays["out"])
+
+        run_fused(key, emit, [storage_view(a) for a in casts + [out]] + [c.value for c in constants])
+
+    @property
+    def shape(self):
+        """
+        The shape of the value of this expression.
+        """
+
+        raise NotImplementedError()
+
+    @property
+    def dtype(self):
+        """
+        The dtype of the value of this expression.
+        """
+
+        raise NotImplementedError()
+
+def broadcast_leaves(leaves):
+    """
+    Return the leaf arrays broadcast against each other.
+    """
+
+    from qy import semicast
+
+    if leaves:
+        (_, casts) = semicast(*[(a, None) for a in leaves])
+
+        return casts
+    else:
+        return []
+
+def leaf_keys(leaves, arrays):
+    """
+    Return a dictionary mapping leaf identities to kernel arrays.
+
+    Any array beyond the leaves is the output array.
+    """
+
+    keyed = dict((id(a), s) for (a, s) in zip(leaves, arrays))
+
+    if len(arrays) > len(leaves):
+        keyed["out"] = arrays[-1]
+
+    return keyed
+
+def split_arguments(leaves, constants, arguments):
+    """
+    Split fused kernel arguments into arrays and constant values.
+
+    The arrays are the leaves and the output array; the constant values are
+    returned in a dictionary keyed on constant identity.
+    """
+
+    arrays = arguments[:len(arguments) - len(constants)]
+    values = arguments[len(arrays):]
+
+    return (arrays, dict((id(c), v) for (c, v) in zip(constants, values)))
+
+def storage_view(array):
+    """
+    Return a view of an array with its storage dtype.
+    """
+
+    return array.view(storage_dtype(array.dtype))
+
+def store(value, dtype, array):
+    """
+    Emit IR to store a value to a (rank-zero) array.
+    """
+
+    if dtype == numpy.bool_:
+        value = convert(value, dtype, numpy.dtype(numpy.uint8))
+
+    value.store(array.data)
+
+def run_fused(key, emit, arrays):
+    """
+    Run a fused kernel over arrays, compiling it if necessary.
+
+    Expressions of the same structure share a dispatcher, held in a bounded
+    cache. Its variants are emitted by the emitter of the expression being
+    evaluated, so that cached kernels keep no reference to the arrays of
+    earlier expressions.
+    """
+
+    from qy import Dispatcher
+
+    entry = fused_dispatchers.get(key)
+
+    if entry is None:
+        emitters = []
+
+        def emit_current(*arguments):
+            emitters[-1](*arguments)
+
+        entry = (Dispatcher(emit_current, policy = "dynamic"), emitters)
+
+        fused_dispatchers.put(key, entry)
+
+    (dispatcher, emitters) = entry
+
+    emitters.append(emit)
+
+    try:
+        dispatcher(*arrays)
+    finally:
+        emitters.pop()
+
+class Leaf(Expression):
+    """
+    Array operand of an expression.
+    """
+
+    def __init__(self, array):
+        """
+        Initialize.
+        """
+
+        self._array = numpy.asarray(array)
+
+    def _key(self, leaves, constants):
+        """
+        Return the structure of this expression, recording leaf arrays.
+        """
+
+        for (i, leaf) in enumerate(leaves):
+            if leaf is self._array:
+                break
+        else:
+            i = len(leaves)
+
+            leaves.append(self._array)
+
+        return ("leaf", i, self._array.dtype.str)
+
+    def _emit(self, emission):
+        """
+        Emit IR to load the element.
+        """
+
+        value = emission.leaf(self._array)
+
+        if self.dtype == numpy.bool_:
+            return convert(value, storage_dtype(self.dtype), self.dtype)
+        else:
+            return value
+
+    @property
+    def shape(self):
+        """
+        The shape of the value of this expression.
+        """
+
+        return self._array.shape
+
+    @property
+    def dtype(self):
+        """
+        The dtype of the value of this expression.
+        """
+
+        return self._array.dtype
+
+    @property
+    def array(self):
+        """
+        The leaf array.
+        """
+
+        return self._array
+
+class Constant(Expression):
+    """
+    Python scalar operand of an expression.
+    """
+
+    def __init__(self, value):
+        """
+        Initialize.
+        """
+
+        self._value = value
+
+    def _key(self, leaves, constants):
+        """
+        Return the structure of this expression, recording constants.
+
+        The value is passed as a kernel argument, so only its type is part of
+        the structure.
+        """
+
+        for (i, constant) in enumerate(constants):
+            if constant is self:
+                break
+        else:
+            i = len(constants)
+
+            constants.append(self)
+
+        return ("constant", i, self.dtype.str)
+
+    def _emit(self, emission):
+        """
+        Emit IR for the constant.
+        """
+
+        from qy.dispatcher import scalar_type
+
+        if scalar_type(self._value) is float:
+            argument_dtype = numpy.dtype(numpy.float64)
+        else:
+            argument_dtype = numpy.dtype(numpy.int64)
+
+        value = convert(emission.constant(self), argument_dtype, self.dtype)
+
+        if emission.width:
+            return qy.VectorValue.splat(value, emission.width)
+        else:
+            return value
+
+    @property
+    def shape(self):
+        """
+        The shape of the value of this expression.
+        """
+
+        return ()
+
+    @property
+    def dtype(self):
+        """
+        The dtype of the value of this expression.
+        """
+
+        return numpy.asarray(self._value).dtype
+
+    @property
+    def value(self):
+        """
+        The constant value.
+        """
+
+        return self._value
+
+def as_expression(value):
+    """
+    Return an expression for an expression, ndarray, or Python scalar.
+    """
+
+    if isinstance(value, Expression):
+        return value
+    elif isinstance(value, numpy.ndarray):
+        return Leaf(value)
+    else:
+        return Constant(value)
+
+def promotion_operand(expression):
+    """
+    Return the argument describing an operand to numpy.result_type().
+
+    Constants are described by their values, so that, as in NumPy, Python
+    scalars do not widen array types.
+    """
+
+    if isinstance(expression, Constant):
+        return expression.value
+    else:
+        return expression.dtype
+
+class Apply(Expression):
+    """
+    Elementwise operation in an expression.
+    """
+
+    arithmetic  = {
+        "add" : lambda a, b: a + b,
+        "sub" : lambda a, b: a - b,
+        "mul" : lambda a, b: a * b,
+        "div" : lambda a, b: a / b,
+        "neg" : lambda a: -a,
+        }
+    comparisons = {
+        "lt" : lambda a, b: a < b,
+        "le" : lambda a, b: a <= b,
+        "gt" : lambda a, b: a > b,
+        "ge" : lambda a, b: a >= b,
+        }
+    functions   = {
+        "log" : lambda a: qy.log(a),
+        "exp" : lambda a: qy.exp(a),
+        }
+
+    def __init__(self, name, operands):
+        """
+        Initialize.
+        """
+
+        self._name     = name
+        self._operands = map(as_expression, operands)
+        self._shape    = broadcast_shapes(*[o.shape for o in self._operands])
+
+        if name == "select":
+            self._common = numpy.result_type(*map(promotion_operand, self._operands[1:]))
+            self._dtype  = self._common
+        else:
+            self._common = numpy.result_type(*map(promotion_operand, self._operands))
+
+            if name in Apply.comparisons:
+                self._dtype = numpy.dtype(numpy.bool_)
+            elif name in Apply.functions and not numpy.issubdtype(self._common, numpy.floating):
+                self._common = numpy.dtype(numpy.float64)
+                self._dtype  = self._common
+            else:
+                self._dtype = self._common
+
+        if self._common == numpy.bool_ and name not in ("select",):
+            raise TypeError("operation \"%s\" is not defined on booleans" % name)
+        elif name == "floordiv" and not numpy.issubdtype(self._common, numpy.integer):
+            raise TypeError("floor division is only defined on integers")
+
+    def _materialized(self):
+        """
+        Return this expression with nested reductions replaced by their values.
+        """
+
+        return Apply(self._name, [o._materialized() for o in self._operands])
+
+    def _key(self, leaves, constants):
+        """
+        Return the structure of this expression, recording leaf arrays and
+        constants.
+        """
+
+        return (self._name,) + tuple(o._key(leaves, constants) for o in self._operands)
+
+    def _emit(self, emission):
+        """
+        Emit IR for the operation.
+        """
+
+        values = [emission.value(o) for o in self._operands]
+
+        if self._name == "select":
+            (condition, if_true, if_false) = values
+
+            return \
+                qy.select(
+                    convert(condition, self._operands[0].dtype, numpy.dtype(numpy.bool_)),
+                    convert(if_true, self._operands[1].dtype, self._common),
+                    convert(if_false, self._operands[2].dtype, self._common),
+                    )
+        else:
+            values = [convert(v, o.dtype, self._common) for (v, o) in zip(values, self._operands)]
+
+            if self._name in ("div", "floordiv") and numpy.issubdtype(self._common, numpy.integer):
+                return floor_divide(values[0], values[1], self._common)
+            elif self._name in Apply.arithmetic:
+                return Apply.arithmetic[self._name](*values)
+            elif self._name in Apply.comparisons:
+                return Apply.comparisons[self._name](*values)
+            else:
+                return Apply.functions[self._name](*values)
+
+    @property
+    def shape(self):
+        """
+        The shape of the value of this expression.
+        """
+
+        return self._shape
+
+    @property
+    def dtype(self):
+        """
+        The dtype of the value of this expression.
+        """
+
+        return self._dtype
+
+class Reduce(Expression):
+    """
+    Reduction of an expression along axes.
+
+    Sums and products accumulate in the type NumPy would use, which widens
+    booleans and small integers; the other reductions keep the operand type.
+    """
+
+    accumulators = {
+        "sum"  : numpy.add,
+        "prod" : numpy.multiply,
+        }
+
+    def __init__(self, name, operand, axes = None, keepdims = False):
+        """
+        Initialize.
+        """
+
+        self._name     = name
+        self._operand  = as_expression(operand)
+        self._keepdims = keepdims
+
+        rank = len(self._operand.shape)
+
+        if axes is None:
+            axes = range(rank)
+        elif isinstance(axes, (int, long)):
+            axes = [axes]
+
+        self._axes = sorted(set(d % rank for d in axes))
+
+        if self._operand.dtype == numpy.bool_ and name not in Reduce.accumulators:
+            raise TypeError("reduction \"%s\" is not defined on booleans" % name)
+
+    def _materialized(self):
+        """
+        Return the value of this reduction, as a leaf.
+        """
+
+        return Leaf(self.evaluate())
+
+    def _key(self, leaves, constants):
+        """
+        Return the structure of this expression.
+
+        Reductions are materialized before any enclosing expression is fused,
+        so this method is never used.
+        """
+
+        raise NotImplementedError()
+
+    def _run(self, out, vector_width):
+        """
+        Run the fused reduction kernel of this expression.
+
+        Its operand is computed element by element as it is reduced.
+        """
+
+        operand   = self._operand._materialized()
+        leaves    = []
+        constants = []
+        key       = ("reduce", self._name, tuple(self._axes), operand._key(leaves, constants), out.dtype.str, vector_width)
+        casts     = broadcast_leaves(leaves)
+
+        if not leaves:
+            raise ValueError("cannot reduce an expression over no arrays")
+
+        if self._keepdims:
+            out = numpy.squeeze(out, axis = tuple(self._axes))
+
+        def emit(*arguments):
+            (arrays, values) = split_arguments(leaves, constants, arguments)
+
+            def value(l):
+                return convert(Emission(l.arrays, values).value(operand), operand.dtype, self.dtype)
+
+            getattr(qy, "reduce_%s" % self._name)(
+                qy.StridedArrays(leaf_keys(leaves, arrays[:-1])),
+                self._axes,
+                out          = arrays[-1],
+                value        = value,
+                type_        = storage_dtype(self.dtype),
+                vector_width = vector_width,
+                )
+
+        run_fused(key, emit, [storage_view(a) for a in casts + [out]] + [c.value for c in constants])
+
+    @property
+    def shape(self):
+        """
+        The shape of the value of this expression.
+        """
+
+        shape = self._operand.shape
+
+        if self._keepdims:
+            return tuple(1 if d in self._axes else e for (d, e) in enumerate(shape))
+        else:
+            return tuple(e for (d, e) in enumerate(shape) if d not in self._axes)
+
+    @property
+    def dtype(self):
+        """
+        The dtype of the value of this expression.
+        """
+
+        if self._name in ("argmin", "argmax"):
+            return numpy.dtype(numpy.intp)
+        elif self._name in Reduce.accumulators:
+            # as in NumPy, small integers are summed in the default integer type
+            ufunc = Reduce.accumulators[self._name]
+
+            return ufunc.reduce(numpy.zeros(1, self._operand.dtype)).dtype
+        else:
+            return self._operand.dtype
+
+def lazy(value):
+    """
+    Return a lazy expression over an ndarray or scalar.
+    """
+
+    return as_expression(value)
+
+def select(condition, if_true, if_false):
+    """
+    Build an elementwise choice between two expressions.
+    """
+
+    return Apply("select", [condition, if_true, if_false])
+
+def log(expression):
+    """
+    Build a natural logarithm.
+    """
+
+    return as_expression(expression).log()
+
+def exp(expression):
+    """
+    Build an exponential.
+    """
+
+    return as_expression(expression).exp()
@@ -0,0 +1,244 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "CompileProfile",
+    "CompileLog",
+    "compile_log",
+    ]
+
+import os
+import json
+import time
+import atexit
+import threading
+import contextlib
+
+def count_module(module):
+    """
+    Return the numbers of instructions and basic blocks in a module.
+    """
+
+    instructions = 0
+    blocks       = 0
+
+    for function in module.functions:
+        for block in function.basic_blocks:
+            instructions += len(block.instructions)
+            blocks       += 1
+
+    return (instructions, blocks)
+
+class CompileProfile(object):
+    """
+    Per-phase compilation costs of one module.
+
+    Each phase records its wall time and the size of the module, in
+    instructions and basic blocks, at the end of that phase.
+    """
+
+    def __init__(self, name = None):
+        """
+        Initialize.
+        """
+
+        self._name   = name
+        self._hash   = None
+        self._phases = []
+
+    def __repr__(self):
+        """
+        Return a string representation of this profile.
+        """
+
+        return "CompileProfile(%r, %s)" % (self._name, ", ".join("%s=%.3fms" % (p["phase"], p["seconds"] * 1e3) for p in self._phases))
+
+    def record(self, phase, seconds, module = None):
+        """
+        Record the cost of a phase.
+        """
+
+        if module is None:
+            (instructions, blocks) = (None, None)
+        else:
+            (instructions, blocks) = count_module(module)
+
+        self._phases.append({
+            "phase"        : phase,
+            "seconds"      : seconds,
+            "instructions" : instructions,
+            "blocks"       : blocks,
+            })
+
+    @contextlib.contextmanager
+    def phase(self, phase, module = None):
+        """
+        Time a phase; the module, if any, is measured on exit.
+        """
+
+        start = time.time()
+
+        yield
+
+        self.record(phase, time.time() - start, module)
+
+    def to_dict(self):
+        """
+        Return a JSON-compatible dictionary describing this profile.
+        """
+
+        return {
+            "name"    : self._name,
+            "hash"    : self._hash,
+            "seconds" : self.seconds,
+            "phases"  : [dict(p) for p in self._phases],
+            }
+
+    @property
+    def name(self):
+        """
+        The name of the profiled module, if any.
+        """
+
+        return self._name
+
+    @property
+    def hash(self):
+        """
+        The IR hash of the profiled module, if known.
+        """
+
+        return self._hash
+
+    @hash.setter
+    def hash(self, hash_):
+        """
+        Set the IR hash of the profiled module.
+        """
+
+        self._hash = hash_
+
+    @property
+    def phases(self):
+        """
+        List of phase dictionaries, in order.
+        """
+
+        return list(self._phases)
+
+    @property
+    def seconds(self):
+        """
+        The total wall time of all phases.
+        """
+
+        return sum(p["seconds"] for p in self._phases)
+
+class CompileLog(object):
+    """
+    Process-wide record of compilation profiles.
+
+    The log is disabled by default. If $QY_COMPILE_LOG names a file, the log
+    is enabled and written there as JSON when the process exits.
+    """
+
+    def __init__(self, enabled = False):
+        """
+        Initialize.
+        """
+
+        self._enabled  = enabled
+        self._profiles = []
+        self._lock     = threading.Lock()
+
+    def __len__(self):
+        """
+        Return the number of recorded profiles.
+        """
+
+        return len(self._profiles)
+
+    def add(self, profile):
+        """
+        Record a profile, if the log is enabled.
+        """
+
+        if self._enabled:
+            with self._lock:
+                self._profiles.append(profile)
+
+    def clear(self):
+        """
+        Discard every recorded profile.
+        """
+
+        with self._lock:
+            del self._profiles[:]
+
+    def enable(self, enabled = True):
+        """
+        Start (or stop) recording profiles.
+        """
+
+        self._enabled = enabled
+
+    def summary(self):
+        """
+        Return a dictionary mapping phase names to total seconds.
+        """
+
+        totals = {}
+
+        for profile in self.profiles:
+            for phase in profile.phases:
+                totals[phase["phase"]] = totals.get(phase["phase"], 0.0) + phase["seconds"]
+
+        return totals
+
+    def dump(self, out):
+        """
+        Write the log as JSON to a path or file.
+        """
+
+        document = {
+            "summary"  : self.summary(),
+            "profiles" : [p.to_dict() for p in self.profiles],
+            }
+
+        if isinstance(out, basestring):
+            with open(out, "w") as out_file:
+                json.dump(document, out_file, indent = 4)
+        else:
+            json.dump(document, out, indent = 4)
+
+    @property
+    def enabled(self):
+        """
+        Is the log recording profiles?
+        """
+
+        return self._enabled
+
+    @property
+    def profiles(self):
+        """
+        List of recorded profiles, oldest first.
+        """
+
+        with self._lock:
+            return list(self._profiles)
+
+compile_log = CompileLog()
+
+def dump_compile_log_at_exit(path):
+    """
+    Enable the compile log and write it to path when the process exits.
+    """
+
+    compile_log.enable()
+
+    atexit.register(compile_log.dump, path)
+
+if os.environ.get("QY_COMPILE_LOG"):
+    dump_compile_log_at_exit(os.environ["QY_COMPILE_LOG"])
@@ -0,0 +1,278 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "KernelArgument",
+    "Kernel",
+    "compile_kernel",
+    ]
+
+import ctypes
+import functools
+
+from qy.cache import kernel_cache
+
+class KernelArgument(object):
+    """
+    Kernel argument passed as a group of native arguments.
+    """
+
+    @property
+    def argument_types(self):
+        """
+        The types of the underlying native arguments.
+        """
+
+        raise NotImplementedError()
+
+    def from_values(self, values):
+        """
+        Build the emitter-side argument from native argument values.
+        """
+
+        raise NotImplementedError()
+
+    def to_arguments(self, value):
+        """
+        Return the native arguments corresponding to a Python value.
+        """
+
+        raise NotImplementedError()
+
+def expand_argument_types(arguments):
+    """
+    Return the native argument types for a list of kernel arguments.
+    """
+
+    types = []
+
+    for argument in arguments:
+        if isinstance(argument, KernelArgument):
+            types.extend(argument.argument_types)
+        else:
+            types.append(argument)
+
+    return types
+
+def group_argument_values(arguments, values):
+    """
+    Group native argument values into emitter-side kernel arguments.
+    """
+
+    grouped  = []
+    position = 0
+
+    for argument in arguments:
+        if isinstance(argument, KernelArgument):
+            count     = len(argument.argument_types)
+            grouped  += [argument.from_values(values[position:position + count])]
+            position += count
+        else:
+            grouped  += [values[position]]
+            position += 1
+
+    return grouped
+
+class Kernel(object):
+    """
+    Compiled module entry point, callable from Python.
+
+    The entry point is called through a ctypes function pointer built once, at
+    construction; calls never re-enter the emitter or the compiler. By
+    default, the GIL is held during calls, and Python exceptions raised by
+    emitted code propagate to the caller. A nogil kernel releases the GIL
+    while it runs, so that other Python threads may proceed; it must not call
+    into Python, and its failed assertions are recorded natively, then raised
+    as EmittedAssertionError once the call returns. Concurrent calls of one
+    nogil kernel share that record, so only a kernel that no assertion can
+    fail is safe to run on several threads at once.
+    """
+
+    def __init__(self, compiled, arguments = None, nogil = False):
+        """
+        Initialize.
+        """
+
+        if nogil:
+            function_type = ctypes.CFUNCTYPE
+        else:
+            function_type = ctypes.PYFUNCTYPE
+
+        from qy import ctype_from_type
+
+        main_type = compiled.main.type.pointee
+
+        self._compiled  = compiled
+        self._arguments = arguments
+        self._address   = compiled.engine.get_pointer_to_function(compiled.main)
+        self._nogil     = nogil
+        self._prototype = \
+            function_type(
+                ctype_from_type(main_type.return_type),
+                *map(ctype_from_type, main_type.args)
+                )
+        self._function  = self._prototype(self._address)
+        self._failed    = None
+
+        if nogil:
+            from qy.language import failed_assertion_name
+
+            for variable in compiled.module.global_variables:
+                if variable.name == failed_assertion_name:
+                    address      = compiled.engine.get_pointer_to_global(variable)
+                    self._failed = ctypes.c_char_p.from_address(address)
+
+    def __call__(self, *arguments):
+        """
+        Run the kernel.
+        """
+
+        if self._arguments is None:
+            return self._run(arguments)
+        else:
+            if len(arguments) != len(self._arguments):
+                raise TypeError(
+                    "kernel expects %i arguments but received %i" % (
+                        len(self._arguments),
+                        len(arguments),
+                        ),
+                    )
+
+            native = []
+
+            for (argument, value) in zip(self._arguments, arguments):
+                if isinstance(argument, KernelArgument):
+                    native.extend(argument.to_arguments(value))
+                else:
+                    native.append(value)
+
+            return self._run(native)
+
+    def _run(self, native):
+        """
+        Call the entry point, raising any assertion failure it recorded.
+        """
+
+        result = self._function(*native)
+
+        if self._failed is not None and self._failed.value is not None:
+            from qy import EmittedAssertionError
+
+            message = self._failed.value
+
+            self._failed.value = None
+
+            raise EmittedAssertionError(message, [])
+
+        return result
+
+    @property
+    def nogil(self):
+        """
+        Is the GIL released during calls?
+        """
+
+        return self._nogil
+
+    @property
+    def compiled(self):
+        """
+        The underlying compiled module.
+        """
+
+        return self._compiled
+
+    @property
+    def address(self):
+        """
+        The native address of the entry point.
+        """
+
+        return self._address
+
+    @property
+    def prototype(self):
+        """
+        The ctypes prototype of the entry point.
+        """
+
+        return self._prototype
+
+    @property
+    def target(self):
+        """
+        The code generation target, or None if chosen by LLVM.
+        """
+
+        return self._compiled.target
+
+    @property
+    def return_type(self):
+        """
+        The LLVM return type of the entry point.
+        """
+
+        return self._compiled.main.type.pointee.return_type
+
+    @property
+    def argument_types(self):
+        """
+        The LLVM argument types of the entry point.
+        """
+
+        return self._compiled.main.type.pointee.args
+
+def compile_kernel(
+    return_type    = None,
+    argument_types = (),
+    optimize       = True,
+    cache          = kernel_cache,
+    key            = None,
+    disk_cache     = None,
+    target         = None,
+    nogil          = False,
+    ):
+    """
+    Emit and compile a kernel, without running it.
+
+    The decorated emitter receives the kernel arguments as values and may
+    return a value with qy.return_(); the result is a Kernel. Argument types
+    may include KernelArgument instances, such as StridedArrayArgument, which
+    the emitter receives in their emitter-side form and the caller passes as
+    Python objects. If nogil, the kernel releases the GIL while it runs; see
+    Kernel. See compile_cached() for the remaining arguments.
+    """
+
+    from qy import compile_cached
+
+    argument_types = list(argument_types)
+
+    def decorator(emit):
+        """
+        Build and compile the kernel module.
+        """
+
+        @functools.wraps(emit)
+        def emit_grouped(*values):
+            emit(*group_argument_values(argument_types, values))
+
+        compiled = \
+            compile_cached(
+                emit_grouped,
+                optimize       = optimize,
+                cache          = cache,
+                key            = key,
+                disk_cache     = disk_cache,
+                return_type    = return_type,
+                argument_types = expand_argument_types(argument_types),
+                target         = target,
+                nogil          = nogil,
+                )
+
+        if any(isinstance(a, KernelArgument) for a in argument_types):
+            return Kernel(compiled, argument_types, nogil)
+        else:
+            return Kernel(compiled, None, nogil)
+
+    return decorator
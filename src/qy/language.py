@@ -19,6 +19,9 @@ import qy.llvm as llvm
 object_type     = llvm.Type.struct([])
 object_ptr_type = llvm.Type.pointer(object_type)
 
+# the global in which code running without the GIL records a failed assertion
+failed_assertion_name = "qy_failed_assertion"
+
 class EmittedAssertionError(AssertionError):
     """
     An assertion was tripped in generated code.
@@ -76,18 +79,32 @@ class Qy(object):
 
     _language_stack = []
 
-    def __init__(self, module = None, test_for_nan = False):
+    def __init__(self, module = None, test_for_nan = False, return_type = None, argument_types = (), nogil = False, target = None):
         """
         Initialize.
+
+        The return and argument types describe the signature of the module
+        entry point; user code is emitted into a body that receives its
+        arguments. If nogil, the module will run without the GIL: calls into
+        Python are refused, and assertions fail through a native path (see
+        assert_()). The target is the qy.Target the module will be compiled
+        for, or None for the host.
         """
 
         # members
         if module is None:
             module = llvm.Module.new("qy")
 
+        if return_type is None:
+            return_type = llvm.Type.void()
+
         self._module        = module
         self._test_for_nan  = test_for_nan
+        self._nogil         = nogil
+        self._target        = target
         self._literals      = {}
+        self._id_counts     = {}
+        self._parallel      = []
         self._builder_stack = []
         self._break_stack   = []
 
@@ -96,10 +113,10 @@ class Qy(object):
 
         with self.active():
             # add a main
-            main_body = qy.Function.new_named("main_body")
+            main_body = qy.Function.new_named("main_body", return_type, argument_types)
 
-            @qy.Function.define(internal = False)
-            def main():
+            @qy.Function.define(return_type, argument_types, internal = False)
+            def main(*arguments):
                 """
                 The true entry point.
                 """
@@ -117,12 +134,27 @@ class Qy(object):
                 context.linkage     = llvm.LINKAGE_INTERNAL
                 context.initializer = llvm.Constant.null(context_type)
 
-                self.if_(setjmp(context) == 0)(main_body)
-                self.return_()
+                body_type = main_body.type_.pointee
+
+                if body_type.return_type.kind == llvm.TYPE_VOID:
+                    @self.if_(setjmp(context) == 0)
+                    def _():
+                        main_body(*arguments)
+
+                    self.return_()
+                else:
+                    @self.if_(setjmp(context) == 0)
+                    def _():
+                        self.return_(main_body(*arguments))
+
+                    # a Python exception is pending; the caller will notice it
+                    self.return_(llvm.Constant.null(body_type.return_type))
 
         # prepare for user code
         body_entry = main_body._value.append_basic_block("entry")
 
+        self._main_body = main_body
+
         self._builder_stack.append(llvm.Builder.new(body_entry))
 
     def value_from_any(self, value):
@@ -134,6 +166,20 @@ class Qy(object):
 
         return Value.from_any(value)
 
+    def unique_id(self, kind):
+        """
+        Return a number not yet used for this kind of name in this module.
+
+        Numbering restarts in every module, so that equivalent emission yields
+        identical IR, as the IR-hash kernel cache requires.
+        """
+
+        count = self._id_counts.get(kind, 0)
+
+        self._id_counts[kind] = count + 1
+
+        return count
+
     def type_from_any(self, some_type):
         """
         Return an LLVM type from some kind of type.
@@ -269,14 +315,57 @@ class Qy(object):
 
         return decorator
 
-    def for_(self, count):
+    def for_(
+        self,
+        stop,
+        start            = 0,
+        step             = 1,
+        width            = None,
+        vectorize_width  = None,
+        unroll_count     = None,
+        interleave_count = None,
+        ):
         """
-        Emit a simple for-style loop.
+        Emit a for-style loop over range(start, stop, step).
+
+        The bounds may be Python integers or emitted values; the step must be a
+        nonzero Python integer. The index is an integer of the given width; by
+        default, 32 bits unless a bound requires more. Loop hints, if given,
+        are attached to the loop as llvm.loop metadata for the vectorizer and
+        unroller.
         """
 
-        index_type = llvm.Type.int(32)
+        if not isinstance(step, (int, long)) or step == 0:
+            raise ValueError("loop step must be a nonzero integer")
+
+        if width is None:
+            width = 32
+
+            for bound in [start, stop]:
+                if isinstance(bound, (int, long)):
+                    if not -2**31 <= bound < 2**31:
+                        width = 64
+                else:
+                    bound_type = self.value_from_any(bound).type_
+
+                    if bound_type.kind == llvm.TYPE_INTEGER:
+                        width = max(width, bound_type.width)
+
+        index_type = llvm.Type.int(width)
+
+        start = self.value_from_any(start).cast_to(index_type)
+        stop  = self.value_from_any(stop).cast_to(index_type)
 
-        count = self.value_from_any(count)
+        if step > 0:
+            continue_predicate = llvm.ICMP_SLT
+        else:
+            continue_predicate = llvm.ICMP_SGT
+
+        hints = {
+            "vectorize.width"  : vectorize_width,
+            "unroll.count"     : unroll_count,
+            "interleave.count" : interleave_count,
+            }
 
         def decorator(emit_body):
             """
@@ -285,7 +374,7 @@ class Qy(object):
 
             # prepare the loop structure
             builder  = self.builder
-            start    = self.basic_block
+            entry    = self.basic_block
             check    = self.function.append_basic_block("for_loop_check")
             flesh    = self.function.append_basic_block("for_loop_flesh")
             leave    = self.function.append_basic_block("for_loop_leave")
@@ -296,13 +385,13 @@ class Qy(object):
 
             this_index = builder.phi(index_type, "for_loop_index")
 
-            this_index.add_incoming(llvm.Constant.int(index_type, 0), start)
+            this_index.add_incoming(start.low, entry)
 
             builder.cbranch(
                 builder.icmp(
-                    llvm.ICMP_UGT,
-                    count.low,
+                    continue_predicate,
                     this_index,
+                    stop.low,
                     ),
                 flesh,
                 leave,
@@ -320,17 +409,70 @@ class Qy(object):
             self._break_stack.pop()
 
             this_index.add_incoming(
-                builder.add(this_index, llvm.Constant.int(index_type, 1)),
+                builder.add(this_index, llvm.Constant.int(index_type, step)),
                 builder.basic_block,
                 )
 
-            builder.branch(check)
+            latch = builder.branch(check)
+
+            self._add_loop_hints(latch, hints)
 
             # wrap up the loop
             builder.position_at_end(leave)
 
         return decorator
 
+    def _add_loop_hints(self, latch, hints):
+        """
+        Attach llvm.loop metadata to the branch closing a loop.
+        """
+
+        # a loop identifier refers to itself, which the wrapped metadata API
+        # cannot express; build it through llvmpy's binding of the C++ API
+        from llvmpy import api
+
+        context  = api.llvm.getGlobalContext()
+        int_type = api.llvm.Type.getInt32Ty(context)
+        operands = []
+
+        for (name, value) in sorted(hints.items()):
+            if value is not None:
+                operands.append(
+                    api.llvm.MDNode.get(
+                        context,
+                        [
+                            api.llvm.MDString.get(context, "llvm.loop." + name),
+                            api.llvm.ConstantInt.get(int_type, value, False),
+                            ],
+                        ),
+                    )
+
+        if operands:
+            # start from a placeholder unique in the module, so that the node is
+            # distinct from those of other loops, then point it at itself
+            placeholder = api.llvm.MDString.get(context, "qy.loop.%i" % self.unique_id("loop"))
+            loop_id     = api.llvm.MDNode.get(context, [placeholder] + operands)
+
+            loop_id.replaceOperandWith(0, loop_id)
+
+            latch.set_metadata("llvm.loop", llvm.MetaData(loop_id))
+
+    def parallel_for(self, stop, start = 0, arguments = (), schedule = "static", chunk = None, threads = None):
+        """
+        Emit a for-style loop whose iterations run on native threads.
+
+        The body is emitted into a separate function, and receives the loop
+        index followed by the given argument values; it must not use other
+        values emitted outside it, nor call into Python. The iteration space
+        is divided into chunks, handed out round-robin ("static") or on demand
+        ("dynamic"), among the given number of threads (by default,
+        $QY_NUM_THREADS or the number of CPUs).
+        """
+
+        from qy.parallel import emit_parallel_for
+
+        return emit_parallel_for(stop, start, arguments, schedule, chunk, threads)
+
     def select(self, boolean, if_true, if_false):
         """
         Conditionally return one of two values.
@@ -363,12 +505,23 @@ class Qy(object):
 
         return emit_random_int(self, upper, width)
 
+    def _math_type(self, value):
+        """
+        Return the operand type of a math intrinsic applied to a value.
+        """
+
+        if value.type_.kind in (llvm.TYPE_VECTOR, llvm.TYPE_FLOAT):
+            return value.type_
+        else:
+            return float
+
     def log(self, value):
         """
         Emit a natural log computation.
         """
 
-        log    = qy.Function.intrinsic(llvm.INTR_LOG, [float])
+        value  = self.value_from_any(value)
+        log    = qy.Function.intrinsic(llvm.INTR_LOG, [self._math_type(value)])
         result = log(value)
 
         if self._test_for_nan:
@@ -398,7 +551,8 @@ class Qy(object):
         Emit a natural exponentiation.
         """
 
-        exp    = qy.Function.intrinsic(llvm.INTR_EXP, [float])
+        value  = self.value_from_any(value)
+        exp    = qy.Function.intrinsic(llvm.INTR_EXP, [self._math_type(value)])
         result = exp(value)
 
         if self._test_for_nan:
@@ -413,6 +567,8 @@ class Qy(object):
         Emit a call to a Python callable.
         """
 
+        self._refuse_python()
+
         def decorator(callable_):
             """
             Emit a call to an arbitrary Python object.
@@ -436,6 +592,8 @@ class Qy(object):
         Import a Python module.
         """
 
+        self._refuse_python()
+
         object_ptr_type = self.module.get_type_named("PyObjectPtr")
         import_         = qy.Function.named("PyImport_ImportModule", object_ptr_type, [llvm.Type.pointer(llvm.Type.int(8))])
 
@@ -443,6 +601,16 @@ class Qy(object):
 
         return Object(import_(self.string_literal(name))._value)
 
+    def _refuse_python(self):
+        """
+        Raise TypeError if code emitted here may not call into Python.
+        """
+
+        if self._nogil:
+            raise TypeError("code emitted without the GIL cannot call into Python")
+        elif self._parallel:
+            raise TypeError("code emitted in a parallel body cannot call into Python")
+
     @contextlib.contextmanager
     def py_scope(self):
         """
@@ -599,6 +767,14 @@ class Qy(object):
     def assert_(self, boolean, message = "false assertion", *arguments):
         """
         Assert a fact; bails out of the module if false.
+
+        Without the GIL, the failure is recorded natively instead, in the
+        module global named by failed_assertion_name, which holds the message
+        without its arguments; the caller raises the error (see Kernel).
+
+        In a parallel body, the failure is recorded for the calling thread,
+        which asserts it after the other threads are joined; the failing
+        thread leaves its chunk. See parallel_body().
         """
 
         from traceback import extract_stack
@@ -606,6 +782,15 @@ class Qy(object):
         boolean        = self.value_from_any(boolean).cast_to(llvm.Type.int(1))
         emission_stack = extract_stack()[:-1]
 
+        if self._parallel:
+            self._assert_in_parallel(boolean, message)
+
+            return
+        elif self._nogil:
+            self._assert_natively(boolean, message)
+
+            return
+
         @self.if_(~boolean)
         def _():
             # XXX we can do this more simply (avoid the callable argument mangling, etc)
@@ -613,6 +798,78 @@ class Qy(object):
             def _(*pythonized):
                 raise EmittedAssertionError(message % pythonized, emission_stack)
 
+    def _assert_in_parallel(self, boolean, message):
+        """
+        Emit an assertion that records its failure for the calling thread.
+        """
+
+        (function, failed, messages) = self._parallel[-1]
+
+        messages.append(message)
+
+        index_type = failed.type.pointee
+        code       = len(messages)
+
+        @self.if_(~boolean)
+        def _():
+            # the first failure wins
+            self.builder.atomic_cmpxchg(
+                failed,
+                llvm.Constant.int(index_type, 0),
+                llvm.Constant.int(index_type, code),
+                "monotonic",
+                )
+
+            if self.function.name == function:
+                self.return_()
+
+    @contextlib.contextmanager
+    def parallel_body(self, failed, messages):
+        """
+        Emit the body of a function run on threads other than the caller's.
+
+        Within, calls into Python are refused, and a failed assertion stores
+        its position in messages, counting from one, to the integer global
+        failed, then returns from the body function (if the assertion is
+        emitted directly in it). The caller checks failed once the threads
+        are joined.
+        """
+
+        self._parallel.append((self.function.name, failed, messages))
+
+        try:
+            yield
+        finally:
+            self._parallel.pop()
+
+    def _assert_natively(self, boolean, message):
+        """
+        Emit an assertion that fails without calling into Python.
+        """
+
+        bytes_type = llvm.Type.pointer(llvm.Type.int(8))
+        failed     = None
+
+        for variable in self._module.global_variables:
+            if variable.name == failed_assertion_name:
+                failed = variable
+
+        if failed is None:
+            failed = llvm.GlobalVariable.new(self._module, bytes_type, failed_assertion_name)
+
+            failed.initializer = llvm.Constant.null(bytes_type)
+
+        @self.if_(~boolean)
+        def _():
+            longjmp = qy.Function.named("longjmp", llvm.Type.void(), [bytes_type, ctypes.c_int])
+            context = self.module.get_global_variable_named("main_context")
+
+            longjmp._value.add_attribute(llvm.ATTR_NO_RETURN)
+
+            self.string_literal(message).gep(0, 0).store(qy.Value.from_low(failed))
+
+            longjmp(context, 1)
+
     def return_(self, value = None):
         """
         Emit a return statement.
@@ -662,6 +919,14 @@ class Qy(object):
 
         return self.module.get_function_named("main")
 
+    @property
+    def arguments(self):
+        """
+        Return the arguments of the module entry point, as seen by user code.
+        """
+
+        return self._main_body.argument_values
+
     @property
     def builder(self):
         """
@@ -704,6 +969,22 @@ class Qy(object):
             self.basic_block.instructions                       \
             and self.basic_block.instructions[-1].is_terminator
 
+    @property
+    def nogil(self):
+        """
+        Is the module emitted to run without the GIL?
+        """
+
+        return self._nogil
+
+    @property
+    def target(self):
+        """
+        The target the module will be compiled for; None for the host.
+        """
+
+        return self._target
+
     @property
     def test_for_nan(self):
         """
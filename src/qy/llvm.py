@@ -4,5 +4,6 @@
 
 from __future__ import absolute_import
 
-from llvm.core import *
-
+from llvm.core   import *
+from llvm.ee     import *
+from llvm.passes import *
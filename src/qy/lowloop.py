@@ -7,9 +7,40 @@ import numpy
 import qy
 import qy.llvm as llvm
 
+from qy.kernel import KernelArgument
+
+def is_static(value):
+    """
+    Is this extent or stride a Python integer, rather than an emitted value?
+    """
+
+    return isinstance(value, (int, long))
+
+def tile_cache_bytes():
+    """
+    Return the cache size targeted by automatic tiling, in bytes.
+
+    This is the first-level data cache size, where the platform reports it.
+    """
+
+    import os
+
+    try:
+        size = os.sysconf("SC_LEVEL1_DCACHE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        size = None
+
+    if size > 0:
+        return size
+    else:
+        return 32 * 2**10
+
 def semicast(*arrays):
     """
     Broadcast compatible ndarray shape prefixes.
+
+    The results are views; strides of either sign, and overlapping strides,
+    are kept as they are.
     """
 
     # establish the final prefix shape
@@ -59,9 +90,63 @@ class StridedArrays(object):
 
         return StridedArrays((k, v.at(*indices)) for (k, v) in self._arrays.items())
 
-    def loop_all(self, axes = None):
+    def as_vectors(self, width):
+        """
+        Reinterpret rank-zero arrays as vectors of contiguous elements.
+        """
+
+        return StridedArrays((k, v.as_vector(width)) for (k, v) in self._arrays.items())
+
+    def loop_all(
+        self,
+        axes         = None,
+        vector_width = None,
+        parallel     = False,
+        schedule     = "static",
+        chunk        = None,
+        threads      = None,
+        order        = None,
+        collapse     = False,
+        tile         = None,
+        ):
         """
         Iterate over strided arrays.
+
+        Extents known only at run time are checked for compatibility by an
+        emitted assertion.
+
+        Loops are nested in the given order of axes, outermost first. By
+        default (None), axis order is kept, so the last axis is innermost. If
+        order is "auto", it is chosen by loop_order() so that the innermost
+        loop walks the smallest strides; use it only when the body does not
+        depend on the order in which elements are visited.
+
+        If collapse is set (it is not by default), runs of successive loops
+        over which every array is jointly contiguous are merged into one flat
+        loop; see loop_groups(). Elements are visited in the same order either
+        way, but the body is emitted against re-viewed arrays.
+
+        If tile is given, the innermost loops are blocked: outer loops step
+        over tiles, and inner loops over the elements of one tile. The tile is
+        a size for each of the innermost loops (a single size applies to the
+        two innermost), or "auto", to fit a tile of every array in the
+        first-level cache. Sizes are positive Python integers, since they are
+        loop steps. Loops no longer than their tile are not blocked.
+
+        If a vector width is given (or "auto", to choose one for the target of
+        the module, by default the host CPU; see Qy), and every array is
+        contiguous along the innermost loop axis, that axis is processed in vectors: the body receives arrays of vector elements,
+        whose loads yield VectorValue instances, followed by a scalar epilogue
+        for the remaining elements. The body is then emitted more than once,
+        and should be written to accept either kind of value. Contiguity of
+        strides known only at run time is checked by an emitted branch to a
+        scalar loop.
+
+        If parallel, the outermost loop is divided among native threads;
+        see qy.parallel_for() for the schedule, chunk, and threads arguments.
+        The body is then emitted into a separate function, and must not use
+        values emitted outside it (other than through the arrays), nor call
+        into Python.
         """
 
         # argument sanity
@@ -72,33 +157,363 @@ class StridedArrays(object):
                 if axes is None:
                     axes = len(array.shape)
 
-                shape = array.shape[:axes]
-            elif array.shape[:axes] != shape:
-                raise ValueError("incompatible array shape")
+                shape = list(array.shape[:axes])
+            else:
+                other = list(array.shape[:axes])
+
+                if len(other) != len(shape):
+                    raise ValueError("incompatible array shape")
+
+                for (d, (e, f)) in enumerate(zip(shape, other)):
+                    if is_static(e) and is_static(f):
+                        if e != f:
+                            raise ValueError("incompatible array shape")
+                    else:
+                        qy.assert_(qy.value_from_any(e) == f, "incompatible array shape")
+
+                        if is_static(f):
+                            shape = shape[:d] + [f] + shape[d + 1:]
+
+        order  = self.loop_order(axes, order)
+        arrays = self
+
+        if collapse:
+            groups = self._loop_groups(shape, order)
+
+            if len(groups) < len(order):
+                (arrays, shape) = self._collapsed(shape, groups)
+                order           = range(len(groups))
 
         def decorator(emit_inner):
             """
             Emit IR for a particular inner loop body.
             """
 
-            def emit_for_axis(d, indices):
-                """
-                Build one level of the array loop.
-                """
-
-                if d == axes:
-                    emit_inner(self.at_all(*indices))
-                elif shape[d] > 1:
-                    @qy.for_(shape[d])
-                    def _(index):
-                        emit_for_axis(d + 1, indices + [index])
-                else:
-                    emit_for_axis(d + 1, indices + [0])
+            if parallel and axes > 0:
+                from qy.parallel import emit_parallel_ranges
+
+                values = arrays.to_values() + [e for e in shape if not is_static(e)]
+
+                @emit_parallel_ranges(shape[order[0]], 0, values, schedule, chunk, threads)
+                def _(lower, upper, *values):
+                    (inner_arrays, values) = StridedArrays.from_values(arrays, values)
 
-            emit_for_axis(0, [])
+                    inner_shape = [e if is_static(e) else values.pop(0) for e in shape]
+
+                    inner_arrays._emit_loops(emit_inner, inner_shape, order, vector_width, tile, (lower, upper))
+            else:
+                arrays._emit_loops(emit_inner, shape, order, vector_width, tile)
 
         return decorator
 
+    def loop_groups(self, axes = None, order = None):
+        """
+        Return the runs of axes that loop_all() collapses into single loops,
+        given its order argument.
+
+        Successive loop axes a and b (b inner) are merged when, for every
+        array, both extents and strides are static and the stride along a is
+        the stride along b times the extent along b. Runs are listed in loop
+        order, outermost first.
+        """
+
+        shape = min((a.shape for a in self._arrays.values()), key = len)
+
+        if axes is not None:
+            shape = shape[:axes]
+
+        return self._loop_groups(list(shape), self.loop_order(len(shape), order))
+
+    def _loop_groups(self, shape, order):
+        """
+        Group loop axes into jointly contiguous runs.
+        """
+
+        groups = []
+
+        for b in order:
+            if groups:
+                a         = groups[-1][-1]
+                mergeable = is_static(shape[a]) and is_static(shape[b])
+
+                for array in self._arrays.values():
+                    (stride_a, stride_b) = (array.strides[a], array.strides[b])
+
+                    if not (mergeable and is_static(stride_a) and is_static(stride_b)):
+                        mergeable = False
+                    elif stride_a != stride_b * shape[b]:
+                        mergeable = False
+
+                if mergeable:
+                    groups[-1].append(b)
+
+                    continue
+
+            groups.append([b])
+
+        return groups
+
+    def _collapsed(self, shape, groups):
+        """
+        Return views of these arrays with each run of axes merged into one.
+
+        The merged axes appear in loop order; any axes beyond them are kept.
+        """
+
+        axes      = len(shape)
+        new_shape = [int(numpy.product([shape[d] for d in g])) if len(g) > 1 else shape[g[0]] for g in groups]
+        arrays    = {}
+
+        for (k, array) in self._arrays.items():
+            arrays[k] = \
+                array.view(
+                    new_shape + list(array.shape[axes:]),
+                    [array.strides[g[-1]] for g in groups] + list(array.strides[axes:]),
+                    )
+
+        return (StridedArrays(arrays), new_shape)
+
+    def loop_order(self, axes = None, order = None):
+        """
+        Return the order in which loop_all() nests loops, outermost first,
+        given its order argument.
+
+        Without an order, axis order is kept. In the automatic order, axes are sorted by the total absolute stride of
+        the arrays along them, largest outermost, so that the innermost loop
+        walks the smallest strides; ties keep axis order. If any stride along
+        the loop axes is known only at run time, axis order is kept.
+        """
+
+        if axes is None:
+            axes = min(len(a.shape) for a in self._arrays.values())
+
+        if order is None:
+            return range(axes)
+        elif order == "auto":
+            costs = []
+
+            for d in xrange(axes):
+                strides = [a.strides[d] for a in self._arrays.values()]
+
+                if not all(map(is_static, strides)):
+                    return range(axes)
+
+                costs.append(sum(abs(s) for s in strides))
+
+            return sorted(xrange(axes), key = lambda d: -costs[d])
+        else:
+            order = list(order)
+
+            if sorted(order) != range(axes):
+                raise ValueError("loop order must be a permutation of the loop axes")
+
+            return order
+
+    def _emit_loops(self, emit_inner, shape, order, vector_width, tile = None, bounds = None):
+        """
+        Emit the loop nest of loop_all(), optionally over part of the
+        outermost loop.
+        """
+
+        axes                       = len(order)
+        (vector_width, contiguous) = self._vectorization(order, vector_width)
+        tiles                      = self._tile_sizes(shape, order, tile)
+
+        def level_bounds(l):
+            """
+            Return the full bounds of one loop level.
+            """
+
+            if l == 0 and bounds is not None:
+                return bounds
+            else:
+                return (0, shape[order[l]])
+
+        def offset(index, lower):
+            """
+            Offset an index by a lower bound.
+            """
+
+            if is_static(lower) and lower == 0:
+                return index
+            else:
+                return index + lower
+
+        def at_all(indices):
+            """
+            Emit IR to return subarrays at indices given in loop order.
+            """
+
+            return self.at_all(*[indices[order.index(d)] for d in xrange(axes)])
+
+        def emit_innermost(indices, width, lower, upper):
+            """
+            Build the innermost loop, in vectors and then in scalars.
+            """
+
+            if is_static(lower) and is_static(upper):
+                count  = upper - lower
+                blocks = count // width
+                rest   = count - blocks * width
+            else:
+                count  = qy.value_from_any(upper) - lower
+                blocks = count / width
+                rest   = count - blocks * width
+
+            if not is_static(blocks) or blocks > 0:
+                @qy.for_(blocks)
+                def _(block):
+                    emit_inner(at_all(indices + [offset(block * width, lower)]).as_vectors(width))
+
+            if not is_static(rest) or rest > 0:
+                @qy.for_(rest)
+                def _(index):
+                    emit_inner(at_all(indices + [offset(index, offset(blocks * width, lower))]))
+
+        def emit_for_level(l, indices, width, tile_bounds):
+            """
+            Build one level of the array loop.
+            """
+
+            if l < axes:
+                if tile_bounds[l] is None:
+                    (lower, upper) = level_bounds(l)
+                else:
+                    (lower, upper) = tile_bounds[l]
+
+            if l == axes:
+                emit_inner(at_all(indices))
+            elif l == axes - 1 and width > 1:
+                emit_innermost(indices, width, lower, upper)
+            elif not is_static(upper) or upper > 1:
+                @qy.for_(upper, start = lower)
+                def _(index):
+                    emit_for_level(l + 1, indices + [index], width, tile_bounds)
+            else:
+                emit_for_level(l + 1, indices + [0], width, tile_bounds)
+
+        def emit_tiles(l, tile_bounds, width):
+            """
+            Build the loops over tiles, then the loops within a tile.
+            """
+
+            if l == axes:
+                emit_for_level(0, [], width, tile_bounds)
+            elif tiles[l] is None:
+                emit_tiles(l + 1, tile_bounds + [None], width)
+            else:
+                (lower, upper) = level_bounds(l)
+
+                @qy.for_(upper, start = lower, step = tiles[l])
+                def _(start):
+                    stop  = start + tiles[l]
+                    limit = qy.value_from_any(upper).cast_to(start.type_)
+
+                    emit_tiles(l + 1, tile_bounds + [(start, qy.select(stop < limit, stop, limit))], width)
+
+        if vector_width > 1 and contiguous is not True:
+            # choose between vector and scalar loops at run time
+            @qy.if_else(contiguous)
+            def _(then):
+                emit_tiles(0, [], vector_width if then else 1)
+        else:
+            emit_tiles(0, [], vector_width)
+
+    def _tile_sizes(self, shape, order, tile):
+        """
+        Return the tile size of each loop level, or None if untiled.
+        """
+
+        from qy import size_of_type
+
+        axes = len(order)
+
+        if tile is None or axes < 2:
+            return [None] * axes
+        elif tile == "auto":
+            # fit one tile of every array in the first-level cache
+            element_bytes = sum(size_of_type(a.element_type) for a in self._arrays.values())
+            size          = 8
+
+            while (size * 2)**2 * element_bytes <= tile_cache_bytes():
+                size *= 2
+
+            tile = [size, size]
+        elif isinstance(tile, (list, tuple)):
+            tile = list(tile)
+        else:
+            tile = [tile, tile]
+
+        # loop steps must be known at emission time
+        for size in tile:
+            if not is_static(size) or isinstance(size, bool) or size < 1:
+                raise ValueError("tile sizes must be positive Python integers, not %r" % (size,))
+
+        if len(tile) > axes:
+            raise ValueError("more tile sizes than loop axes")
+
+        tiles = [None] * (axes - len(tile)) + tile
+
+        for (l, size) in enumerate(tiles):
+            if size is not None and is_static(shape[order[l]]) and shape[order[l]] <= size:
+                tiles[l] = None
+
+        return tiles
+
+    def to_values(self):
+        """
+        Return the emitted values that describe these arrays.
+        """
+
+        return sum((self._arrays[k].to_values() for k in sorted(self._arrays)), [])
+
+    def _vectorization(self, order, vector_width):
+        """
+        Return the vector width to use, and the contiguity condition along the
+        innermost loop.
+
+        The condition is True, or an emitted boolean if it depends on strides
+        known only at run time.
+        """
+
+        from qy import (
+            Target,
+            size_of_type,
+            )
+
+        scalar_kinds = (llvm.TYPE_INTEGER, llvm.TYPE_FLOAT, llvm.TYPE_DOUBLE)
+
+        if vector_width is None or not order:
+            return (1, True)
+
+        for array in self._arrays.values():
+            if len(array.shape) != len(order) or array.element_type.kind not in scalar_kinds:
+                return (1, True)
+
+        if vector_width == "auto":
+            target = qy.get().target
+
+            if target is None:
+                target = Target.host()
+
+            vector_width = min(target.vector_width(a.element_type) for a in self._arrays.values())
+
+        contiguous = True
+
+        for array in self._arrays.values():
+            stride = array.strides[order[-1]]
+            size   = size_of_type(array.element_type)
+
+            if is_static(stride):
+                if stride != size:
+                    return (1, True)
+            elif contiguous is True:
+                contiguous = stride == size
+            else:
+                contiguous = contiguous & (stride == size)
+
+        return (vector_width, contiguous)
+
     @property
     def arrays(self):
         """
@@ -108,15 +523,54 @@ class StridedArrays(object):
         return self._arrays
 
     @staticmethod
-    def from_numpy(ndarrays):
+    def from_numpy(ndarrays, affine = None):
         """
         Build from a dictionary of ndarrays.
+
+        See StridedArray.from_raw() for the choice of layout.
         """
 
-        pairs = ((k, StridedArray.from_numpy(v)) for (k, v) in ndarrays.items())
+        pairs = ((k, StridedArray.from_numpy(v, affine)) for (k, v) in ndarrays.items())
 
         return StridedArrays(dict(pairs))
 
+    @staticmethod
+    def from_values(like, values):
+        """
+        Rebuild arrays like others from the values returned by to_values().
+
+        Returns the arrays and the unused values.
+        """
+
+        values = list(values)
+        arrays = {}
+
+        for k in sorted(like.arrays):
+            (arrays[k], values) = StridedArray.from_values(like.arrays[k], values)
+
+        return (StridedArrays(arrays), values)
+
+def fits_nested_layout(element_type, shape, strides):
+    """
+    Can a strided array's structure be represented by get_strided_type()?
+
+    It cannot if any nonzero stride is negative, or smaller than the extent
+    of the axes inside it, as in reversed views and overlapping windows.
+    """
+
+    from qy import size_of_type
+
+    inner_size = size_of_type(element_type)
+
+    for (d, s) in reversed(zip(shape, strides)):
+        if s != 0:
+            if s < inner_size:
+                return False
+            else:
+                inner_size = d * s
+
+    return True
+
 def get_strided_type(element_type, shape, strides):
     """
     Build an LLVM type to represent a strided array's structure.
@@ -128,7 +582,9 @@ def get_strided_type(element_type, shape, strides):
         if strides[0] == 0:
             return (inner_type, inner_size)
         else:
-            if strides[0] < inner_size:
+            if strides[0] < 0:
+                raise ValueError("negative array stride")
+            elif strides[0] < inner_size:
                 raise ValueError("array stride too small")
             else:
                 return (
@@ -146,20 +602,105 @@ def get_strided_type(element_type, shape, strides):
 
         return (element_type, size_of_type(element_type))
 
+def offset_pointer(pointer, offset):
+    """
+    Emit IR to offset a pointer by some number of bytes.
+    """
+
+    if is_static(offset) and offset == 0:
+        return pointer
+    else:
+        bytes_ = pointer.cast_to(llvm.Type.pointer(llvm.Type.int(8))).gep(offset)
+
+        return bytes_.cast_to(pointer.type_)
+
+def clamp(value, lower, upper):
+    """
+    Emit IR to clamp an integer value to an interval.
+    """
+
+    lower = qy.value_from_any(lower).cast_to(value.type_)
+    upper = qy.value_from_any(upper).cast_to(value.type_)
+    value = qy.select(value < lower, lower, value)
+
+    return qy.select(value > upper, upper, value)
+
+def slice_bounds(key, extent):
+    """
+    Return the start, length, and step of a slice along an axis.
+
+    Bounds follow Python conventions: they may be omitted or negative, and
+    are clipped to the axis. If the bounds, step, and extent are Python
+    integers, so are the results; otherwise they are emitted. A step that is
+    an emitted value is assumed to be positive.
+    """
+
+    step = 1 if key.step is None else key.step
+
+    if is_static(step) and step == 0:
+        raise ValueError("slice step cannot be zero")
+
+    if all(v is None or is_static(v) for v in [key.start, key.stop, extent]) and is_static(step):
+        (start, stop, step) = slice(key.start, key.stop, step).indices(extent)
+
+        return (start, len(xrange(start, stop, step)), step)
+
+    def iptr(value):
+        """
+        Emit a pointer-sized integer.
+        """
+
+        return qy.value_from_any(value).cast_to(qy.iptr_type)
+
+    def wrap(bound):
+        """
+        Emit a bound with negative values counted from the end of the axis.
+        """
+
+        bound = iptr(bound)
+
+        return qy.select(bound < 0, bound + extent, bound)
+
+    extent = iptr(extent)
+    zero   = iptr(0)
+
+    if not is_static(step):
+        step = iptr(step)
+
+    if not is_static(step) or step > 0:
+        start  = zero if key.start is None else clamp(wrap(key.start), 0, extent)
+        stop   = extent if key.stop is None else clamp(wrap(key.stop), 0, extent)
+        length = qy.select(stop > start, (stop - start + step - 1) / step, zero)
+    else:
+        last   = extent - 1
+        start  = last if key.start is None else clamp(wrap(key.start), -1, last)
+        stop   = iptr(-1) if key.stop is None else clamp(wrap(key.stop), -1, last)
+        length = qy.select(start > stop, (start - stop - step - 1) / -step, zero)
+
+    return (start, length, step)
+
 class StridedArray(object):
     """
     Emit IR for interaction with a strided array.
     """
 
-    def __init__(self, strided_data, shape, strides, element_type):
+    def __init__(self, strided_data, shape, strides, element_type, affine = False):
         """
         Initialize.
+
+        Arrays come in two layouts. In the nested layout, every extent and
+        stride is a Python integer, encoded in the type of the strided data
+        pointer. In the affine layout, extents and strides may be emitted
+        values, the data pointer points to the first element, and addresses are
+        computed as base + sum(index * stride); strides may be negative, or
+        small enough that elements overlap.
         """
 
         self._strided_data = strided_data
         self._shape        = shape
         self._strides      = strides
         self._element_type = element_type
+        self._affine       = affine
 
     def at(self, *indices):
         """
@@ -170,24 +711,89 @@ class StridedArray(object):
         if len(indices) > len(self._shape):
             raise ValueError("too many indices")
 
-        # build up getelementptr indices
-        offsets = []
+        # index into the array
+        if self._affine:
+            offset = 0
 
-        for (index, stride) in zip(indices, self._strides):
-            if stride > 0:
-                offsets += [0, index]
+            for (index, stride) in zip(indices, self._strides):
+                if not is_static(stride) or stride != 0:
+                    offset = qy.value_from_any(index).cast_to(qy.iptr_type) * stride + offset
 
-        offsets += [0]
+            data = offset_pointer(self._strided_data, offset)
+        else:
+            # build up getelementptr indices
+            offsets = []
+
+            for (index, stride) in zip(indices, self._strides):
+                if stride > 0:
+                    offsets += [0, index]
+
+            offsets += [0]
+
+            data = self._strided_data.gep(*offsets)
 
-        # index into the array
         return \
             StridedArray(
-                self._strided_data.gep(*offsets),
+                data,
                 self._shape[len(indices):],
                 self._strides[len(indices):],
                 self._element_type,
+                affine = self._affine,
                 )
 
+    def slice(self, *keys):
+        """
+        Emit IR to retrieve a strided view of this array.
+
+        Each key applies to one leading axis, and is either an index, which
+        removes the axis, as in at(), or a slice object. Slice bounds and
+        steps may be Python integers or emitted values, with the conventions
+        of slice_bounds(). The view uses the nested layout if this array does
+        and every extent and stride of the view is static and fits it.
+        """
+
+        # sanity
+        if len(keys) > len(self._shape):
+            raise ValueError("too many indices")
+
+        # compute the view
+        offset  = 0
+        shape   = []
+        strides = []
+
+        for (key, extent, stride) in zip(keys, self._shape, self._strides):
+            if isinstance(key, slice):
+                (start, length, step) = slice_bounds(key, extent)
+
+                shape   += [length]
+                strides += [stride * step]
+            else:
+                start = key
+
+            if not (is_static(start) and start == 0) and not (is_static(stride) and stride == 0):
+                if is_static(start) and is_static(stride):
+                    offset = offset + start * stride
+                else:
+                    offset = qy.value_from_any(start).cast_to(qy.iptr_type) * stride + offset
+
+        shape   += self._shape[len(keys):]
+        strides += self._strides[len(keys):]
+
+        # build the view
+        data = offset_pointer(self._strided_data.cast_to(llvm.Type.pointer(self._element_type)), offset)
+
+        return StridedArray.from_raw(data, shape, strides, True if self._affine else None)
+
+    def __getitem__(self, keys):
+        """
+        Emit IR to retrieve a strided view of this array; see slice().
+        """
+
+        if isinstance(keys, tuple):
+            return self.slice(*keys)
+        else:
+            return self.slice(keys)
+
     def envelop(self, axes = 1):
         """
         Add preceding unit dimensions.
@@ -196,9 +802,10 @@ class StridedArray(object):
         return \
             StridedArray(
                 self._strided_data,
-                [1] + self._shape,
-                [0] + self._strides,
+                [1] + list(self._shape),
+                [0] + list(self._strides),
                 self._element_type,
+                affine = self._affine,
                 )
 
     def extract(self, *indices):
@@ -214,12 +821,53 @@ class StridedArray(object):
 
         return StridedArray.from_raw(inner_data, self._shape, self._strides)
 
+    def as_vector(self, width):
+        """
+        Reinterpret a rank-zero array as a vector of contiguous elements.
+        """
+
+        if self._shape:
+            raise ValueError("only rank-zero arrays may be reinterpreted as vectors")
+
+        vector_type = llvm.Type.vector(self._element_type, width)
+
+        return \
+            StridedArray(
+                self._strided_data.cast_to(llvm.Type.pointer(vector_type)),
+                (),
+                (),
+                vector_type,
+                affine = self._affine,
+                )
+
+    def to_values(self):
+        """
+        Return the emitted values that describe this array.
+
+        These are the data pointer and any extents and strides that are not
+        Python integers.
+        """
+
+        dynamic = [v for v in list(self._shape) + list(self._strides) if not is_static(v)]
+
+        return [self._strided_data] + dynamic
+
+    def view(self, shape, strides):
+        """
+        Return an array over the same data with other extents and strides.
+        """
+
+        if self._affine:
+            return StridedArray(self._strided_data, list(shape), list(strides), self._element_type, affine = True)
+        else:
+            return StridedArray.from_raw(self._strided_data.cast_to(llvm.Type.pointer(self._element_type)), shape, strides)
+
     def using(self, strided_data):
         """
         Return an equivalent array using a different data pointer.
         """
 
-        return StridedArray(strided_data, self._shape, self._strides, self._element_type)
+        return StridedArray(strided_data, self._shape, self._strides, self._element_type, affine = self._affine)
 
     @property
     def data(self):
@@ -245,17 +893,40 @@ class StridedArray(object):
 
         return self._strides
 
+    @property
+    def element_type(self):
+        """
+        The LLVM type of each element.
+        """
+
+        return self._element_type
+
+    @property
+    def affine(self):
+        """
+        Does this array use the affine layout?
+        """
+
+        return self._affine
+
     @staticmethod
-    def from_raw(data, shape, strides = None):
+    def from_raw(data, shape, strides = None, affine = None):
         """
         Build an array from a typical data pointer.
 
+        By default, the affine layout is used if any extent or stride is an
+        emitted value, or if the strides are negative or overlapping, and the
+        nested layout otherwise; either may be requested instead, though the
+        nested layout requires every extent and stride to be a Python integer,
+        and strides that do not overlap.
+
         @param data    : Pointer value (with element-pointer type) to array data.
-        @param shape   : Tuple of dimension sizes (Python integers).
-        @param strides : Tuple of dimension strides (Python integers).
+        @param shape   : Tuple of dimension sizes (Python integers or values).
+        @param strides : Tuple of dimension strides (Python integers or values).
+        @param affine  : Use the affine layout? (None: decide automatically.)
         """
 
-        shape = map(int, shape)
+        shape = [int(d) if is_static(d) else d for d in shape]
 
         if strides is None:
             from qy import size_of_type
@@ -265,32 +936,62 @@ class StridedArray(object):
 
             for d in reversed(shape):
                 strides   += [axis_size]
-                axis_size *= d
+                axis_size  = d * axis_size
 
             strides = list(reversed(strides))
         else:
-            strides = map(int, strides)
+            strides = [int(s) if is_static(s) else s for s in strides]
+
+        static = all(map(is_static, shape + strides))
+
+        if affine is None:
+            affine = not (static and fits_nested_layout(data.type_.pointee, shape, strides))
+        elif not affine and not static:
+            raise ValueError("the nested layout requires static extents and strides")
+
+        if not affine:
+            (strided_type, _) = get_strided_type(data.type_.pointee, shape, strides)
+            strided_data      = data.cast_to(llvm.Type.pointer(strided_type))
+
+            return StridedArray(strided_data, shape, strides, data.type_.pointee)
+        else:
+            return StridedArray(data, shape, strides, data.type_.pointee, affine = True)
+
+    @staticmethod
+    def from_values(like, values):
+        """
+        Rebuild an array like another from the values returned by to_values().
+
+        Returns the array and the unused values.
+        """
 
-        (strided_type, _) = get_strided_type(data.type_.pointee, shape, strides)
-        strided_data      = data.cast_to(llvm.Type.pointer(strided_type))
+        values  = list(values)
+        data    = values.pop(0)
+        shape   = [d if is_static(d) else values.pop(0) for d in like.shape]
+        strides = [s if is_static(s) else values.pop(0) for s in like.strides]
 
-        return StridedArray(strided_data, shape, strides, data.type_.pointee)
+        return (StridedArray(data, shape, strides, like.element_type, affine = like.affine), values)
 
     @staticmethod
-    def from_numpy(ndarray):
+    def from_numpy(ndarray, affine = None):
         """
         Build an array from a particular numpy array.
+
+        See from_raw() for the choice of layout.
         """
 
         # XXX maintain reference to array in module; decref in destructor
 
-        from qy import type_from_dtype
+        from qy import (
+            iptr_type,
+            type_from_dtype,
+            )
 
         type_         = type_from_dtype(ndarray.dtype)
         (location, _) = ndarray.__array_interface__["data"]
         data          = llvm.Constant.int(iptr_type, location).inttoptr(llvm.Type.pointer(type_))
 
-        return StridedArray.from_raw(qy.value_from_any(data), ndarray.shape, ndarray.strides)
+        return StridedArray.from_raw(qy.value_from_any(data), ndarray.shape, ndarray.strides, affine)
 
     @staticmethod
     def from_typed_pointer(data):
@@ -315,3 +1016,153 @@ class StridedArray(object):
 
         return StridedArray.from_raw(data, shape)
 
+
+class StridedArrayArgument(KernelArgument):
+    """
+    Kernel argument bound to an ndarray at call time.
+
+    The data pointer is always passed at call time, so one kernel serves any
+    array of matching dtype and rank. Extents and strides are also passed at
+    call time unless given here, in which case they are compiled into the
+    kernel and checked on each call. The emitter-side array layout is chosen
+    as by StridedArray.from_raw(); an array with compiled-in extents and
+    strides may opt into the affine layout, which computes addresses from
+    constant strides without building a nested LLVM type for them.
+    """
+
+    def __init__(self, dtype, ndim, shape = None, strides = None, affine = None):
+        """
+        Initialize.
+        """
+
+        self._dtype   = numpy.dtype(dtype)
+        self._ndim    = int(ndim)
+        self._shape   = None if shape is None else tuple(map(int, shape))
+        self._strides = None if strides is None else tuple(map(int, strides))
+        self._affine  = affine
+
+        for fixed in [self._shape, self._strides]:
+            if fixed is not None and len(fixed) != self._ndim:
+                raise ValueError("fixed shape or strides do not match array rank")
+
+    @property
+    def argument_types(self):
+        """
+        The types of the underlying native arguments.
+        """
+
+        from qy import (
+            iptr_type,
+            type_from_dtype,
+            )
+
+        types = [llvm.Type.pointer(type_from_dtype(self._dtype))]
+
+        if self._shape is None:
+            types += [iptr_type] * self._ndim
+
+        if self._strides is None:
+            types += [iptr_type] * self._ndim
+
+        return types
+
+    def from_values(self, values):
+        """
+        Build a StridedArray from native argument values.
+        """
+
+        values = list(values)
+        data   = values.pop(0)
+
+        if self._shape is None:
+            shape  = values[:self._ndim]
+            values = values[self._ndim:]
+        else:
+            shape = self._shape
+
+        if self._strides is None:
+            strides = values[:self._ndim]
+        else:
+            strides = self._strides
+
+        return StridedArray.from_raw(data, shape, strides, self._affine)
+
+    def to_arguments(self, ndarray):
+        """
+        Return the native arguments describing an ndarray.
+        """
+
+        if not isinstance(ndarray, numpy.ndarray):
+            raise TypeError("expected an ndarray, received a \"%s\" instance" % type(ndarray))
+        elif ndarray.dtype != self._dtype:
+            raise TypeError("expected an array of dtype %s, received %s" % (self._dtype, ndarray.dtype))
+        elif ndarray.ndim != self._ndim:
+            raise ValueError("expected an array of rank %i, received %i" % (self._ndim, ndarray.ndim))
+        elif self._shape is not None and ndarray.shape != self._shape:
+            raise ValueError("expected an array of shape %s, received %s" % (self._shape, ndarray.shape))
+        elif self._strides is not None and ndarray.strides != self._strides:
+            raise ValueError("expected an array of strides %s, received %s" % (self._strides, ndarray.strides))
+
+        (location, _) = ndarray.__array_interface__["data"]
+        arguments     = [location]
+
+        if self._shape is None:
+            arguments += list(ndarray.shape)
+
+        if self._strides is None:
+            arguments += list(ndarray.strides)
+
+        return arguments
+
+    @property
+    def dtype(self):
+        """
+        The array dtype.
+        """
+
+        return self._dtype
+
+    @property
+    def ndim(self):
+        """
+        The array rank.
+        """
+
+        return self._ndim
+
+    @property
+    def shape(self):
+        """
+        The compiled-in shape, or None.
+        """
+
+        return self._shape
+
+    @property
+    def strides(self):
+        """
+        The compiled-in strides, or None.
+        """
+
+        return self._strides
+
+    @property
+    def affine(self):
+        """
+        Use the affine layout? (None: decide automatically.)
+        """
+
+        return self._affine
+
+    @staticmethod
+    def from_numpy(ndarray, static = False, affine = None):
+        """
+        Build an argument matching an example ndarray.
+
+        If static, its shape and strides are compiled in.
+        """
+
+        if static:
+            return StridedArrayArgument(ndarray.dtype, ndarray.ndim, ndarray.shape, ndarray.strides, affine)
+        else:
+            return StridedArrayArgument(ndarray.dtype, ndarray.ndim, affine = affine)
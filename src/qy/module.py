@@ -2,11 +2,21 @@
 @author: Bryan Silverthorn <bcs@cargo-cult.org>
 """
 
+import time
 import ctypes
 import contextlib
 import numpy
 import qy.llvm as llvm
 
+from qy.cache      import (
+    module_hash,
+    kernel_cache,
+    )
+from qy.instrument import (
+    CompileProfile,
+    compile_log,
+    )
+
 iptr_type = llvm.Type.int(ctypes.sizeof(ctypes.c_void_p) * 8)
 
 def constant_pointer(address, type_):
@@ -25,59 +35,275 @@ def constant_pointer_to(object_, type_):
 
     return constant_pointer(id(object_), type_)
 
-def emit_and_execute(module_name = "", optimize = True):
+def emit_module(emit, return_type = None, argument_types = (), nogil = False, target = None):
     """
-    Prepare for, emit, and run some LLVM IR.
+    Emit a complete LLVM module around a main body.
+
+    The emitter receives the entry point arguments; if it leaves the body
+    unterminated, a void return is emitted. If nogil, the module is emitted
+    to run without the GIL, and for the given target; see Qy.
     """
 
     from qy import Qy
 
-    def decorator(emit):
+    with Qy(return_type = return_type, argument_types = argument_types, nogil = nogil, target = target).active() as this:
+        emit(*this.arguments)
+
+        if not this.block_terminated:
+            this.return_()
+
+    return this.module
+
+class CompiledModule(object):
+    """
+    A JIT-compiled module.
+    """
+
+    def __init__(self, engine, module, level, pass_timings, target = None, profile = None):
         """
-        Build an LLVM module, then execute it.
+        Initialize.
         """
 
-        # construct the module
-        with Qy().active() as this:
-            emit()
+        if profile is None:
+            profile = CompileProfile()
 
-            this.return_()
+        self._engine       = engine
+        self._module       = module
+        self._level        = level
+        self._pass_timings = pass_timings
+        self._target       = target
+        self._profile      = profile
+
+    @property
+    def engine(self):
+        """
+        The execution engine owning the module.
+        """
+
+        return self._engine
+
+    @property
+    def module(self):
+        """
+        The compiled LLVM module.
+        """
+
+        return self._module
+
+    @property
+    def main(self):
+        """
+        The module entry point.
+        """
 
-        module = this.module
+        return self._module.get_function_named("main")
 
-        module.verify()
+    @property
+    def level(self):
+        """
+        The optimization level applied to the module.
+        """
+
+        return self._level
+
+    @property
+    def pass_timings(self):
+        """
+        List of (pass name, seconds) pairs from optimization.
+        """
+
+        return self._pass_timings
+
+    @property
+    def target(self):
+        """
+        The code generation target, or None if chosen by LLVM.
+        """
+
+        return self._target
+
+    @property
+    def profile(self):
+        """
+        The CompileProfile recording the cost of each compilation phase.
+        """
+
+        return self._profile
+
+def compile_engine(module, target = None):
+    """
+    Build an execution engine for a module.
+    """
 
-        # optimize it
-        engine = llvm.ExecutionEngine.new(module)
+    if target is None:
+        return llvm.ExecutionEngine.new(module)
+    else:
+        return llvm.EngineBuilder.new(module).create(target.machine())
+
+def compile_module(module, optimize = True, verify = True, target = None, profile = None):
+    """
+    Verify, optimize, and JIT-compile an emitted module.
+
+    The optimize argument is a level name (one of "O0" through "O3", or "Os");
+    True and False are synonyms for "O2" and "O0". The target is a qy.Target,
+    or None to let LLVM choose.
+
+    The verify, engine (construction of the execution engine), optimize,
+    and codegen phases are recorded in the given CompileProfile, or in a new
+    one; the profile is then added to the compile log.
+    """
 
-        #if optimize:
-            #manager = llvm.PassManager.new()
+    from qy.optimize import (
+        normalize_level,
+        optimize_module,
+        )
 
-            #manager.add(engine.target_data)
+    if profile is None:
+        profile = CompileProfile()
 
-            #manager.add(llvm.passes.PASS_FUNCTION_INLINING)
-            #manager.add(llvm.passes.PASS_PROMOTE_MEMORY_TO_REGISTER)
-            #manager.add(llvm.passes.PASS_BASIC_ALIAS_ANALYSIS)
-            #manager.add(llvm.passes.PASS_CONSTANT_PROPAGATION)
-            #manager.add(llvm.passes.PASS_INSTRUCTION_COMBINING)
-            #manager.add(llvm.passes.PASS_IND_VAR_SIMPLIFY)
-            #manager.add(llvm.passes.PASS_GEP_SPLITTER)
-            #manager.add(llvm.passes.PASS_LOOP_SIMPLIFY)
-            #manager.add(llvm.passes.PASS_LICM)
-            #manager.add(llvm.passes.PASS_LOOP_ROTATE)
-            #manager.add(llvm.passes.PASS_LOOP_STRENGTH_REDUCE)
-            #manager.add(llvm.passes.PASS_LOOP_UNROLL)
-            #manager.add(llvm.passes.PASS_GVN)
-            #manager.add(llvm.passes.PASS_DEAD_STORE_ELIMINATION)
-            #manager.add(llvm.passes.PASS_DEAD_CODE_ELIMINATION)
-            #manager.add(llvm.passes.PASS_CFG_SIMPLIFICATION)
+    if verify:
+        with profile.phase("verify", module):
+            module.verify()
 
-            #manager.run(module)
+    level = normalize_level(optimize)
 
-        # execute it
-        engine.run_function(this.main, [])
+    with profile.phase("engine"):
+        engine = compile_engine(module, target)
 
-        qy.raise_if_set()
+    with profile.phase("optimize", module):
+        pass_timings = optimize_module(module, level, engine.target_data)
+
+    # the JIT generates machine code when the entry point is first requested
+    with profile.phase("codegen"):
+        engine.get_pointer_to_function(module.get_function_named("main"))
+
+    compile_log.add(profile)
+
+    return CompiledModule(engine, module, level, pass_timings, target, profile)
+
+def compile_cached(
+    emit,
+    optimize       = True,
+    cache          = kernel_cache,
+    key            = None,
+    disk_cache     = None,
+    return_type    = None,
+    argument_types = (),
+    target         = None,
+    nogil          = False,
+    ):
+    """
+    Emit and compile a module, consulting the in-process and disk caches.
+
+    Compiled modules are stored in the given cache (pass None to disable
+    caching). By default entries are keyed on a hash of the emitted IR, so an
+    identical module skips verification and code generation. If a key is
+    supplied, it replaces that hash, and emission itself is skipped on a hit;
+    the caller is then responsible for ensuring that equal keys imply
+    equivalent code.
+
+    If a disk cache is given, optimized modules found there skip
+    verification and optimization. Its entries are always keyed on the IR
+    hash, so with a user key, emission is skipped only on an in-process hit;
+    modules that embed addresses of this process (see has_baked_addresses())
+    are never stored in or loaded from it.
+
+    The return and argument types give the signature of the module entry
+    point, and nogil how it is emitted; see emit_module(). The target is
+    passed to emit_module() and compile_module().
+
+    Compilation is profiled as in compile_module(), with an additional emit
+    or load phase; modules found in the in-process cache keep the profile of
+    their original compilation.
+
+    Returns a CompiledModule.
+    """
+
+    from qy.disk_cache import has_baked_addresses
+    from qy.optimize   import normalize_level
+
+    level      = normalize_level(optimize)
+    target_key = None if target is None else target.signature
+    profile    = CompileProfile(getattr(emit, "__name__", None))
+
+    def emit_now():
+        start   = time.time()
+        emitted = emit_module(emit, return_type, argument_types, nogil, target)
+
+        profile.record("emit", time.time() - start, emitted)
+
+        profile.hash = module_hash(emitted)
+
+        return emitted
+
+    # look up or construct the module
+    if key is None:
+        module    = emit_now()
+        cache_key = ("ir", profile.hash, level, target_key)
+    else:
+        module    = None
+        cache_key = ("user", key, nogil, level, target_key)
+
+    if cache is None:
+        compiled = None
+    else:
+        compiled = cache.get(cache_key)
+
+    if compiled is None:
+        if module is None:
+            module = emit_now()
+
+        disk_key = ("ir", profile.hash, level, target_key)
+
+        if disk_cache is not None and has_baked_addresses(module):
+            disk_cache = None
+
+        if disk_cache is None:
+            stored = None
+        else:
+            start  = time.time()
+            stored = disk_cache.load(disk_key)
+
+            profile.record("load", time.time() - start, stored)
+
+        if stored is None:
+            compiled = compile_module(module, optimize = level, target = target, profile = profile)
+
+            if disk_cache is not None:
+                disk_cache.store(disk_key, module)
+        else:
+            compiled = compile_module(stored, optimize = False, verify = False, target = target, profile = profile)
+
+        if cache is not None:
+            cache.put(cache_key, compiled)
+
+    return compiled
+
+def emit_and_execute(module_name = "", optimize = True, cache = kernel_cache, key = None, disk_cache = None, target = None):
+    """
+    Prepare for, emit, and run some LLVM IR.
+
+    See compile_module() for the optimization levels, and compile_cached()
+    for the meaning of the caching arguments.
+    """
+
+    from qy.kernel import compile_kernel
+
+    def decorator(emit):
+        """
+        Build an LLVM module, then execute it.
+        """
+
+        kernel = \
+            compile_kernel(
+                optimize   = optimize,
+                cache      = cache,
+                key        = key,
+                disk_cache = disk_cache,
+                target     = target,
+                )
+
+        kernel(emit)()
 
     return decorator
 
@@ -127,6 +353,32 @@ def type_from_dtype(dtype):
     else:
         raise ValueError("could not build an LLVM type for dtype %s" % dtype.descr)
 
+def ctype_from_type(type_):
+    """
+    Build a ctypes type matching an LLVM scalar or pointer type.
+    """
+
+    integer_ctypes = {
+        1  : ctypes.c_bool,
+        8  : ctypes.c_int8,
+        16 : ctypes.c_int16,
+        32 : ctypes.c_int32,
+        64 : ctypes.c_int64,
+        }
+
+    if type_.kind == llvm.TYPE_VOID:
+        return None
+    elif type_.kind == llvm.TYPE_INTEGER:
+        return integer_ctypes[type_.width]
+    elif type_.kind == llvm.TYPE_DOUBLE:
+        return ctypes.c_double
+    elif type_.kind == llvm.TYPE_FLOAT:
+        return ctypes.c_float
+    elif type_.kind == llvm.TYPE_POINTER:
+        return ctypes.c_void_p
+    else:
+        raise ValueError("could not build a ctypes type for LLVM type %s" % type_)
+
 def size_of_type(type_):
     """
     Return the size of an instance of a type, in bytes.
@@ -0,0 +1,184 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "optimization_levels",
+    "normalize_level",
+    "optimize_module",
+    "format_pass_timings",
+    ]
+
+import time
+import qy.llvm as llvm
+
+pass_constants = {
+    "inline"        : "PASS_FUNCTION_INLINING",
+    "mem2reg"       : "PASS_PROMOTE_MEMORY_TO_REGISTER",
+    "constprop"     : "PASS_CONSTANT_PROPAGATION",
+    "instcombine"   : "PASS_INSTRUCTION_COMBINING",
+    "indvars"       : "PASS_IND_VAR_SIMPLIFY",
+    "loop-simplify" : "PASS_LOOP_SIMPLIFY",
+    "licm"          : "PASS_LICM",
+    "loop-rotate"   : "PASS_LOOP_ROTATE",
+    "loop-reduce"   : "PASS_LOOP_STRENGTH_REDUCE",
+    "loop-unroll"   : "PASS_LOOP_UNROLL",
+    "gvn"           : "PASS_GVN",
+    "dse"           : "PASS_DEAD_STORE_ELIMINATION",
+    "dce"           : "PASS_DEAD_CODE_ELIMINATION",
+    "simplifycfg"   : "PASS_CFG_SIMPLIFICATION",
+    }
+
+_o1_passes = [
+    "mem2reg",
+    "instcombine",
+    "simplifycfg",
+    "dce",
+    ]
+_os_passes = [
+    "mem2reg",
+    "constprop",
+    "instcombine",
+    "simplifycfg",
+    "loop-simplify",
+    "loop-rotate",
+    "licm",
+    "gvn",
+    "dse",
+    "dce",
+    "simplifycfg",
+    ]
+_o2_passes = [
+    "inline",
+    "mem2reg",
+    "constprop",
+    "instcombine",
+    "simplifycfg",
+    "loop-simplify",
+    "loop-rotate",
+    "licm",
+    "indvars",
+    "gvn",
+    "dse",
+    "dce",
+    "simplifycfg",
+    ]
+_o3_passes = [
+    "inline",
+    "mem2reg",
+    "constprop",
+    "instcombine",
+    "simplifycfg",
+    "loop-simplify",
+    "loop-rotate",
+    "licm",
+    "indvars",
+    "loop-unroll",
+    "instcombine",
+    "gvn",
+    "loop-reduce",
+    "dse",
+    "dce",
+    "simplifycfg",
+    ]
+
+optimization_levels = {
+    "O0" : [],
+    "O1" : _o1_passes,
+    "O2" : _o2_passes,
+    "O3" : _o3_passes,
+    "Os" : _os_passes,
+    }
+
+def normalize_level(level):
+    """
+    Return the named optimization level for a level or boolean.
+    """
+
+    if level is True:
+        return "O2"
+    elif level is False or level is None:
+        return "O0"
+    elif level in optimization_levels:
+        return level
+    else:
+        raise ValueError("unknown optimization level \"%s\"" % (level,))
+
+def optimize_module(module, level = "O2", target_data = None, per_pass = True):
+    """
+    Run an optimization pipeline over a module, in place.
+
+    By default, each pass is run under its own pass manager so that it can
+    be timed separately. Analyses are then not shared between passes, so
+    the per-pass times are approximate, and their sum overstates the cost of
+    the pipeline run under a single pass manager. If per_pass is false, the
+    pipeline runs under one pass manager and is timed as a whole.
+
+    Returns a list of (pass name, seconds) pairs; without per_pass, a single
+    ("pipeline", seconds) pair.
+    """
+
+    def new_manager():
+        """
+        Return a new pass manager with the common analyses added.
+        """
+
+        manager = llvm.PassManager.new()
+
+        if target_data is not None:
+            manager.add(target_data)
+
+        manager.add(llvm.PASS_BASIC_ALIAS_ANALYSIS)
+
+        return manager
+
+    names = optimization_levels[normalize_level(level)]
+
+    if not per_pass:
+        manager = new_manager()
+
+        for name in names:
+            manager.add(getattr(llvm, pass_constants[name]))
+
+        start = time.time()
+
+        manager.run(module)
+
+        return [("pipeline", time.time() - start)]
+
+    timings = []
+
+    for name in names:
+        manager = new_manager()
+
+        manager.add(getattr(llvm, pass_constants[name]))
+
+        start = time.time()
+
+        manager.run(module)
+
+        timings.append((name, time.time() - start))
+
+    return timings
+
+def format_pass_timings(timings):
+    """
+    Return a human-readable report of pass timings.
+
+    Per-pass times are approximate; see optimize_module().
+    """
+
+    total = sum(t for (_, t) in timings)
+    lines = []
+
+    for (name, seconds) in timings:
+        if total > 0.0:
+            share = 100.0 * seconds / total
+        else:
+            share = 0.0
+
+        lines.append("%-14s %9.3f ms %5.1f%%" % (name, seconds * 1e3, share))
+
+    lines.append("%-14s %9.3f ms" % ("total", total * 1e3))
+
+    return "\n".join(lines)
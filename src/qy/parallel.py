@@ -0,0 +1,253 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "default_thread_count",
+    ]
+
+import os
+import ctypes
+import multiprocessing
+import qy
+import qy.llvm as llvm
+
+def default_thread_count():
+    """
+    Return the number of threads used by parallel loops by default.
+
+    This is $QY_NUM_THREADS, if set, or the number of CPUs.
+    """
+
+    threads = os.environ.get("QY_NUM_THREADS")
+
+    if threads:
+        return int(threads)
+    else:
+        return multiprocessing.cpu_count()
+
+def member(pointer, index):
+    """
+    Emit IR to return a pointer to a struct member.
+    """
+
+    return pointer.gep(0, llvm.Constant.int(llvm.Type.int(32), index))
+
+def emit_parallel_ranges(stop, start = 0, arguments = (), schedule = "static", chunk = None, threads = None):
+    """
+    Emit a loop over range(start, stop) whose chunks run on native threads.
+
+    The decorated emitter is emitted into a separate function; it receives
+    the bounds of one chunk, followed by the given argument values, and must
+    not refer to any other value emitted outside it, nor call into Python.
+    Chunks are handed out round-robin ("static") or on demand, through an
+    atomic counter ("dynamic"). The calling thread works on the first share,
+    then joins the others. An assertion that fails in the body ends its
+    chunk, and is asserted again by the calling thread after the join.
+    """
+
+    if schedule not in ("static", "dynamic"):
+        raise ValueError("unknown parallel schedule \"%s\"" % schedule)
+
+    if threads is None:
+        threads = default_thread_count()
+
+    if threads < 1:
+        raise ValueError("parallel loops require at least one thread")
+
+    index_type     = llvm.Type.int(64)
+    bytes_type     = llvm.Type.pointer(llvm.Type.int(8))
+    handle_type    = llvm.Type.int(ctypes.sizeof(ctypes.c_ulong) * 8)
+    arguments      = map(qy.value_from_any, arguments)
+    arguments_type = llvm.Type.struct([a.type_ for a in arguments])
+    task_type      = \
+        llvm.Type.struct([
+            bytes_type,                        # packed arguments
+            index_type,                        # start
+            index_type,                        # stop
+            index_type,                        # chunk size
+            index_type,                        # chunk count
+            llvm.Type.pointer(index_type),     # next chunk (dynamic schedule)
+            index_type,                        # thread number
+            ])
+    parallel_id    = qy.get().unique_id("parallel")
+
+    def decorator(emit_body):
+        """
+        Emit the parallel loop.
+        """
+
+        # record failed assertions of the body, for the calling thread
+        failed   = llvm.GlobalVariable.new(qy.get().module, index_type, "qy_parallel_failed_%i" % parallel_id)
+        messages = []
+
+        failed.linkage     = llvm.LINKAGE_INTERNAL
+        failed.initializer = llvm.Constant.int(index_type, 0)
+
+        # emit the loop body and the worker that runs it
+        @qy.Function.define(llvm.Type.void(), [bytes_type, index_type, index_type], name = "qy_parallel_body_%i" % parallel_id)
+        def body(packed, lower, upper):
+            packed = packed.cast_to(llvm.Type.pointer(arguments_type))
+
+            with qy.get().parallel_body(failed, messages):
+                emit_body(lower, upper, *[member(packed, i).load() for i in xrange(len(arguments))])
+
+            qy.return_()
+
+        @qy.Function.define(bytes_type, [bytes_type], name = "qy_parallel_worker_%i" % parallel_id)
+        def worker(task_bytes):
+            task   = task_bytes.cast_to(llvm.Type.pointer(task_type))
+            packed = member(task, 0).load()
+            first  = member(task, 1).load()
+            last   = member(task, 2).load()
+            size   = member(task, 3).load()
+            chunks = member(task, 4).load()
+
+            def run_chunk(c):
+                lower = first + c * size
+                upper = lower + size
+
+                body(packed, lower, qy.select(upper < last, upper, last))
+
+            if schedule == "static":
+                @qy.for_(chunks, start = member(task, 6).load(), step = threads)
+                def _(c):
+                    run_chunk(c)
+            else:
+                next_chunk = member(task, 5).load()
+
+                @qy.for_(chunks)
+                def _(_):
+                    c = \
+                        qy.Value.from_low(
+                            qy.get().builder.atomic_add(
+                                next_chunk.low,
+                                llvm.Constant.int(index_type, 1),
+                                "monotonic",
+                                ),
+                            )
+
+                    @qy.if_(c >= chunks)
+                    def _():
+                        qy.break_()
+
+                    run_chunk(c)
+
+            qy.return_(llvm.Constant.null(bytes_type))
+
+        # divide the iteration space into chunks
+        first = qy.value_from_any(start).cast_to(index_type)
+        last  = qy.value_from_any(stop).cast_to(index_type)
+        count = last - first
+
+        if chunk is None:
+            if schedule == "static":
+                parts = threads
+            else:
+                parts = threads * 8
+
+            size = (count + (parts - 1)) / parts
+            size = qy.select(size > 0, size, llvm.Constant.int(index_type, 1))
+        else:
+            size = qy.value_from_any(chunk).cast_to(index_type)
+
+        chunks = (count + size - 1) / size
+
+        # describe the work of each thread
+        packed     = qy.stack_allocate(arguments_type)
+        next_chunk = qy.stack_allocate(index_type, llvm.Constant.int(index_type, 0))
+        tasks      = qy.stack_allocate(llvm.Type.array(task_type, threads))
+
+        for (i, argument) in enumerate(arguments):
+            argument.store(member(packed, i))
+
+        @qy.for_(threads)
+        def _(t):
+            task = tasks.gep(0, t)
+
+            packed.cast_to(bytes_type).store(member(task, 0))
+            first.store(member(task, 1))
+            last.store(member(task, 2))
+            size.store(member(task, 3))
+            chunks.store(member(task, 4))
+            next_chunk.store(member(task, 5))
+            t.cast_to(index_type).store(member(task, 6))
+
+        # clear any failure left by an earlier run
+        failed_value = qy.Value.from_low(failed)
+
+        qy.value_from_any(llvm.Constant.int(index_type, 0)).store(failed_value)
+
+        # start the other threads; run a share in this one; wait
+        if threads > 1:
+            handles  = qy.stack_allocate(llvm.Type.array(handle_type, threads))
+            statuses = qy.stack_allocate(llvm.Type.array(llvm.Type.int(32), threads))
+            create   = \
+                qy.Function.named(
+                    "pthread_create",
+                    llvm.Type.int(32),
+                    [llvm.Type.pointer(handle_type), bytes_type, worker.type_, bytes_type],
+                    )
+            join     = \
+                qy.Function.named(
+                    "pthread_join",
+                    llvm.Type.int(32),
+                    [handle_type, llvm.Type.pointer(bytes_type)],
+                    )
+
+            @qy.for_(threads, start = 1)
+            def _(t):
+                task_bytes = tasks.gep(0, t).cast_to(bytes_type)
+                status     = \
+                    create(
+                        handles.gep(0, t),
+                        llvm.Constant.null(bytes_type),
+                        qy.Value.from_low(worker.low),
+                        task_bytes,
+                        )
+
+                status.store(statuses.gep(0, t))
+
+                # if no thread could be started, do its share here
+                @qy.if_(~(status == 0))
+                def _():
+                    worker(task_bytes)
+
+        worker(tasks.gep(0, 0).cast_to(bytes_type))
+
+        if threads > 1:
+            @qy.for_(threads, start = 1)
+            def _(t):
+                @qy.if_(statuses.gep(0, t).load() == 0)
+                def _():
+                    join(handles.gep(0, t).load(), llvm.Constant.null(llvm.Type.pointer(bytes_type)))
+
+        # assert any failure of the body here, where it is safe to bail out
+        if messages:
+            code = failed_value.load()
+
+            for (i, message) in enumerate(messages):
+                qy.assert_(~(code == i + 1), message)
+
+    return decorator
+
+def emit_parallel_for(stop, start = 0, arguments = (), schedule = "static", chunk = None, threads = None):
+    """
+    Emit a for-style loop whose iterations run on native threads.
+
+    The decorated emitter receives the loop index and the argument values;
+    see emit_parallel_ranges().
+    """
+
+    def decorator(emit_body):
+        """
+        Emit the parallel loop.
+        """
+
+        @emit_parallel_ranges(stop, start, arguments, schedule, chunk, threads)
+        def _(lower, upper, *values):
+            @qy.for_(upper, start = lower)
+            def _(index):
+                emit_body(index, *values)
+
+    return decorator
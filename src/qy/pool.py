@@ -0,0 +1,308 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "KernelFuture",
+    "CompilePool",
+    ]
+
+import time
+import threading
+import multiprocessing
+
+from cStringIO import StringIO
+
+from qy.cache import kernel_cache
+
+def module_to_bitcode(module):
+    """
+    Serialize a module to a bitcode string.
+    """
+
+    bitcode = StringIO()
+
+    module.to_bitcode(bitcode)
+
+    return bitcode.getvalue()
+
+def module_from_bitcode(bitcode):
+    """
+    Deserialize a module from a bitcode string.
+    """
+
+    import qy.llvm as llvm
+
+    return llvm.Module.from_bitcode(StringIO(bitcode))
+
+def optimize_bitcode(bitcode, level, target):
+    """
+    Optimize serialized module bitcode; run in a worker process.
+
+    Returns the optimized bitcode and the pass timings.
+    """
+
+    from qy          import compile_engine
+    from qy.optimize import optimize_module
+
+    module  = module_from_bitcode(bitcode)
+    engine  = compile_engine(module, target)
+    timings = optimize_module(module, level, engine.target_data)
+
+    return (module_to_bitcode(module), timings)
+
+class KernelFuture(object):
+    """
+    Kernel whose compilation may not yet have finished.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(
+        self,
+        async_result = None,
+        arguments    = None,
+        level        = None,
+        target       = None,
+        cache_key    = None,
+        cache        = None,
+        profile      = None,
+        kernel       = None,
+        nogil        = False,
+        disk_key     = None,
+        disk_cache   = None,
+        ):
+        """
+        Initialize.
+        """
+
+        self._async_result = async_result
+        self._arguments    = arguments
+        self._level        = level
+        self._target       = target
+        self._cache_key    = cache_key
+        self._cache        = cache
+        self._profile      = profile
+        self._kernel       = kernel
+        self._nogil        = nogil
+        self._disk_key     = disk_key
+        self._disk_cache   = disk_cache
+
+    def ready(self):
+        """
+        Has the worker finished?
+        """
+
+        return self._kernel is not None or self._async_result.ready()
+
+    def wait(self, timeout = None):
+        """
+        Wait for the worker to finish.
+        """
+
+        if self._kernel is None:
+            self._async_result.wait(timeout)
+
+    def result(self, timeout = None):
+        """
+        Return the compiled kernel, waiting for the worker if necessary.
+
+        Only optimization runs in the workers. Machine code generated by the
+        JIT lives in the memory of the process that generates it, and LLVM
+        state is not thread-safe, so code generation runs here, in the calling
+        thread, once, under a lock shared by all futures; the first call to
+        result() therefore still pays for it. The optimize phase of the
+        profile records the time spent in the worker.
+        """
+
+        from qy import (
+            Kernel,
+            CompiledModule,
+            compile_log,
+            compile_engine,
+            )
+
+        with KernelFuture._lock:
+            if self._kernel is None:
+                (bitcode, timings) = self._async_result.get(timeout)
+
+                module = module_from_bitcode(bitcode)
+
+                self._profile.record("optimize", sum(t for (_, t) in timings), module)
+
+                with self._profile.phase("engine"):
+                    engine = compile_engine(module, self._target)
+
+                with self._profile.phase("codegen"):
+                    engine.get_pointer_to_function(module.get_function_named("main"))
+
+                compile_log.add(self._profile)
+
+                compiled = CompiledModule(engine, module, self._level, timings, self._target, self._profile)
+
+                if self._cache is not None:
+                    self._cache.put(self._cache_key, compiled)
+
+                if self._disk_cache is not None:
+                    self._disk_cache.store(self._disk_key, module)
+
+                self._kernel = Kernel(compiled, self._arguments, self._nogil)
+
+            return self._kernel
+
+class CompilePool(object):
+    """
+    Pool of worker processes that optimize modules in parallel.
+
+    Modules are emitted and verified in the calling thread, then shipped as
+    bitcode to a worker process; each worker has its own LLVM context, so
+    optimization runs truly in parallel. Code generation does not: the
+    returned futures run it in the calling thread, on first use (see
+    KernelFuture.result()).
+    """
+
+    def __init__(self, workers = None):
+        """
+        Initialize.
+        """
+
+        self._pool = multiprocessing.Pool(workers)
+
+    def __enter__(self):
+        """
+        Enter a context that closes the pool on exit.
+        """
+
+        return self
+
+    def __exit__(self, *_):
+        """
+        Close the pool and wait for its workers.
+        """
+
+        self.close()
+
+    def compile_kernel(
+        self,
+        return_type    = None,
+        argument_types = (),
+        optimize       = True,
+        cache          = kernel_cache,
+        key            = None,
+        disk_cache     = None,
+        target         = None,
+        nogil          = False,
+        ):
+        """
+        Emit a kernel now and compile it in the background.
+
+        The arguments are as for qy.compile_kernel(), and the caches are
+        consulted as by compile_cached(); the decorated emitter is replaced by
+        a KernelFuture.
+        """
+
+        from qy            import (
+            Kernel,
+            KernelArgument,
+            CompileProfile,
+            emit_module,
+            module_hash,
+            compile_module,
+            )
+        from qy.kernel     import (
+            expand_argument_types,
+            group_argument_values,
+            )
+        from qy.optimize   import normalize_level
+        from qy.disk_cache import has_baked_addresses
+
+        argument_types = list(argument_types)
+        level          = normalize_level(optimize)
+        target_key     = None if target is None else target.signature
+
+        if any(isinstance(a, KernelArgument) for a in argument_types):
+            arguments = argument_types
+        else:
+            arguments = None
+
+        def decorator(emit):
+            """
+            Emit and submit the kernel module.
+            """
+
+            def emit_grouped(*values):
+                emit(*group_argument_values(argument_types, values))
+
+            profile = CompileProfile(emit.__name__)
+
+            if key is not None:
+                cache_key = ("user", key, nogil, level, target_key)
+
+                if cache is not None:
+                    compiled = cache.get(cache_key)
+
+                    if compiled is not None:
+                        return KernelFuture(kernel = Kernel(compiled, arguments, nogil))
+
+            start  = time.time()
+            module = emit_module(emit_grouped, return_type, expand_argument_types(argument_types), nogil, target)
+
+            profile.record("emit", time.time() - start, module)
+
+            profile.hash = module_hash(module)
+            disk_key     = ("ir", profile.hash, level, target_key)
+
+            if key is None:
+                cache_key = disk_key
+
+                if cache is not None:
+                    compiled = cache.get(cache_key)
+
+                    if compiled is not None:
+                        return KernelFuture(kernel = Kernel(compiled, arguments, nogil))
+
+            # modules found on disk are already optimized
+            persistent = disk_cache is not None and not has_baked_addresses(module)
+
+            if persistent:
+                start  = time.time()
+                stored = disk_cache.load(disk_key)
+
+                profile.record("load", time.time() - start, stored)
+
+                if stored is not None:
+                    compiled = compile_module(stored, optimize = False, verify = False, target = target, profile = profile)
+
+                    if cache is not None:
+                        cache.put(cache_key, compiled)
+
+                    return KernelFuture(kernel = Kernel(compiled, arguments, nogil))
+
+            with profile.phase("verify", module):
+                module.verify()
+
+            async_result = self._pool.apply_async(optimize_bitcode, (module_to_bitcode(module), level, target))
+
+            return \
+                KernelFuture(
+                    async_result,
+                    arguments,
+                    level,
+                    target,
+                    cache_key,
+                    cache,
+                    profile,
+                    nogil      = nogil,
+                    disk_key   = disk_key,
+                    disk_cache = disk_cache if persistent else None,
+                    )
+
+        return decorator
+
+    def close(self):
+        """
+        Stop accepting work and wait for the workers to finish.
+        """
+
+        self._pool.close()
+        self._pool.join()
@@ -0,0 +1,557 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "Reduction",
+    "reduce_",
+    "reduce_sum",
+    "reduce_prod",
+    "reduce_min",
+    "reduce_max",
+    "reduce_argmin",
+    "reduce_argmax",
+    ]
+
+import qy
+import qy.llvm as llvm
+
+from qy.lowloop import (
+    is_static,
+    StridedArray,
+    StridedArrays,
+    )
+
+def scalar_type(type_):
+    """
+    Return the element type of a vector type, or the type itself.
+    """
+
+    if type_.kind == llvm.TYPE_VECTOR:
+        return type_.element
+    else:
+        return type_
+
+def is_real_type(type_):
+    """
+    Is this a floating-point LLVM type, or a vector of them?
+    """
+
+    return scalar_type(type_).kind in (llvm.TYPE_FLOAT, llvm.TYPE_DOUBLE)
+
+def constant(type_, number):
+    """
+    Return an LLVM constant of a scalar or vector type.
+    """
+
+    if type_.kind == llvm.TYPE_VECTOR:
+        return llvm.Constant.vector([constant(type_.element, number)] * type_.count)
+    elif is_real_type(type_):
+        return llvm.Constant.real(type_, number)
+    else:
+        return llvm.Constant.int(type_, number)
+
+def largest(type_):
+    """
+    Return the largest value of a type.
+    """
+
+    if is_real_type(type_):
+        return constant(type_, float("inf"))
+    else:
+        return constant(type_, 2**(scalar_type(type_).width - 1) - 1)
+
+def smallest(type_):
+    """
+    Return the smallest value of a type.
+    """
+
+    if is_real_type(type_):
+        return constant(type_, float("-inf"))
+    else:
+        return constant(type_, -2**(scalar_type(type_).width - 1))
+
+def minimum(a, b):
+    """
+    Emit IR to return the lesser of two values; nan is propagated.
+    """
+
+    if is_real_type(a.type_):
+        return qy.select((a <= b) | a.is_nan, a, b)
+    else:
+        return qy.select(a <= b, a, b)
+
+def maximum(a, b):
+    """
+    Emit IR to return the greater of two values; nan is propagated.
+    """
+
+    if is_real_type(a.type_):
+        return qy.select((a >= b) | a.is_nan, a, b)
+    else:
+        return qy.select(a >= b, a, b)
+
+def indexed_combine(better):
+    """
+    Build the combining function of an indexed reduction.
+
+    Of two (value, index) pairs, the better value wins; ties, and nan, go to
+    the earlier index, so that the first extreme element is found.
+    """
+
+    def combine(a, b):
+        """
+        Emit IR to combine two (value, index) pairs.
+        """
+
+        ((va, ia), (vb, ib)) = (a, b)
+
+        # indices compare unsigned, so that the -1 of the identity is last
+        earlier = qy.Value.from_low(qy.get().builder.icmp(llvm.ICMP_ULT, ib.low, ia.low))
+        take    = better(vb, va) | ((vb == va) & earlier)
+
+        if is_real_type(va.type_):
+            (na, nb) = (va.is_nan, vb.is_nan)
+            take     = (nb & (~na | earlier)) | (~na & ~nb & take)
+
+        return (qy.select(take, vb, va), qy.select(take, ib, ia))
+
+    return combine
+
+def entry_allocate(type_):
+    """
+    Stack-allocate a value in the entry block of the current function.
+
+    The allocation is then made once per call, even if emitted inside a loop,
+    and is promoted to a register by the optimizer.
+    """
+
+    language = qy.get()
+    entry    = language.function.entry_basic_block
+    builder  = llvm.Builder.new(entry)
+
+    builder.position_at_beginning(entry)
+
+    with language.this_builder(builder):
+        return qy.stack_allocate(type_)
+
+class Accumulator(object):
+    """
+    Stack slots holding one reduction state.
+    """
+
+    def __init__(self, types):
+        """
+        Initialize.
+        """
+
+        self._locations = map(entry_allocate, types)
+
+    def load(self):
+        """
+        Emit IR to load the state.
+        """
+
+        return tuple(l.load() for l in self._locations)
+
+    def store(self, state):
+        """
+        Emit IR to store the state.
+        """
+
+        for (value, location) in zip(state, self._locations):
+            qy.value_from_any(value).store(location)
+
+class Reduction(object):
+    """
+    Associative operation that reduces array elements along some axes.
+
+    The combining function receives two values and returns their
+    combination; if the reduction is indexed, it receives and returns (value,
+    index) pairs, and the reduction yields the index. The identity is a
+    number, or a function returning the identity value of an LLVM type. If
+    the operation is also commutative, reduced axes may be traversed in any
+    order.
+    """
+
+    def __init__(self, combine, identity, indexed = False, commutative = False):
+        """
+        Initialize.
+        """
+
+        self._combine     = combine
+        self._identity    = identity
+        self._indexed     = indexed
+        self._commutative = commutative
+
+    def emit(
+        self,
+        source,
+        axes         = None,
+        out          = None,
+        value        = None,
+        type_        = None,
+        accumulators = 4,
+        vector_width = None,
+        ):
+        """
+        Emit IR to reduce a strided array, or strided arrays, along axes.
+
+        The axes default to every axis; the result is then returned. If axes
+        remain, the results are stored to out, which must have their shape.
+        The reduced values are loaded from the source array or, for several
+        arrays, computed from their elements by the value function, which
+        receives rank-zero StridedArrays. They are converted to the given type
+        (by default, the source element type) before being combined.
+
+        Each row of the innermost reduced loop is split into contiguous
+        chunks, one per accumulator, which are reduced independently and
+        combined pairwise; rows are then combined in order. The combining
+        function therefore need only be associative. Only if the reduction is
+        commutative are the reduced axes nested by stride, as by
+        loop_order("auto"); otherwise, they are nested in axis order. If a
+        vector width is
+        given (or "auto"), unindexed reductions of rows that are contiguous
+        in memory hold vectors in their accumulators; the combining function
+        must then also be commutative and accept vectors. Reductions over no
+        elements yield the identity, or, if indexed, the index -1.
+        """
+
+        # argument sanity
+        if isinstance(source, StridedArray):
+            source = StridedArrays({"source" : source})
+
+        if value is None:
+            if len(source.arrays) != 1:
+                raise ValueError("a value function is required to reduce several arrays")
+
+            (key,) = source.arrays.keys()
+            value  = lambda a: a.arrays[key].data.load()
+
+        if type_ is None:
+            element_types = [a.element_type for a in source.arrays.values()]
+            type_         = element_types[0]
+
+            if any(t != type_ for t in element_types[1:]):
+                raise ValueError("a value type is required to reduce arrays of different types")
+        else:
+            type_ = qy.type_from_any(type_)
+
+        rank = min(len(a.shape) for a in source.arrays.values())
+
+        if axes is None:
+            axes = range(rank)
+        elif is_static(axes):
+            axes = [axes]
+
+        axes = [d % rank if -rank <= d < rank else d for d in axes]
+
+        if sorted(set(axes)) != sorted(axes) or not all(0 <= d < rank for d in axes):
+            raise ValueError("invalid reduction axes")
+
+        if accumulators < 1:
+            raise ValueError("reductions require at least one accumulator")
+
+        kept = [d for d in xrange(rank) if d not in axes]
+
+        if out is not None and len(out.shape) != len(kept):
+            raise ValueError("output array rank does not match the remaining axes")
+        elif out is None and kept:
+            raise ValueError("an output array is required to reduce only some axes")
+
+        # move the reduced axes last
+        def permuted(array):
+            order = kept + axes + range(rank, len(array.shape))
+
+            return array.view([array.shape[d] for d in order], [array.strides[d] for d in order])
+
+        arrays = StridedArrays((k, permuted(v)) for (k, v) in source.arrays.items())
+
+        def emit_result(inner):
+            """
+            Emit IR to reduce the trailing axes of rank-len(axes) arrays.
+            """
+
+            state = self._emit_reduced(inner, len(axes), value, type_, accumulators, vector_width)
+
+            if self._indexed:
+                return state[1]
+            else:
+                return state[0]
+
+        if not kept:
+            result = emit_result(arrays)
+
+            if out is not None:
+                result.cast_to(out.element_type).store(out.data)
+
+            return result
+        else:
+            out_key = ("reduction", "out")
+            nested  = dict(arrays.arrays)
+
+            nested[out_key] = out
+            nested          = StridedArrays(nested)
+
+            @nested.loop_all(axes = len(kept), order = "auto", collapse = True)
+            def _(l):
+                inner = StridedArrays((k, v) for (k, v) in l.arrays.items() if k != out_key)
+
+                emit_result(inner).cast_to(out.element_type).store(l.arrays[out_key].data)
+
+    def identity(self, type_):
+        """
+        Return the identity state for values of a type.
+        """
+
+        if callable(self._identity):
+            identity = self._identity(type_)
+        else:
+            identity = constant(type_, self._identity)
+
+        if self._indexed:
+            return (identity, llvm.Constant.int(qy.iptr_type, -1))
+        else:
+            return (identity,)
+
+    def combine(self, a, b):
+        """
+        Emit IR to combine two reduction states.
+        """
+
+        if self._indexed:
+            return tuple(self._combine(a, b))
+        else:
+            return (self._combine(a[0], b[0]),)
+
+    def combine_pairwise(self, states):
+        """
+        Emit IR to combine reduction states, in order, as a balanced tree.
+        """
+
+        states = list(states)
+
+        while len(states) > 1:
+            pairs  = [states[i:i + 2] for i in xrange(0, len(states), 2)]
+            states = [self.combine(*p) if len(p) == 2 else p[0] for p in pairs]
+
+        return states[0]
+
+    def _emit_reduced(self, arrays, axes, value, type_, accumulators, vector_width):
+        """
+        Emit IR to reduce the leading axes of arrays; return the state.
+        """
+
+        shape = list(min((a.shape for a in arrays.arrays.values()), key = len)[:axes])
+        order = arrays.loop_order(axes, "auto" if self._commutative else None)
+
+        if axes == 0:
+            return self._element(arrays, value, type_, [], [], 1)
+
+        # flat indices follow the listed axis order, whatever the loop order
+        multipliers = [1] * axes
+
+        if self._indexed:
+            extent = 1
+
+            for d in reversed(xrange(axes)):
+                multipliers[d] = extent
+
+                if is_static(shape[d]) and is_static(extent):
+                    extent = shape[d] * extent
+                else:
+                    extent = qy.value_from_any(shape[d]).cast_to(qy.iptr_type) * extent
+
+        # decide whether to vectorize
+        inner = shape[order[-1]]
+
+        if self._indexed or vector_width is None:
+            (width, contiguous) = (1, True)
+        else:
+            (width, contiguous) = arrays._vectorization(order, vector_width)
+
+            if is_static(inner) and inner < width * accumulators:
+                (width, contiguous) = (1, True)
+
+        if is_static(inner):
+            accumulators = max(1, min(accumulators, inner // width))
+
+        # allocate the running state
+        state_types = [type_] if not self._indexed else [type_, qy.iptr_type]
+        total       = Accumulator(state_types)
+        row         = Accumulator(state_types)
+        scalars     = [Accumulator(state_types) for _ in xrange(accumulators)]
+
+        if width > 1:
+            vectors = [Accumulator([llvm.Type.vector(type_, width)]) for _ in xrange(accumulators)]
+
+        def emit_row(indices, width):
+            """
+            Emit IR to reduce one row of the innermost loop.
+            """
+
+            if width > 1:
+                (slots, slot_type) = (vectors, llvm.Type.vector(type_, width))
+            else:
+                (slots, slot_type) = (scalars, type_)
+
+            def element_at(index, width):
+                """
+                Emit IR to return the state of one element of the row.
+                """
+
+                positions = indices + [index]
+                at_axes   = [positions[order.index(d)] for d in xrange(axes)]
+
+                return self._element(arrays, value, type_, at_axes, multipliers, width)
+
+            if is_static(inner):
+                chunk = inner // (width * accumulators)
+            else:
+                chunk = qy.value_from_any(inner) / (width * accumulators)
+
+            for slot in slots:
+                slot.store(self.identity(slot_type))
+
+            if not is_static(chunk) or chunk > 0:
+                @qy.for_(chunk)
+                def _(j):
+                    for (k, slot) in enumerate(slots):
+                        slot.store(self.combine(slot.load(), element_at((j + chunk * k) * width, width)))
+
+            states = [s.load() for s in slots]
+
+            if width > 1:
+                vector = self.combine_pairwise(states)[0]
+
+                row.store((vector.reduce(lambda a, b: self.combine((a,), (b,))[0]),))
+            else:
+                row.store(self.combine_pairwise(states))
+
+            # the remaining elements follow the last chunk
+            covered = chunk * width * accumulators
+
+            if not is_static(covered) or not is_static(inner) or covered < inner:
+                @qy.for_(inner, start = covered)
+                def _(index):
+                    row.store(self.combine(row.load(), element_at(index, 1)))
+
+            total.store(self.combine(total.load(), row.load()))
+
+        def emit_level(l, indices, width):
+            """
+            Emit IR for one level of the reduction loop.
+            """
+
+            if l == axes - 1:
+                emit_row(indices, width)
+            else:
+                @qy.for_(shape[order[l]])
+                def _(index):
+                    emit_level(l + 1, indices + [index], width)
+
+        def emit_all(width):
+            """
+            Emit IR for the entire reduction loop.
+            """
+
+            total.store(self.identity(type_))
+
+            emit_level(0, [], width)
+
+        if width > 1 and contiguous is not True:
+            # choose between vector and scalar rows at run time
+            @qy.if_else(contiguous)
+            def _(then):
+                emit_all(width if then else 1)
+        else:
+            emit_all(width)
+
+        return total.load()
+
+    def _element(self, arrays, value, type_, indices, multipliers, width):
+        """
+        Emit IR to return the state of one element, or vector of elements.
+        """
+
+        at = arrays.at_all(*indices)
+
+        if width > 1:
+            at    = at.as_vectors(width)
+            type_ = llvm.Type.vector(type_, width)
+
+        element = value(at).cast_to(type_)
+
+        if self._indexed:
+            flat = llvm.Constant.int(qy.iptr_type, 0)
+
+            for (index, multiplier) in zip(indices, multipliers):
+                flat = qy.value_from_any(index).cast_to(qy.iptr_type) * multiplier + flat
+
+            return (element, qy.value_from_any(flat))
+        else:
+            return (element,)
+
+sum_reduction    = Reduction(lambda a, b: a + b, 0, commutative = True)
+prod_reduction   = Reduction(lambda a, b: a * b, 1, commutative = True)
+min_reduction    = Reduction(minimum, largest, commutative = True)
+max_reduction    = Reduction(maximum, smallest, commutative = True)
+argmin_reduction = Reduction(indexed_combine(lambda a, b: a < b), largest, indexed = True, commutative = True)
+argmax_reduction = Reduction(indexed_combine(lambda a, b: a > b), smallest, indexed = True, commutative = True)
+
+def reduce_(source, combine, identity, axes = None, commutative = False, **options):
+    """
+    Emit IR to reduce arrays with a custom associative operation.
+
+    See Reduction for commutativity, and Reduction.emit() for the options.
+    """
+
+    return Reduction(combine, identity, commutative = commutative).emit(source, axes, **options)
+
+def reduce_sum(source, axes = None, **options):
+    """
+    Emit IR to sum arrays along axes.
+    """
+
+    return sum_reduction.emit(source, axes, **options)
+
+def reduce_prod(source, axes = None, **options):
+    """
+    Emit IR to multiply arrays along axes.
+    """
+
+    return prod_reduction.emit(source, axes, **options)
+
+def reduce_min(source, axes = None, **options):
+    """
+    Emit IR to find the minimum of arrays along axes; nan is propagated.
+    """
+
+    return min_reduction.emit(source, axes, **options)
+
+def reduce_max(source, axes = None, **options):
+    """
+    Emit IR to find the maximum of arrays along axes; nan is propagated.
+    """
+
+    return max_reduction.emit(source, axes, **options)
+
+def reduce_argmin(source, axes = None, **options):
+    """
+    Emit IR to find the flat index of the first minimum along axes.
+
+    Indices are flat in the listed order of the reduced axes; nan counts as
+    the minimum.
+    """
+
+    return argmin_reduction.emit(source, axes, **options)
+
+def reduce_argmax(source, axes = None, **options):
+    """
+    Emit IR to find the flat index of the first maximum along axes.
+
+    Indices are flat in the listed order of the reduced axes; nan counts as
+    the maximum.
+    """
+
+    return argmax_reduction.emit(source, axes, **options)
@@ -9,6 +9,7 @@ names_to_wrap = [
     "if_",
     "if_else",
     "for_",
+    "parallel_for",
     "select",
     "random",
     "random_int",
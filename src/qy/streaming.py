@@ -0,0 +1,260 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "run_chunked",
+    "stream",
+    ]
+
+import sys
+import mmap
+import Queue
+import ctypes
+import ctypes.util
+import threading
+import numpy
+
+MADV_WILLNEED = 3
+MADV_DONTNEED = 4
+
+def libc_madvise():
+    """
+    Return the C library's madvise(), or None if unavailable.
+    """
+
+    try:
+        madvise = ctypes.CDLL(ctypes.util.find_library("c"), use_errno = True).madvise
+    except (OSError, AttributeError):
+        return None
+
+    madvise.restype  = ctypes.c_int
+    madvise.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+
+    return madvise
+
+madvise = libc_madvise()
+
+def advise(array, advice):
+    """
+    Advise the operating system about the pages of a memory-mapped array.
+
+    Arrays that are not contiguous memory maps are left alone; so are all
+    arrays, where madvise() is unavailable. Returns True if advice was given.
+    """
+
+    if madvise is None or not isinstance(array, numpy.memmap):
+        return False
+    elif not array.flags.c_contiguous or array.nbytes == 0:
+        return False
+
+    (address, _) = array.__array_interface__["data"]
+    start        = address - address % mmap.PAGESIZE
+
+    return madvise(start, address + array.nbytes - start, advice) == 0
+
+def prefetch(arrays):
+    """
+    Read the pages of memory-mapped arrays into memory.
+
+    Each array that advise() accepts is advised with MADV_WILLNEED, then
+    touched once per page, so that the pages are faulted in here rather than
+    by the kernel that later reads them.
+    """
+
+    for array in arrays:
+        if advise(array, MADV_WILLNEED):
+            flat = numpy.asarray(array).reshape(-1).view(numpy.uint8)
+
+            flat[::mmap.PAGESIZE].max()
+            flat[-1]
+
+def open_input(input_):
+    """
+    Return an input array; paths to .npy files are memory-mapped.
+    """
+
+    if isinstance(input_, basestring):
+        return numpy.load(input_, mmap_mode = "r")
+    else:
+        return input_
+
+def open_output(output):
+    """
+    Return an output array; (path, dtype, shape) specifications are created
+    as memory-mapped .npy files.
+    """
+
+    if isinstance(output, tuple):
+        (path, dtype, shape) = output
+
+        return numpy.lib.format.open_memmap(path, mode = "w+", dtype = dtype, shape = shape)
+    else:
+        return output
+
+def run_chunked(kernel, inputs, outputs = (), state = (), chunk_bytes = 64 * 2**20, release = True):
+    """
+    Run a kernel over arrays in chunks along their first axis.
+
+    The kernel is called once per chunk, with views of each chunk of the
+    inputs and outputs, followed by the state arrays, which are passed whole
+    to every call; a reduction keeps its running value there. A dispatched
+    kernel (see qy.dispatch()) compiles a single variant, since only leading
+    extents vary between chunks.
+
+    Inputs may be ndarrays, memory maps, or paths to .npy files, which are
+    memory-mapped read-only. Outputs may be ndarrays, memory maps, or (path,
+    dtype, shape) tuples, which are created as memory-mapped .npy files.
+    Chunks hold about chunk_bytes of data, in all. While one chunk is
+    computed, a background thread reads the memory-mapped inputs of the next
+    one into memory; it runs alongside a nogil kernel, but otherwise only
+    while the kernel is not holding the interpreter lock. If release is
+    set, read-only input chunks are dropped from memory once computed, so
+    that datasets larger than memory stream through. Outputs are flushed at
+    the end, and returned in a list.
+    """
+
+    inputs  = map(open_input, inputs)
+    outputs = map(open_output, outputs)
+    state   = list(state)
+    chunked = inputs + outputs
+
+    if not chunked:
+        raise ValueError("at least one input or output array is required")
+
+    rows = chunked[0].shape[0]
+
+    for array in chunked:
+        if array.ndim == 0 or array.shape[0] != rows:
+            raise ValueError("chunked arrays must share their leading extent")
+
+    row_bytes = sum(a.itemsize * int(numpy.prod(a.shape[1:])) for a in chunked)
+    step      = max(1, chunk_bytes // max(1, row_bytes))
+    bounds    = [(i, min(i + step, rows)) for i in xrange(0, rows, step)]
+
+    prefetcher = None
+
+    try:
+        for (n, (start, stop)) in enumerate(bounds):
+            if prefetcher is not None:
+                prefetcher.join()
+
+                prefetcher = None
+
+            # read the next chunk ahead while this one is computed
+            if n + 1 < len(bounds):
+                (next_start, next_stop) = bounds[n + 1]
+
+                prefetcher = \
+                    threading.Thread(
+                        target = prefetch,
+                        args   = ([a[next_start:next_stop] for a in inputs],),
+                        name   = "qy-chunk-prefetch",
+                        )
+
+                prefetcher.daemon = True
+
+                prefetcher.start()
+
+            kernel(*([a[start:stop] for a in chunked] + state))
+
+            if release:
+                for array in inputs:
+                    if getattr(array, "mode", None) == "r":
+                        advise(array[start:stop], MADV_DONTNEED)
+    finally:
+        if prefetcher is not None:
+            prefetcher.join()
+
+    for array in outputs:
+        if isinstance(array, numpy.memmap):
+            array.flush()
+
+    return outputs
+
+def stream(kernel, blocks, outputs = (), state = (), queue_size = 2):
+    """
+    Run a kernel over each block of an iterator; yield the output blocks.
+
+    Each block is an ndarray, or a tuple of ndarrays, passed to the kernel
+    as its inputs, followed by the output arrays of that block and then the
+    state arrays, which are passed whole to every call; scans and
+    reductions carry their running values there. Outputs are given as
+    dtypes, each allocated with the shape of the first input, or as a
+    function of the inputs that returns the output arrays. Each step yields
+    the outputs, or the only output, of one block. A dispatched kernel (see
+    qy.dispatch()) compiles one variant for the block dtypes and ranks.
+
+    Blocks are pulled from the iterator by a background thread, at most
+    queue_size ahead of the consumer, so memory use stays bounded however
+    long the stream runs. A nogil kernel lets the producer work while it
+    runs.
+    """
+
+    pending = Queue.Queue(queue_size)
+    stopped = threading.Event()
+    done    = object()
+
+    def put(item):
+        """
+        Queue an item unless the consumer has gone; return False if it has.
+        """
+
+        while not stopped.is_set():
+            try:
+                pending.put(item, timeout = 0.1)
+            except Queue.Full:
+                continue
+            else:
+                return True
+
+        return False
+
+    def produce():
+        """
+        Pull blocks from the iterator into the queue.
+        """
+
+        try:
+            for block in blocks:
+                if not put((block, None)):
+                    return
+        except:
+            put((None, sys.exc_info()))
+        else:
+            put((done, None))
+
+    producer = threading.Thread(target = produce, name = "qy-stream-producer")
+
+    producer.daemon = True
+
+    producer.start()
+
+    try:
+        while True:
+            (block, error) = pending.get()
+
+            if error is not None:
+                raise error[0], error[1], error[2]
+            elif block is done:
+                break
+
+            if isinstance(block, tuple):
+                inputs = list(block)
+            else:
+                inputs = [block]
+
+            if callable(outputs):
+                arrays = list(outputs(*inputs))
+            else:
+                arrays = [numpy.empty(inputs[0].shape, d) for d in outputs]
+
+            kernel(*(inputs + arrays + list(state)))
+
+            if len(arrays) == 1:
+                yield arrays[0]
+            else:
+                yield tuple(arrays)
+    finally:
+        # the producer may be blocked in the iterator; it is not waited for
+        stopped.set()
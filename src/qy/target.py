@@ -0,0 +1,192 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "Target",
+    "host_cpu_name",
+    "host_cpu_features",
+    ]
+
+import qy.llvm as llvm
+
+# Linux /proc/cpuinfo flags, and the corresponding LLVM x86 features
+cpuinfo_features = {
+    "sse"      : "sse",
+    "sse2"     : "sse2",
+    "pni"      : "sse3",
+    "ssse3"    : "ssse3",
+    "sse4_1"   : "sse4.1",
+    "sse4_2"   : "sse4.2",
+    "popcnt"   : "popcnt",
+    "avx"      : "avx",
+    "avx2"     : "avx2",
+    "fma"      : "fma",
+    "f16c"     : "f16c",
+    "bmi1"     : "bmi",
+    "bmi2"     : "bmi2",
+    "abm"      : "lzcnt",
+    "movbe"    : "movbe",
+    "avx512f"  : "avx512f",
+    "avx512cd" : "avx512cd",
+    "avx512bw" : "avx512bw",
+    "avx512dq" : "avx512dq",
+    "avx512vl" : "avx512vl",
+    }
+
+def host_cpu_name():
+    """
+    Return the LLVM name of the host CPU, or "" if it cannot be determined.
+    """
+
+    get_name = getattr(llvm, "get_host_cpu_name", None)
+
+    if get_name is None:
+        return ""
+    else:
+        return get_name()
+
+def host_cpu_features():
+    """
+    Return the sorted list of LLVM features supported by the host CPU.
+    """
+
+    flags = set()
+
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("flags"):
+                    flags = set(line.split(":", 1)[1].split())
+
+                    break
+    except IOError:
+        pass
+
+    return sorted(cpuinfo_features[f] for f in flags if f in cpuinfo_features)
+
+def vector_bits_for(features):
+    """
+    Return the widest vector register size implied by a feature list.
+    """
+
+    if "avx512f" in features:
+        return 512
+    elif "avx" in features:
+        return 256
+    elif "sse2" in features:
+        return 128
+    else:
+        return None
+
+class Target(object):
+    """
+    Code generation target: CPU, features, and vectorization hints.
+
+    A CPU of "host" selects the host CPU and, unless features are given, its
+    detected features. An empty CPU name selects LLVM's generic CPU.
+    """
+
+    def __init__(self, cpu = "host", features = None, vector_bits = None):
+        """
+        Initialize.
+
+        @param cpu         : LLVM CPU name, "host", or "".
+        @param features    : List of LLVM features, with or without +/- signs.
+        @param vector_bits : Preferred vector register width, in bits.
+        """
+
+        if cpu == "host":
+            cpu = host_cpu_name()
+
+            if features is None:
+                features = host_cpu_features()
+
+        if features is None:
+            features = []
+        elif isinstance(features, basestring):
+            features = [f for f in features.split(",") if f]
+
+        self._cpu         = cpu
+        self._features    = [f if f[0] in "+-" else "+" + f for f in features]
+        self._vector_bits = vector_bits
+
+    def __repr__(self):
+        """
+        Return a parseable string representation of this target.
+        """
+
+        return "Target(%r, %r, %r)" % (self._cpu, self._features, self._vector_bits)
+
+    def machine(self, reloc = None):
+        """
+        Build an LLVM target machine for this target.
+        """
+
+        if reloc is None:
+            reloc = llvm.RELOC_DEFAULT
+
+        return llvm.TargetMachine.new(cpu = self._cpu, features = self.feature_string, reloc = reloc)
+
+    def vector_width(self, type_):
+        """
+        Return the preferred number of vector lanes for an LLVM scalar type.
+        """
+
+        from qy import size_of_type
+
+        if self.vector_bits is None:
+            return 1
+        else:
+            return max(1, self.vector_bits // (size_of_type(type_) * 8))
+
+    @property
+    def cpu(self):
+        """
+        The LLVM CPU name.
+        """
+
+        return self._cpu
+
+    @property
+    def features(self):
+        """
+        The enabled LLVM features, without signs.
+        """
+
+        return [f[1:] for f in self._features if f[0] == "+"]
+
+    @property
+    def feature_string(self):
+        """
+        The LLVM feature string.
+        """
+
+        return ",".join(self._features)
+
+    @property
+    def vector_bits(self):
+        """
+        The preferred vector register width, in bits, or None.
+        """
+
+        if self._vector_bits is None:
+            return vector_bits_for(self.features)
+        else:
+            return self._vector_bits
+
+    @property
+    def signature(self):
+        """
+        A string identifying this target, for use in cache keys.
+        """
+
+        return "%s;%s;%s" % (self._cpu, self.feature_string, self._vector_bits)
+
+    @staticmethod
+    def host(vector_bits = None):
+        """
+        Return the host target.
+        """
+
+        return Target("host", vector_bits = vector_bits)
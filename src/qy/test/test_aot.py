@@ -0,0 +1,82 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+import os.path
+import shutil
+import tempfile
+import numpy
+import qy
+
+from nose.tools import (
+    assert_equal,
+    assert_raises,
+    )
+
+def test_shared_library_build_and_load():
+    """
+    Test ahead-of-time compilation and loading of kernels.
+    """
+
+    from qy import (
+        SharedLibrary,
+        StridedArrayArgument,
+        load_library,
+        )
+
+    library = SharedLibrary("test")
+
+    @library.kernel(float, [float, float])
+    def add(x, y):
+        qy.return_(x + y)
+
+    @library.kernel(argument_types = [StridedArrayArgument(float, 1)] * 2)
+    def double(in_, out):
+        arrays = qy.StridedArrays({"in" : in_, "out" : out})
+
+        @arrays.loop_all()
+        def _(l):
+            (l.arrays["in"].data.load() * 2.0).store(l.arrays["out"].data)
+
+    @library.kernel(float, [float])
+    def halve(x):
+        qy.assert_(x >= 0.0, "negative input")
+        qy.return_(x * 0.5)
+
+    path = tempfile.mkdtemp()
+
+    try:
+        library_path = os.path.join(path, "libtest.so")
+
+        library.build(library_path)
+
+        loaded = load_library(library_path)
+        in_    = numpy.arange(8.0)
+        out    = numpy.empty(8)
+
+        loaded.double(in_, out)
+
+        assert_equal(loaded.add(1.0, 2.5), 3.5)
+        assert_equal(out.tolist(), (in_ * 2.0).tolist())
+        assert_equal(loaded.halve(4.0), 2.0)
+        assert_raises(AssertionError, lambda: loaded.double(in_, numpy.empty(4)))
+        assert_raises(AssertionError, lambda: loaded.halve(-1.0))
+        assert_equal(loaded.halve(9.0), 4.5)
+    finally:
+        shutil.rmtree(path)
+
+def test_shared_library_rejects_addresses():
+    """
+    Test that kernels embedding process addresses are rejected.
+    """
+
+    from qy import SharedLibrary
+
+    library = SharedLibrary("test")
+    array   = numpy.arange(4.0)
+
+    @library.kernel()
+    def baked():
+        qy.StridedArray.from_numpy(array).at(0).data.load()
+
+    assert_raises(ValueError, library.emit_modules)
@@ -0,0 +1,73 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+import numpy
+import qy
+
+from nose.tools import (
+    assert_equal,
+    assert_raises,
+    )
+
+def emit_scale(in_, out, factor):
+    """
+    Emit an elementwise scaling loop.
+    """
+
+    arrays = qy.StridedArrays({"in" : in_, "out" : out})
+
+    @arrays.loop_all()
+    def _(l):
+        (l.arrays["in"].data.load() * factor).store(l.arrays["out"].data)
+
+def assert_scaling_ok(kernel, shape):
+    """
+    Assert that a dispatched scaling kernel is correct for a shape.
+    """
+
+    in_ = numpy.random.rand(*shape)
+    out = numpy.empty(shape)
+
+    kernel(in_, out, 2.0)
+
+    assert_equal(out.tolist(), (in_ * 2.0).tolist())
+
+def test_dispatch_dynamic():
+    """
+    Test that the dynamic policy compiles one variant per rank.
+    """
+
+    kernel = qy.dispatch("dynamic")(emit_scale)
+
+    for shape in [(2, 3), (4, 5), (6,)]:
+        assert_scaling_ok(kernel, shape)
+
+    assert_equal(len(kernel.variants), 2)
+    assert_equal(len(kernel.specialized), 0)
+
+def test_dispatch_static():
+    """
+    Test that the static policy compiles one variant per shape.
+    """
+
+    kernel = qy.dispatch("static")(emit_scale)
+
+    for shape in [(2, 3), (4, 5), (2, 3)]:
+        assert_scaling_ok(kernel, shape)
+
+    assert_equal(len(kernel.specialized), 2)
+
+def test_dispatch_adaptive():
+    """
+    Test that the adaptive policy specializes only frequent shapes.
+    """
+
+    kernel = qy.dispatch("adaptive", specialize_after = 3)(emit_scale)
+
+    for shape in [(2, 3)] * 4 + [(4, 5)] * 2:
+        assert_scaling_ok(kernel, shape)
+
+    assert_equal(len(kernel.specialized), 1)
+    assert_equal(len(kernel.variants), 2)
+    assert_raises(ValueError, lambda: qy.dispatch("sometimes")(emit_scale))
@@ -0,0 +1,110 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+import numpy
+import qy
+
+from nose.tools import (
+    assert_equal,
+    assert_almost_equal,
+    )
+from qy.fusion  import (
+    select,
+    fused_dispatchers,
+    )
+
+def test_fusion_elementwise():
+    """
+    Test fused elementwise expressions, with broadcasting and promotion.
+    """
+
+    x = numpy.random.rand(4, 7)
+    y = numpy.random.rand(7).astype(numpy.float32)
+    n = numpy.random.randint(10, size = (4, 1))
+
+    for width in [None, 4]:
+        expression = select(qy.lazy(x) > 0.5, (qy.lazy(x) * y + n).log(), -qy.lazy(x).exp())
+        result     = expression.evaluate(vector_width = width)
+
+        assert_equal(expression.dtype, numpy.float64)
+        numpy.testing.assert_allclose(result, numpy.where(x > 0.5, numpy.log(x * y + n), -numpy.exp(x)))
+
+    # kernels are reused for the same structure and signature
+    compiled = len(fused_dispatchers)
+
+    select(qy.lazy(x) > 0.5, (qy.lazy(x) * y + n).log(), -qy.lazy(x).exp()).evaluate()
+
+    assert_equal(len(fused_dispatchers), compiled)
+
+    # scalar constants are kernel arguments, not part of the structure
+    for c in [1.0, 2.5, -3.0]:
+        numpy.testing.assert_allclose((qy.lazy(x) * c + 1).evaluate(), x * c + 1)
+
+    compiled = len(fused_dispatchers)
+
+    assert_equal((qy.lazy(x) * 4.0 + 1).evaluate().tolist(), (x * 4.0 + 1).tolist())
+    assert_equal(len(fused_dispatchers), compiled)
+
+    # comparisons yield booleans
+    assert_equal((qy.lazy(n) >= 5).evaluate().tolist(), (n >= 5).tolist())
+
+def test_fusion_types():
+    """
+    Test integer division and single-precision functions.
+    """
+
+    from nose.tools import assert_raises
+
+    m = numpy.array([-7, -6, -1, 0, 1, 6, 7])
+    d = numpy.array([2, -2, 3, -3, 2, -4, -3])
+
+    for width in [None, 4]:
+        assert_equal((qy.lazy(m) / d).evaluate(vector_width = width).tolist(), (m // d).tolist())
+        assert_equal((qy.lazy(m) // 2).evaluate(vector_width = width).tolist(), (m // 2).tolist())
+        assert_equal((qy.lazy(m.astype(numpy.uint32)) // 3).evaluate(vector_width = width).tolist(), (m.astype(numpy.uint32) // 3).tolist())
+
+    assert_raises(TypeError, lambda: qy.lazy(numpy.random.rand(3)) // 2.0)
+
+    # division by zero yields zero, as in NumPy, without trapping
+    z = numpy.array([0, 2, 0, -1])
+    u = numpy.array([6, 7], numpy.uint32)
+
+    for width in [None, 4]:
+        assert_equal((qy.lazy(m[:4]) // z).evaluate(vector_width = width).tolist(), [0, -3, 0, 0])
+        assert_equal((qy.lazy(m[:4]) / z).evaluate(vector_width = width).tolist(), [0, -3, 0, 0])
+        assert_equal((qy.lazy(u) // numpy.array([0, 3], numpy.uint32)).evaluate(vector_width = width).tolist(), [0, 2])
+
+    # single-precision operands stay in single precision
+    x = numpy.random.rand(9).astype(numpy.float32)
+
+    result = qy.lazy(x).exp().log().evaluate()
+
+    assert_equal(result.dtype, numpy.float32)
+    numpy.testing.assert_allclose(result, x, rtol = 1e-5)
+
+def test_fusion_reductions():
+    """
+    Test reductions over fused expressions, and nested reductions.
+    """
+
+    x = numpy.random.rand(5, 9)
+
+    assert_almost_equal((qy.lazy(x) * 2.0 + 1.0).sum().evaluate(), (x * 2.0 + 1.0).sum())
+    assert_almost_equal(qy.lazy(x).sum().evaluate(), x.sum())
+    numpy.testing.assert_allclose((qy.lazy(x) * x).sum(1).evaluate(), (x * x).sum(1))
+    assert_equal(qy.lazy(x).argmax(0).evaluate().tolist(), x.argmax(0).tolist())
+
+    # nested reductions are computed first, then broadcast
+    centered = (qy.lazy(x) - qy.lazy(x).sum(1, keepdims = True) / 9.0).evaluate()
+
+    numpy.testing.assert_allclose(centered, x - x.mean(1)[:, None])
+
+    # small integers and booleans accumulate in the default integer type
+    b = numpy.arange(100, 128).astype(numpy.int8)
+    u = numpy.array([200, 250], numpy.uint8)
+
+    assert_equal(qy.lazy(b).sum().dtype, b.sum().dtype)
+    assert_equal(qy.lazy(b).sum().evaluate(), b.sum())
+    assert_equal(qy.lazy(u).sum().evaluate(), 450)
+    assert_equal((qy.lazy(x) > 0.5).sum().evaluate(), (x > 0.5).sum())
@@ -0,0 +1,171 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+import ctypes
+import qy
+
+from nose.tools import (
+    assert_true,
+    assert_equal,
+    assert_raises,
+    )
+from qy import compile_kernel
+
+def test_compile_kernel_reuse():
+    """
+    Test repeated calls to a compiled kernel.
+    """
+
+    emitted = []
+
+    @compile_kernel(float, [float, int])
+    def kernel(x, n):
+        emitted.append(True)
+
+        qy.return_(x * n.cast_to(float) + 1.0)
+
+    for i in xrange(8):
+        assert_equal(kernel(0.5, i), 0.5 * i + 1.0)
+
+    assert_equal(len(emitted), 1)
+
+def test_compile_kernel_void():
+    """
+    Test a kernel without a return value.
+    """
+
+    seen = []
+
+    @compile_kernel(argument_types = [ctypes.c_int])
+    def kernel(n):
+        @qy.for_(n)
+        def _(i):
+            @qy.python(i)
+            def _(i_py):
+                seen.append(i_py)
+
+    kernel(3)
+    kernel(2)
+
+    assert_equal(seen, [0, 1, 2, 0, 1])
+
+def test_compile_kernel_exception():
+    """
+    Test exception propagation out of a compiled kernel.
+    """
+
+    class ExpectedException(Exception):
+        pass
+
+    @compile_kernel(int, [int])
+    def kernel(n):
+        @qy.if_(n == 0)
+        def _():
+            @qy.python()
+            def _():
+                raise ExpectedException()
+
+        qy.return_(n)
+
+    assert_equal(kernel(4), 4)
+    assert_raises(ExpectedException, lambda: kernel(0))
+
+def test_compile_kernel_nogil():
+    """
+    Test native assertion failures, and refused Python calls, without the GIL.
+    """
+
+    import numpy
+
+    from qy import (
+        EmittedAssertionError,
+        StridedArrays,
+        StridedArrayArgument,
+        )
+
+    argument = StridedArrayArgument(float, 1)
+
+    @compile_kernel(argument_types = [argument, argument], nogil = True)
+    def kernel(in_, out):
+        arrays = StridedArrays({"in" : in_, "out" : out})
+
+        @arrays.loop_all()
+        def _(l):
+            l.arrays["in"].data.load().store(l.arrays["out"].data)
+
+    in_ = numpy.random.rand(5)
+    out = numpy.empty(5)
+
+    kernel(in_, out)
+
+    assert_equal(out.tolist(), in_.tolist())
+    assert_raises(EmittedAssertionError, lambda: kernel(in_, numpy.empty(4)))
+
+    # the failure does not outlive its call
+    kernel(in_, out)
+
+    def emit_python(n):
+        @qy.python(n)
+        def _(n_py):
+            pass
+
+    assert_raises(TypeError, lambda: compile_kernel(argument_types = [int], nogil = True)(emit_python))
+
+def test_compile_pool():
+    """
+    Test background compilation of several kernels.
+    """
+
+    from qy import CompilePool
+
+    with CompilePool(2) as pool:
+        futures = []
+
+        for k in xrange(4):
+            @pool.compile_kernel(float, [float], cache = None)
+            def future(x):
+                qy.return_(x * float(k))
+
+            futures.append(future)
+
+        for (k, future) in enumerate(futures):
+            assert_equal(future.result()(2.0), 2.0 * k)
+            assert_equal(future.result(), future.result())
+
+        # the remaining compile_kernel() options are honored
+        from qy import KernelCache
+
+        cache   = KernelCache()
+        emitted = []
+
+        for _ in xrange(2):
+            @pool.compile_kernel(float, [float], cache = cache, key = "pool-double", nogil = True)
+            def future(x):
+                emitted.append(True)
+
+                qy.return_(x * 2.0)
+
+            assert_equal(future.result()(3.0), 6.0)
+            assert_true(future.result().nogil)
+
+        assert_equal(len(emitted), 1)
+
+def test_compile_kernel_target():
+    """
+    Test kernel compilation for an explicit target.
+    """
+
+    from qy import Target
+
+    assert_equal(Target("", "+avx2,sse4.2").feature_string, "+avx2,+sse4.2")
+    assert_equal(Target("", ["avx"]).vector_bits, 256)
+
+    target = Target.host()
+
+    @compile_kernel(float, [float], cache = None, target = target)
+    def kernel(x):
+        qy.return_(x * 2.0)
+
+    assert_equal(kernel(3.0), 6.0)
+    assert_equal(kernel.target.features, target.features)
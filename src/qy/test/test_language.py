@@ -170,6 +170,117 @@ def test_qy_for_():
 
     assert_equal(iterations[0], count)
 
+def test_qy_for_ranged():
+    """
+    Test for_() loops with start, step, and index width.
+    """
+
+    for (start, stop, step) in [(3, 11, 1), (2, 17, 4), (10, -1, -3), (5, 5, 1)]:
+        seen = []
+
+        @emit_and_execute()
+        def _():
+            @qy.for_(stop, start = start, step = step, width = 64)
+            def _(i):
+                assert_equal(i.type_.width, 64)
+
+                @qy.python(i)
+                def _(i_py):
+                    seen.append(i_py)
+
+        assert_equal(seen, range(start, stop, step))
+
+    assert_raises(ValueError, lambda: qy.Qy().for_(8, step = 0))
+
+def test_qy_for_hints():
+    """
+    Test emission of loop hints as llvm.loop metadata.
+    """
+
+    from qy import emit_module
+
+    def emit():
+        @qy.for_(1024, vectorize_width = 4, unroll_count = 2)
+        def _(_):
+            pass
+
+    module = str(emit_module(emit))
+
+    assert_true("llvm.loop" in module)
+    assert_true("llvm.loop.vectorize.width" in module)
+    assert_true("llvm.loop.unroll.count" in module)
+    assert_false("llvm.loop.interleave.count" in module)
+
+    # equivalent modules have identical IR
+    assert_equal(str(emit_module(emit)), module)
+
+def test_qy_parallel_for():
+    """
+    Test the qy parallel_for() loop construct.
+    """
+
+    from qy import (
+        compile_kernel,
+        StridedArrayArgument,
+        )
+
+    for schedule in ["static", "dynamic"]:
+        for chunk in [None, 3]:
+            @compile_kernel(argument_types = [StridedArrayArgument(float, 1)], nogil = True)
+            def kernel(out):
+                @qy.parallel_for(out.shape[0], start = 1, arguments = [out.data], schedule = schedule, chunk = chunk, threads = 4)
+                def _(i, data):
+                    (i.cast_to(float) * 2.0).store(data.gep(i))
+
+            out = numpy.zeros(103)
+
+            kernel(out)
+
+            assert_equal(out.tolist(), [0.0] + [i * 2.0 for i in xrange(1, 103)])
+
+    # parallel functions are named per module, so equal kernels share a cache entry
+    from qy import KernelCache
+
+    cache = KernelCache()
+
+    for _ in xrange(2):
+        @compile_kernel(argument_types = [StridedArrayArgument(float, 1)], cache = cache)
+        def kernel(out):
+            @qy.parallel_for(out.shape[0], arguments = [out.data])
+            def _(i, data):
+                i.cast_to(float).store(data.gep(i))
+
+    assert_equal((cache.misses, cache.hits), (1, 1))
+
+    # failed assertions in the body are raised by the calling thread
+    from qy import EmittedAssertionError
+
+    for nogil in [False, True]:
+        @compile_kernel(argument_types = [StridedArrayArgument(float, 1)], nogil = nogil)
+        def kernel(out):
+            @qy.parallel_for(out.shape[0], arguments = [out.data], threads = 4)
+            def _(i, data):
+                qy.assert_(i < 50, "index out of range")
+
+                i.cast_to(float).store(data.gep(i))
+
+        kernel(numpy.zeros(50))
+
+        with assert_raises(EmittedAssertionError):
+            kernel(numpy.zeros(103))
+
+        kernel(numpy.zeros(7))
+
+    # the body cannot call into Python
+    def emit(out):
+        @qy.parallel_for(out.shape[0], arguments = [out.data])
+        def _(i, data):
+            @qy.python()
+            def _():
+                pass
+
+    assert_raises(TypeError, lambda: compile_kernel(argument_types = [StridedArrayArgument(float, 1)])(emit))
+
 def test_qy_break_():
     """
     Test the qy break_() statement.
@@ -433,6 +544,30 @@ def test_qy_real_neg():
             assert_equal(a_py, -3)
             assert_equal(b_py, 5)
 
+def test_qy_real_float32():
+    """
+    Test single-precision real values, and casts between real types.
+    """
+
+    import qy.llvm as llvm
+
+    @emit_and_execute()
+    def _():
+        x = qy.value_from_any(1.5).cast_to(numpy.float32)
+        y = x * 2.0 + 1
+        z = y.cast_to(float)
+
+        assert_true(isinstance(x, qy.RealValue))
+        assert_true(x.cast_to(numpy.float32) is x)
+        assert_true(z.cast_to(float) is z)
+        assert_equal(y.type_.kind, llvm.TYPE_FLOAT)
+        assert_equal(z.type_.kind, llvm.TYPE_DOUBLE)
+
+        @qy.python(y, z)
+        def _(y_py, z_py):
+            assert_equal(y_py, 4.0)
+            assert_equal(z_py, 4.0)
+
 def test_qy_integer_mod():
     """
     Test the integer modulo operation.
@@ -5,7 +5,10 @@
 import numpy
 import qy
 
-from nose.tools import assert_equal
+from nose.tools import (
+    assert_equal,
+    assert_raises,
+    )
 from qy         import (
     emit_and_execute,
     StridedArray,
@@ -75,6 +78,39 @@ def test_strided_arrays_loop_all_views():
     # verify correctness
     assert_copying_ok(foo, bar, baz)
 
+def test_strided_arrays_loop_all_negative_strides():
+    """
+    Test strided-array loop compilation on reversed and overlapping views.
+    """
+
+    from numpy.lib.stride_tricks import as_strided
+
+    # reversed views
+    foo = numpy.random.randint(10, size = (4, 6))
+    bar = numpy.empty((4, 6), numpy.int)[::-1]
+
+    assert_copying_ok(foo[::-1, ::-2], bar[:, :3], foo[::-1, ::-2])
+
+    # overlapping windows
+    baz = numpy.random.randint(10, size = 8)
+    qux = as_strided(baz, (6, 3), (baz.itemsize, baz.itemsize))
+
+    assert_copying_ok(qux, numpy.empty((6, 3), numpy.int), numpy.array(qux))
+
+    # broadcast reversed views
+    (shape, (a, b)) = qy.semicast((foo[::-1], None), (baz[:6][::-1], None))
+    out             = numpy.empty(shape, numpy.int)
+
+    @emit_and_execute()
+    def _():
+        arrays = StridedArrays.from_numpy({"a" : a, "b" : b, "out" : out})
+
+        @arrays.loop_all()
+        def _(l):
+            (l.arrays["a"].data.load() + l.arrays["b"].data.load()).store(l.arrays["out"].data)
+
+    assert_equal(out.tolist(), (foo[::-1] + baz[:6][::-1]).tolist())
+
 def test_strided_arrays_loop_all_subarrays():
     """
     Test strided-array loop compilation on subarrays.
@@ -105,6 +141,59 @@ def test_strided_arrays_loop_all_subarrays():
 
     assert_equal(bar[1].tolist(), baz.tolist())
 
+def test_strided_array_slice():
+    """
+    Test strided views with static slice bounds.
+    """
+
+    foo = numpy.random.randint(10, size = (8, 6))
+
+    for keys in [(slice(1, 7, 2),), (slice(None), 4), (slice(-2, None, -3), slice(None, None, -1))]:
+        bar = numpy.empty(foo[keys].shape, numpy.int)
+
+        @emit_and_execute()
+        def _():
+            arrays = \
+                StridedArrays({
+                    "in"  : StridedArray.from_numpy(foo)[keys],
+                    "out" : StridedArray.from_numpy(bar),
+                    })
+
+            @arrays.loop_all()
+            def _(l):
+                l.arrays["in"].data.load().store(l.arrays["out"].data)
+
+        assert_equal(bar.tolist(), foo[keys].tolist())
+
+def test_strided_array_slice_dynamic():
+    """
+    Test strided views with slice bounds known only at run time.
+    """
+
+    from qy import (
+        compile_kernel,
+        StridedArrayArgument,
+        )
+
+    argument = StridedArrayArgument(float, 1)
+
+    @compile_kernel(argument_types = [argument, argument, long, long])
+    def kernel(in_, out, start, stop):
+        arrays = StridedArrays({"in" : in_[start:stop:2], "out" : out})
+
+        @arrays.loop_all()
+        def _(l):
+            l.arrays["in"].data.load().store(l.arrays["out"].data)
+
+    foo = numpy.random.rand(20)
+
+    for (start, stop) in [(3, 17), (-9, 100), (0, 1), (12, 4)]:
+        bar = numpy.empty_like(foo[start:stop:2])
+
+        kernel(foo, bar, start, stop)
+
+        assert_equal(bar.tolist(), foo[start:stop:2].tolist())
+
 def test_strided_array_extract():
     """
     Test strided-array loop compilation on extracted member arrays.
@@ -159,3 +248,328 @@ def test_strided_array_at_complex_dtype():
             assert_equal(at0_py, array[0].__array_interface__["data"][0])
             assert_equal(at1_py, array[1].__array_interface__["data"][0])
 
+
+def test_strided_array_argument():
+    """
+    Test a kernel bound to arrays at call time.
+    """
+
+    from qy import (
+        compile_kernel,
+        StridedArrayArgument,
+        )
+
+    emitted  = []
+    argument = StridedArrayArgument(float, 2)
+
+    @compile_kernel(argument_types = [argument, argument])
+    def kernel(in_, out):
+        emitted.append(True)
+
+        arrays = StridedArrays({"in" : in_, "out" : out})
+
+        @arrays.loop_all()
+        def _(l):
+            (l.arrays["in"].data.load() + 1.0).store(l.arrays["out"].data)
+
+    for shape in [(2, 4), (3, 5), (1, 7)]:
+        in_ = numpy.random.rand(*shape)
+        out = numpy.empty(shape)
+
+        kernel(in_, out)
+
+        assert_equal(out.tolist(), (in_ + 1.0).tolist())
+
+    # a transposed view has different strides
+    in_ = numpy.random.rand(4, 3)
+    out = numpy.empty((3, 4))
+
+    kernel(in_.T, out)
+
+    assert_equal(out.tolist(), (in_.T + 1.0).tolist())
+    assert_equal(len(emitted), 1)
+
+def test_strided_array_argument_static():
+    """
+    Test a kernel with compiled-in array shape and strides.
+    """
+
+    from nose.tools import assert_raises
+    from qy         import (
+        compile_kernel,
+        StridedArrayArgument,
+        )
+
+    in_ = numpy.random.rand(2, 3)
+    out = numpy.empty_like(in_)
+
+    argument = StridedArrayArgument.from_numpy(in_, static = True)
+
+    @compile_kernel(argument_types = [argument, argument])
+    def kernel(in_, out):
+        arrays = StridedArrays({"in" : in_, "out" : out})
+
+        @arrays.loop_all()
+        def _(l):
+            l.arrays["in"].data.load().store(l.arrays["out"].data)
+
+    kernel(in_, out)
+
+    assert_equal(out.tolist(), in_.tolist())
+    assert_raises(ValueError, lambda: kernel(numpy.random.rand(3, 2), out))
+
+def test_strided_array_argument_affine():
+    """
+    Test a kernel using the affine layout with compiled-in strides.
+    """
+
+    from nose.tools import assert_raises
+    from qy         import (
+        compile_kernel,
+        StridedArrayArgument,
+        )
+
+    in_ = numpy.random.rand(4, 6)[:, ::2]
+    out = numpy.empty((3, 4)).T
+
+    argument_types = [
+        StridedArrayArgument.from_numpy(in_, static = True, affine = True),
+        StridedArrayArgument.from_numpy(out, static = True, affine = True),
+        ]
+    layouts        = []
+
+    @compile_kernel(argument_types = argument_types)
+    def kernel(in_, out):
+        layouts.append((in_.affine, out.affine))
+
+        arrays = StridedArrays({"in" : in_, "out" : out})
+
+        @arrays.loop_all()
+        def _(l):
+            (l.arrays["in"].data.load() + 1.0).store(l.arrays["out"].data)
+
+    kernel(in_, out)
+
+    assert_equal(out.tolist(), (in_ + 1.0).tolist())
+    assert_equal(layouts, [(True, True)])
+
+    # the nested layout cannot hold emitted strides
+    nested = StridedArrayArgument(float, 2, affine = False)
+
+    assert_raises(ValueError, lambda: compile_kernel(argument_types = [nested])(lambda in_: None))
+
+def test_strided_arrays_loop_all_vectorized():
+    """
+    Test vectorized strided-array loops, with a scalar epilogue.
+    """
+
+    from qy import (
+        compile_kernel,
+        StridedArrayArgument,
+        )
+
+    for width in [2, 4, "auto"]:
+        in_ = numpy.random.rand(3, 13)
+        out = numpy.empty((3, 13))
+
+        @emit_and_execute()
+        def _():
+            arrays = StridedArrays.from_numpy({"in" : in_, "out" : out})
+
+            @arrays.loop_all(vector_width = width)
+            def _(l):
+                (l.arrays["in"].data.load() * 2.0 + 1.0).store(l.arrays["out"].data)
+
+        assert_equal(out.tolist(), (in_ * 2.0 + 1.0).tolist())
+
+    # strides known only at run time select the loop when called
+    argument = StridedArrayArgument(float, 2)
+
+    @compile_kernel(argument_types = [argument, argument])
+    def kernel(in_, out):
+        arrays = StridedArrays({"in" : in_, "out" : out})
+
+        @arrays.loop_all(vector_width = 4)
+        def _(l):
+            (l.arrays["in"].data.load() - 1.0).store(l.arrays["out"].data)
+
+    for in_ in [numpy.random.rand(5, 9), numpy.random.rand(9, 5).T, numpy.random.rand(2, 3)]:
+        out = numpy.empty(in_.shape)
+
+        kernel(in_, out)
+
+        assert_equal(out.tolist(), (in_ - 1.0).tolist())
+
+def test_strided_arrays_loop_all_parallel():
+    """
+    Test strided-array loops divided among threads.
+    """
+
+    from qy import (
+        compile_kernel,
+        StridedArrayArgument,
+        )
+
+    argument = StridedArrayArgument(float, 2)
+
+    for (schedule, width) in [("static", None), ("dynamic", 4)]:
+        @compile_kernel(argument_types = [argument, argument], nogil = True)
+        def kernel(in_, out):
+            arrays = StridedArrays({"in" : in_, "out" : out})
+
+            @arrays.loop_all(vector_width = width, parallel = True, schedule = schedule, threads = 3)
+            def _(l):
+                (l.arrays["in"].data.load() + 1.0).store(l.arrays["out"].data)
+
+        for shape in [(17, 9), (1, 5), (40, 1)]:
+            in_ = numpy.random.rand(*shape)
+            out = numpy.empty(shape)
+
+            kernel(in_, out)
+
+            assert_equal(out.tolist(), (in_ + 1.0).tolist())
+
+def test_strided_arrays_loop_all_target_width():
+    """
+    Test that automatic vector widths follow the module target.
+    """
+
+    from qy import (
+        Target,
+        emit_module,
+        )
+
+    in_ = numpy.random.rand(64)
+    out = numpy.empty(64)
+
+    def emit():
+        arrays = StridedArrays.from_numpy({"in" : in_, "out" : out})
+
+        @arrays.loop_all(vector_width = "auto")
+        def _(l):
+            l.arrays["in"].data.load().store(l.arrays["out"].data)
+
+    for (bits, lanes) in [(128, 2), (512, 8)]:
+        module = str(emit_module(emit, target = Target("", [], vector_bits = bits)))
+
+        assert "<%i x double>" % lanes in module
+
+def test_strided_arrays_loop_order():
+    """
+    Test stride-aware ordering of strided-array loops.
+    """
+
+    from nose.tools import assert_raises
+
+    in_ = numpy.random.rand(6, 5, 4)
+    out = numpy.empty((6, 5, 4)).T
+
+    @emit_and_execute()
+    def _():
+        arrays = StridedArrays.from_numpy({"in" : in_.T, "out" : out})
+
+        assert_equal(arrays.loop_order(), [0, 1, 2])
+        assert_equal(arrays.loop_order(order = "auto"), [2, 1, 0])
+        assert_equal(arrays.loop_order(2, order = [1, 0]), [1, 0])
+        assert_raises(ValueError, lambda: arrays.loop_order(order = [0, 0, 1]))
+
+        @arrays.loop_all(vector_width = 2, order = "auto")
+        def _(l):
+            l.arrays["in"].data.load().store(l.arrays["out"].data)
+
+    assert_equal(out.tolist(), in_.T.tolist())
+
+def test_strided_arrays_loop_all_default_order():
+    """
+    Test that strided-array loops visit elements in axis order by default.
+    """
+
+    default = numpy.empty((3, 4)).T
+    auto    = numpy.empty((3, 4)).T
+
+    @emit_and_execute()
+    def _():
+        for (out, order) in [(default, None), (auto, "auto")]:
+            arrays = StridedArrays.from_numpy({"out" : out})
+            count  = qy.Variable.set_to(0.0)
+
+            @arrays.loop_all(**({} if order is None else {"order" : order}))
+            def _(l):
+                count.value.store(l.arrays["out"].data)
+                count.set(count.value + 1.0)
+
+    assert_equal(default.tolist(), numpy.arange(12.0).reshape(4, 3).tolist())
+    assert_equal(auto.tolist(), numpy.arange(12.0).reshape(3, 4).T.tolist())
+
+def test_strided_arrays_loop_groups():
+    """
+    Test collapsing of jointly contiguous loop axes.
+    """
+
+    in_ = numpy.random.rand(7, 4, 3)
+    out = numpy.empty((7, 4, 3))
+
+    @emit_and_execute()
+    def _():
+        contiguous = StridedArrays.from_numpy({"in" : in_, "out" : out})
+        sliced     = StridedArrays.from_numpy({"in" : in_[:, :3], "out" : out[:, :3]})
+
+        assert_equal(contiguous.loop_groups(), [[0, 1, 2]])
+        assert_equal(sliced.loop_groups(), [[0], [1, 2]])
+        assert_equal(contiguous.loop_groups(order = [1, 0, 2]), [[1], [0], [2]])
+        assert_equal(StridedArrays.from_numpy({"in" : in_.T}).loop_groups(), [[0], [1], [2]])
+        assert_equal(StridedArrays.from_numpy({"in" : in_.T}).loop_groups(order = "auto"), [[2, 1, 0]])
+
+        @contiguous.loop_all(vector_width = 4, collapse = True)
+        def _(l):
+            (l.arrays["in"].data.load() * 3.0).store(l.arrays["out"].data)
+
+        @sliced.loop_all(vector_width = 4)
+        def _(l):
+            (l.arrays["in"].data.load() * 2.0).store(l.arrays["out"].data)
+
+    expected = in_ * 3.0
+
+    expected[:, :3] = in_[:, :3] * 2.0
+
+    assert_equal(out.tolist(), expected.tolist())
+
+def test_strided_arrays_loop_all_tiled():
+    """
+    Test cache-blocked strided-array loops.
+    """
+
+    from qy import (
+        compile_kernel,
+        StridedArrayArgument,
+        )
+
+    argument = StridedArrayArgument(float, 2)
+
+    for tile in [5, [3, 4], "auto"]:
+        @compile_kernel(argument_types = [argument, argument])
+        def kernel(in_, out):
+            arrays = StridedArrays({"in" : in_, "out" : out})
+
+            @arrays.loop_all(tile = tile, vector_width = 2)
+            def _(l):
+                l.arrays["in"].data.load().store(l.arrays["out"].data)
+
+        for shape in [(17, 11), (1, 9), (64, 3)]:
+            in_ = numpy.random.rand(*shape)
+            out = numpy.empty(shape[::-1]).T
+
+            kernel(in_, out)
+
+            assert_equal(out.tolist(), in_.tolist())
+
+    # tile sizes are loop steps, so must be positive Python integers
+    for tile in [0, [3, -1], 2.5, [4, None]]:
+        def emit_tiled(in_, out):
+            arrays = StridedArrays({"in" : in_, "out" : out})
+
+            @arrays.loop_all(tile = tile)
+            def _(l):
+                l.arrays["in"].data.load().store(l.arrays["out"].data)
+
+        assert_raises(ValueError, lambda: compile_kernel(argument_types = [argument, argument])(emit_tiled))
@@ -4,7 +4,10 @@
 
 import numpy
 
-from nose.tools import assert_equal
+from nose.tools import (
+    assert_true,
+    assert_equal,
+    )
 
 def test_type_from_dtype_complex():
     """
@@ -36,3 +39,203 @@ def test_dtype_from_type_complex():
     assert_equal(dtype2.itemsize, dtype.itemsize)
     assert_equal(str(dtype2), str(dtype))
 
+
+def test_kernel_cache_lru():
+    """
+    Test LRU eviction and counters of the kernel cache.
+    """
+
+    from qy import KernelCache
+
+    cache = KernelCache(2)
+
+    cache.put("a", 1)
+    cache.put("b", 2)
+
+    assert_equal(cache.get("a"), 1)
+
+    cache.put("c", 3)
+
+    assert_equal(cache.get("b"), None)
+    assert_equal(cache.get("c"), 3)
+    assert_equal(
+        cache.stats,
+        {"size" : 2, "capacity" : 2, "hits" : 2, "misses" : 1, "evictions" : 1},
+        )
+
+def test_emit_and_execute_cached():
+    """
+    Test reuse of compiled modules across emit_and_execute calls.
+    """
+
+    import qy
+
+    from qy import (
+        KernelCache,
+        emit_and_execute,
+        )
+
+    cache = KernelCache()
+
+    for _ in xrange(4):
+        @emit_and_execute(cache = cache)
+        def _():
+            @qy.for_(8)
+            def _(_):
+                pass
+
+    assert_equal(cache.misses, 1)
+    assert_equal(cache.hits, 3)
+
+    # a user-supplied key skips emission entirely on a hit
+    emitted = []
+
+    for _ in xrange(2):
+        @emit_and_execute(cache = cache, key = "kernel")
+        def _():
+            emitted.append(True)
+
+    assert_equal(len(emitted), 1)
+
+def test_disk_cache_round_trip():
+    """
+    Test storage, lookup, and eviction in the on-disk module cache.
+    """
+
+    import shutil
+    import tempfile
+    import qy
+
+    from qy import (
+        DiskCache,
+        emit_and_execute,
+        )
+
+    path = tempfile.mkdtemp()
+
+    try:
+        disk_cache = DiskCache(path)
+
+        def emit():
+            @qy.for_(8)
+            def _(_):
+                pass
+
+        @emit_and_execute(cache = None, disk_cache = disk_cache, key = "loop")
+        def _():
+            emit()
+
+        # entries are keyed on the IR hash, whatever the user key
+        ir_hash = qy.module_hash(qy.emit_module(emit))
+
+        assert_equal(len(disk_cache.entries()), 1)
+        assert_true(disk_cache.load(("ir", ir_hash, "O2", None)) is not None)
+        assert_equal(disk_cache.load(("user", "loop", False, "O2", None)), None)
+
+        # a warm start skips optimization
+        kernel = qy.compile_kernel(cache = None, disk_cache = disk_cache, key = "other")(emit)
+
+        kernel()
+
+        assert_equal(len(disk_cache.entries()), 1)
+        assert_equal(kernel.compiled.pass_timings, [])
+
+        # modules that embed this process's addresses are not stored
+        array = numpy.zeros(4)
+
+        @emit_and_execute(cache = None, disk_cache = disk_cache)
+        def _():
+            qy.StridedArray.from_numpy(array).at(0).data.load()
+
+        assert_equal(len(disk_cache.entries()), 1)
+
+        assert_equal(disk_cache.clear(), 1)
+        assert_equal(disk_cache.total_bytes, 0)
+    finally:
+        shutil.rmtree(path)
+
+def test_compile_module_levels():
+    """
+    Test the named optimization levels.
+    """
+
+    import qy
+
+    from nose.tools import assert_raises
+    from qy         import (
+        emit_module,
+        compile_module,
+        optimize_module,
+        optimization_levels,
+        )
+
+    def emit():
+        total = qy.Variable.set_to(0)
+
+        @qy.for_(16)
+        def _(i):
+            total.set(total.value + i)
+
+        @qy.python(total.value)
+        def _(total_py):
+            assert_equal(total_py, sum(xrange(16)))
+
+    for level in sorted(optimization_levels):
+        compiled = compile_module(emit_module(emit), optimize = level)
+
+        compiled.engine.run_function(compiled.main, [])
+
+        assert_equal(compiled.level, level)
+        assert_equal([n for (n, _) in compiled.pass_timings], optimization_levels[level])
+
+    timings = optimize_module(emit_module(emit), "O3", per_pass = False)
+
+    assert_equal([n for (n, _) in timings], ["pipeline"])
+    assert_raises(ValueError, lambda: compile_module(emit_module(emit), optimize = "O9"))
+
+def test_compile_profile():
+    """
+    Test phase-level compile instrumentation.
+    """
+
+    import json
+    import qy
+
+    from cStringIO import StringIO
+    from qy        import (
+        compile_log,
+        compile_cached,
+        )
+
+    def emit_loop():
+        @qy.for_(8)
+        def _(_):
+            pass
+
+    enabled = compile_log.enabled
+
+    compile_log.clear()
+    compile_log.enable()
+
+    try:
+        compiled = compile_cached(emit_loop, cache = None)
+    finally:
+        compile_log.enable(enabled)
+
+    profile = compiled.profile
+    phases  = [p["phase"] for p in profile.phases]
+
+    assert_equal(phases, ["emit", "verify", "engine", "optimize", "codegen"])
+    assert_equal(profile.name, "emit_loop")
+    assert_true(profile.phases[0]["instructions"] > 0)
+    assert_true(profile.phases[0]["blocks"] > 1)
+    assert_true(all(p["seconds"] >= 0.0 for p in profile.phases))
+
+    dumped = StringIO()
+
+    compile_log.dump(dumped)
+
+    document = json.loads(dumped.getvalue())
+
+    assert_equal(document["profiles"][-1]["hash"], profile.hash)
+    assert_equal(sorted(document["summary"]), sorted(phases))
@@ -0,0 +1,168 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+import numpy
+import qy
+
+from nose.tools import (
+    assert_equal,
+    assert_almost_equal,
+    )
+from qy         import (
+    compile_kernel,
+    emit_and_execute,
+    StridedArray,
+    StridedArrays,
+    StridedArrayArgument,
+    )
+
+def test_reduce_sum():
+    """
+    Test full and partial sums, scalar and vectorized.
+    """
+
+    in_ = numpy.random.rand(7, 37)
+
+    for width in [None, 4]:
+        total = numpy.empty(())
+        rows  = numpy.empty(7)
+        cols  = numpy.empty(37)
+
+        @emit_and_execute()
+        def _():
+            array = StridedArray.from_numpy(in_)
+
+            qy.reduce_sum(array, out = StridedArray.from_numpy(total), vector_width = width)
+            qy.reduce_sum(array, 1, out = StridedArray.from_numpy(rows), vector_width = width)
+            qy.reduce_sum(array, 0, out = StridedArray.from_numpy(cols), vector_width = width)
+
+        assert_almost_equal(total, in_.sum())
+        numpy.testing.assert_allclose(rows, in_.sum(axis = 1))
+        numpy.testing.assert_allclose(cols, in_.sum(axis = 0))
+
+    # strides known only at run time
+    argument = StridedArrayArgument(float, 2)
+
+    @compile_kernel(float, [argument])
+    def kernel(in_):
+        qy.return_(qy.reduce_sum(in_, vector_width = 4))
+
+    for in_ in [numpy.random.rand(5, 19), numpy.random.rand(19, 5).T, numpy.random.rand(0, 3)]:
+        assert_almost_equal(kernel(in_), in_.sum())
+
+def test_reduce_float32():
+    """
+    Test reductions of single-precision arrays.
+    """
+
+    in_ = numpy.random.rand(5, 21).astype(numpy.float32)
+
+    for width in [None, 4]:
+        rows     = numpy.empty(5, numpy.float32)
+        mins     = numpy.empty(21, numpy.float32)
+        argmaxes = numpy.empty(5, int)
+
+        @emit_and_execute()
+        def _():
+            array = StridedArray.from_numpy(in_)
+
+            qy.reduce_sum(array, 1, out = StridedArray.from_numpy(rows), vector_width = width)
+            qy.reduce_min(array, 0, out = StridedArray.from_numpy(mins), vector_width = width)
+            qy.reduce_argmax(array, 1, out = StridedArray.from_numpy(argmaxes), vector_width = width)
+
+        numpy.testing.assert_allclose(rows, in_.sum(axis = 1), rtol = 1e-5)
+        assert_equal(mins.tolist(), in_.min(axis = 0).tolist())
+        assert_equal(argmaxes.tolist(), in_.argmax(axis = 1).tolist())
+
+def test_reduce_extrema():
+    """
+    Test minima, maxima, and their indices, including ties and nan.
+    """
+
+    in_ = numpy.array([[3, 9, 1, 9, 1], [4, 2, 8, 2, 7]])
+
+    def reduce_all(in_, axes):
+        """
+        Compute every extremum along axes.
+        """
+
+        shape   = numpy.delete(in_.shape, axes)
+        results = [numpy.empty(shape, in_.dtype) for _ in xrange(2)] + [numpy.empty(shape, int) for _ in xrange(2)]
+
+        @emit_and_execute()
+        def _():
+            array = StridedArray.from_numpy(in_)
+
+            for (reduce_, out) in zip([qy.reduce_min, qy.reduce_max, qy.reduce_argmin, qy.reduce_argmax], results):
+                reduce_(array, axes, out = StridedArray.from_numpy(out))
+
+        return results
+
+    for axes in [0, 1]:
+        (mins, maxes, argmins, argmaxes) = reduce_all(in_, axes)
+
+        assert_equal(mins.tolist(), in_.min(axis = axes).tolist())
+        assert_equal(maxes.tolist(), in_.max(axis = axes).tolist())
+        assert_equal(argmins.tolist(), in_.argmin(axis = axes).tolist())
+        assert_equal(argmaxes.tolist(), in_.argmax(axis = axes).tolist())
+
+    with_nan = numpy.array([1.0, 5.0, numpy.nan, 0.0, numpy.nan, 7.0])
+
+    (mins, maxes, argmins, argmaxes) = reduce_all(with_nan, 0)
+
+    assert numpy.isnan(mins)
+    assert numpy.isnan(maxes)
+    assert_equal(argmins.tolist(), 2)
+    assert_equal(argmaxes.tolist(), 2)
+
+def test_reduce_custom():
+    """
+    Test reductions with custom operations and values over several arrays.
+    """
+
+    a = numpy.random.rand(23)
+    b = numpy.random.rand(23)
+    c = numpy.random.randint(100, size = (3, 11))
+
+    dot = numpy.empty(())
+    ors = numpy.empty(3, int)
+
+    @emit_and_execute()
+    def _():
+        arrays = StridedArrays.from_numpy({"a" : a, "b" : b})
+
+        qy.reduce_sum(
+            arrays,
+            out   = StridedArray.from_numpy(dot),
+            value = lambda l: l.arrays["a"].data.load() * l.arrays["b"].data.load(),
+            )
+        qy.reduce_(
+            StridedArray.from_numpy(c),
+            lambda x, y: x | y,
+            0,
+            axes = 1,
+            out  = StridedArray.from_numpy(ors),
+            )
+
+    assert_almost_equal(dot, numpy.dot(a, b))
+    assert_equal(ors.tolist(), numpy.bitwise_or.reduce(c, axis = 1).tolist())
+
+    # without commutativity, elements are combined in axis order
+    d = numpy.asfortranarray(-numpy.ones((3, 4)))
+
+    d[0, 2] = 7.0
+    d[1, 0] = 9.0
+
+    first = numpy.empty(())
+
+    @emit_and_execute()
+    def _():
+        qy.reduce_(
+            StridedArray.from_numpy(d),
+            lambda x, y: qy.select(x > 0.0, x, y),
+            -1.0,
+            out = StridedArray.from_numpy(first),
+            )
+
+    assert_equal(first, 7.0)
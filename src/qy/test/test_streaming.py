@@ -0,0 +1,91 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+import os.path
+import shutil
+import tempfile
+import numpy
+import qy
+
+from nose.tools import (
+    assert_equal,
+    assert_raises,
+    assert_almost_equal,
+    )
+
+@qy.dispatch()
+def double_and_sum(in_, out, total):
+    """
+    Emit a chunk kernel that doubles its input and accumulates its sum.
+    """
+
+    arrays = qy.StridedArrays({"in" : in_, "out" : out})
+
+    @arrays.loop_all()
+    def _(l):
+        (l.arrays["in"].data.load() * 2.0).store(l.arrays["out"].data)
+
+    (total.data.load() + qy.reduce_sum(in_)).store(total.data)
+
+def test_run_chunked():
+    """
+    Test chunked execution over memory-mapped files.
+    """
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        in_path  = os.path.join(directory, "in.npy")
+        out_path = os.path.join(directory, "out.npy")
+        in_      = numpy.random.rand(1001, 3)
+        total    = numpy.zeros(())
+
+        numpy.save(in_path, in_)
+
+        (out,) = \
+            qy.run_chunked(
+                double_and_sum,
+                [in_path],
+                [(out_path, numpy.float64, in_.shape)],
+                [total],
+                chunk_bytes = 4096,
+                )
+
+        assert isinstance(out, numpy.memmap)
+        assert_equal(numpy.load(out_path).tolist(), (in_ * 2.0).tolist())
+        assert_almost_equal(total, in_.sum())
+        assert_equal(len(double_and_sum.variants), 1)
+    finally:
+        shutil.rmtree(directory)
+
+def test_stream():
+    """
+    Test a streamed scan with carried state.
+    """
+
+    @qy.dispatch(nogil = True)
+    def cumulative_sum(in_, out, carry):
+        @qy.for_(in_.shape[0])
+        def _(i):
+            running = carry.data.load() + in_.at(i).data.load()
+
+            running.store(out.at(i).data)
+            running.store(carry.data)
+
+    blocks = [numpy.random.rand(n) for n in [5, 17, 1, 9]]
+    carry  = numpy.zeros(())
+    out    = list(qy.stream(cumulative_sum, iter(blocks), [numpy.float64], [carry]))
+
+    assert_equal(map(len, out), [5, 17, 1, 9])
+    numpy.testing.assert_allclose(numpy.concatenate(out), numpy.cumsum(numpy.concatenate(blocks)))
+    assert_equal(len(cumulative_sum.variants), 1)
+
+    # errors in the iterator reach the consumer
+    def failing():
+        yield numpy.zeros(3)
+
+        raise IOError("lost the cursor")
+
+    with assert_raises(IOError):
+        list(qy.stream(cumulative_sum, failing(), [numpy.float64], [carry]))
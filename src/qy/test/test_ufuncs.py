@@ -0,0 +1,130 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+import numpy
+import qy
+
+from nose.tools import (
+    assert_equal,
+    assert_raises,
+    )
+
+def test_ufunc_broadcast():
+    """
+    Test broadcasting, output allocation, and loop caching.
+    """
+
+    @qy.ufunc()
+    def fma(a, b, c):
+        return a * b + c
+
+    a = numpy.random.rand(4, 1)
+    b = numpy.random.rand(5)
+    c = numpy.random.randint(10, size = (3, 4, 5))
+
+    assert_equal(fma(a, b, c).tolist(), (a * b + c).tolist())
+    assert_equal(fma(a, b, c).dtype, numpy.float64)
+    assert_equal(fma(2.0, 3.0, 1).tolist(), 7.0)
+    assert_equal(len(fma.variants), 2)
+
+    fma(numpy.random.rand(4, 1), numpy.random.rand(7), numpy.random.randint(10, size = (2, 4, 7)))
+
+    assert_equal(len(fma.variants), 2)
+
+    # outputs may be given
+    out = numpy.empty((3, 4, 5), numpy.float32)
+
+    assert fma(a, b, c, out = out) is out
+    assert_raises(ValueError, lambda: fma(a, b, c, out = numpy.empty((4, 5))))
+
+def test_ufunc_outputs():
+    """
+    Test ufuncs with several outputs and explicit output types.
+    """
+
+    @qy.ufunc(nout = 2, otypes = [numpy.int64, float], vector_width = 4)
+    def halve(x):
+        return (x * 0.5, x * 0.5)
+
+    x = numpy.arange(11.0)
+
+    (truncated, halves) = halve(x)
+
+    assert_equal(truncated.tolist(), (x * 0.5).astype(numpy.int64).tolist())
+    assert_equal(halves.tolist(), (x * 0.5).tolist())
+    assert_equal(truncated.dtype, numpy.int64)
+
+def test_ufunc_float32():
+    """
+    Test single-precision inputs and outputs, and mixed promotion.
+    """
+
+    @qy.ufunc(vector_width = 4)
+    def scale(a, b):
+        return a * b + 1.0
+
+    a = numpy.random.rand(3, 13).astype(numpy.float32)
+    b = numpy.random.rand(13).astype(numpy.float32)
+
+    assert_equal(scale(a, b).dtype, numpy.float32)
+    assert_equal(scale(a, b).tolist(), (a * b + numpy.float32(1.0)).tolist())
+
+    # float32 inputs promoted to a float64 loop, and float64 stored as float32
+    c   = numpy.random.rand(13)
+    out = numpy.empty((3, 13), numpy.float32)
+
+    numpy.testing.assert_allclose(scale(a, c), a * c + 1.0)
+    numpy.testing.assert_allclose(scale(a, c, out = out), (a * c + 1.0).astype(numpy.float32))
+
+def test_ufunc_to_numpy():
+    """
+    Test export of compiled loops as a NumPy ufunc.
+    """
+
+    @qy.numpy_ufunc(["dd->d", "ff->f", "ll->l"], identity = 0, vector_width = 4)
+    def add(a, b):
+        return a + b
+
+    assert isinstance(add, numpy.ufunc)
+    assert_equal(add.__name__, "add")
+    assert_equal((add.nin, add.nout, add.ntypes), (2, 1, 3))
+
+    a = numpy.random.rand(3, 17)
+    b = numpy.random.rand(17)
+
+    assert_equal(add(a, b).tolist(), (a + b).tolist())
+    assert_equal(add(a.T[::2], 1.0).tolist(), (a.T[::2] + 1.0).tolist())
+    assert_equal(add(a.astype(numpy.float32), 1).dtype, numpy.float32)
+    assert_equal(add.reduce(numpy.arange(10)), 45)
+    assert_equal(add.accumulate(numpy.arange(4)).tolist(), [0, 1, 3, 6])
+
+    out = numpy.zeros(17)
+
+    add(b, b, out = out, where = b > 0.5)
+
+    assert_equal(out.tolist(), numpy.where(b > 0.5, 2 * b, 0.0).tolist())
+
+    # single-precision loops are exact in single precision
+    c = numpy.random.rand(17).astype(numpy.float32)
+
+    assert_equal(add(c, c).tolist(), (c + c).tolist())
+
+    # a loop that cannot be compiled is reported by signature
+    def mod(a, b):
+        return a % b
+
+    with assert_raises(TypeError) as context:
+        qy.numpy_ufunc(["ll->l", "dd->d"])(mod)
+
+    assert "dd->d" in str(context.exception)
+
+    # loops run without the GIL, so they cannot call into Python
+    def noisy(a, b):
+        @qy.python(a)
+        def _(a):
+            print a
+
+        return a + b
+
+    assert_raises(TypeError, lambda: qy.numpy_ufunc(["dd->d"])(noisy))
@@ -0,0 +1,435 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "UFunc",
+    "ufunc",
+    "numpy_ufunc",
+    ]
+
+import ctypes
+import inspect
+import functools
+import numpy
+import qy
+import qy.llvm as llvm
+
+numpy_identities = {
+    None : -1, # PyUFunc_None
+    0    : 0,  # PyUFunc_Zero
+    1    : 1,  # PyUFunc_One
+    }
+
+# objects that exported ufuncs refer to; they must live as long as the process
+exported_objects = []
+
+def ufunc_from_func_and_data():
+    """
+    Return NumPy's PyUFunc_FromFuncAndData(), as a ctypes function.
+
+    The function is found in the ufunc C API table, as a C extension would
+    find it, without compiling against the NumPy headers.
+    """
+
+    from numpy.core import umath
+
+    get_pointer          = ctypes.pythonapi.PyCapsule_GetPointer
+    get_pointer.restype  = ctypes.c_void_p
+    get_pointer.argtypes = [ctypes.py_object, ctypes.c_char_p]
+
+    table     = ctypes.cast(get_pointer(umath._UFUNC_API, None), ctypes.POINTER(ctypes.c_void_p))
+    prototype = \
+        ctypes.PYFUNCTYPE(
+            ctypes.py_object,
+            ctypes.c_void_p,   # loop functions
+            ctypes.c_void_p,   # loop data
+            ctypes.c_void_p,   # loop types
+            ctypes.c_int,      # number of loops
+            ctypes.c_int,      # number of inputs
+            ctypes.c_int,      # number of outputs
+            ctypes.c_int,      # identity
+            ctypes.c_char_p,   # name
+            ctypes.c_char_p,   # doc
+            ctypes.c_int,      # unused
+            )
+
+    return prototype(table[1])
+
+def parse_loop_types(types, nin, nout):
+    """
+    Return the dtypes of a loop signature, such as "dd->d".
+    """
+
+    if isinstance(types, basestring):
+        (inputs, _, outputs) = types.partition("->")
+        dtypes               = map(numpy.dtype, inputs + outputs)
+    else:
+        dtypes = map(numpy.dtype, types)
+
+    if len(dtypes) != nin + nout:
+        raise ValueError("loop signature %r does not have %i inputs and %i outputs" % (types, nin, nout))
+
+    return dtypes
+
+class UFunc(object):
+    """
+    Elementwise kernel with a NumPy-like call interface.
+
+    The scalar emitter receives one value per input and returns the output
+    value, or a tuple of output values. Inputs are broadcast against each
+    other with semicast(); as in NumPy, their values are converted to a common
+    loop type, chosen by numpy.result_type(), before the emitter sees them.
+    Outputs are allocated with the loop type, or the given output dtypes,
+    unless passed through the out keyword. Loops are compiled on demand, one
+    per loop type and input and output dtype and rank signature, through a
+    dynamic-policy Dispatcher.
+    """
+
+    def __init__(
+        self,
+        emit,
+        nin          = None,
+        nout         = 1,
+        otypes       = None,
+        vector_width = None,
+        parallel     = False,
+        optimize     = True,
+        target       = None,
+        ):
+        """
+        Initialize.
+        """
+
+        if nin is None:
+            nin = len(inspect.getargspec(emit).args)
+
+        if otypes is not None:
+            otypes = map(numpy.dtype, otypes)
+
+            if len(otypes) != nout:
+                raise ValueError("expected %i output dtypes, received %i" % (nout, len(otypes)))
+
+        self._emit         = emit
+        self._nin          = nin
+        self._nout         = nout
+        self._otypes       = otypes
+        self._vector_width = vector_width
+        self._parallel     = parallel
+        self._optimize     = optimize
+        self._target       = target
+        self._dispatchers  = {}
+
+        functools.update_wrapper(self, emit)
+
+    def __call__(self, *inputs, **keywords):
+        """
+        Apply the kernel elementwise, returning the output array(s).
+        """
+
+        # argument sanity
+        out = keywords.pop("out", None)
+
+        if keywords:
+            raise TypeError("unexpected keyword arguments: %s" % ", ".join(sorted(keywords)))
+        elif len(inputs) != self._nin:
+            raise TypeError("ufunc expects %i inputs but received %i" % (self._nin, len(inputs)))
+
+        # broadcast the inputs
+        from qy import semicast
+
+        inputs         = map(numpy.asarray, inputs)
+        loop_dtype     = numpy.result_type(*inputs)
+        (shape, casts) = semicast(*[(a, None) for a in inputs])
+
+        # prepare the outputs
+        if out is None:
+            if self._otypes is None:
+                otypes = [loop_dtype] * self._nout
+            else:
+                otypes = self._otypes
+
+            outputs = [numpy.empty(shape, d) for d in otypes]
+        else:
+            if isinstance(out, numpy.ndarray):
+                outputs = [out]
+            else:
+                outputs = list(out)
+
+            if len(outputs) != self._nout:
+                raise ValueError("expected %i output arrays, received %i" % (self._nout, len(outputs)))
+
+            for output in outputs:
+                if not isinstance(output, numpy.ndarray):
+                    raise TypeError("output must be an ndarray")
+                elif output.shape != shape:
+                    raise ValueError("output shape %s does not match broadcast shape %s" % (output.shape, shape))
+
+        # run the loop
+        self.dispatcher_for(loop_dtype)(*(casts + outputs))
+
+        if out is None and shape == ():
+            outputs = [o[()] for o in outputs]
+
+        if self._nout == 1:
+            return outputs[0]
+        else:
+            return tuple(outputs)
+
+    def dispatcher_for(self, loop_dtype):
+        """
+        Return the dispatcher of loops using a particular loop type.
+        """
+
+        from qy import Dispatcher
+
+        loop_dtype = numpy.dtype(loop_dtype)
+        dispatcher = self._dispatchers.get(loop_dtype.str)
+
+        if dispatcher is None:
+            def emit_loop(*arrays):
+                self._emit_loop(loop_dtype, arrays)
+
+            dispatcher = \
+                Dispatcher(
+                    emit_loop,
+                    policy   = "dynamic",
+                    optimize = self._optimize,
+                    target   = self._target,
+                    )
+
+            self._dispatchers[loop_dtype.str] = dispatcher
+
+        return dispatcher
+
+    def to_numpy(self, types, name = None, identity = None, doc = None):
+        """
+        Export compiled loops as a numpy.ufunc.
+
+        One native inner loop is compiled for each signature, given as a
+        string such as "dd->d" or as a sequence of input and output dtypes;
+        NumPy then handles broadcasting, casting to a matching loop, out=,
+        where=, reduce(), and accumulate(). The identity (None, 0, or 1) is
+        used by reductions over no elements. NumPy runs the loops without the
+        GIL, so they are compiled with nogil set: an emitter that calls into
+        Python fails to compile, and a failed assertion ends the loop early
+        without raising an error.
+
+        Every loop is compiled here, because NumPy requires their addresses
+        up front; a signature whose loop cannot be compiled raises TypeError,
+        naming the signature.
+        """
+
+        from qy import compile_kernel
+
+        if identity not in numpy_identities:
+            raise ValueError("ufunc identity must be None, 0, or 1")
+
+        if name is None:
+            name = self.__name__
+
+        if doc is None:
+            doc = self.__doc__ or ""
+
+        types      = [parse_loop_types(t, self._nin, self._nout) for t in types]
+        bytes_type = llvm.Type.pointer(llvm.Type.int(8))
+        steps_type = llvm.Type.pointer(qy.iptr_type)
+        kernels    = []
+
+        for dtypes in types:
+            decorator = \
+                compile_kernel(
+                    argument_types = [llvm.Type.pointer(bytes_type), steps_type, steps_type, bytes_type],
+                    optimize       = self._optimize,
+                    cache          = None,
+                    target         = self._target,
+                    nogil          = True,
+                    )
+
+            def emit_kernel(data, dimensions, steps, _):
+                """
+                Emit the inner loop of one signature.
+                """
+
+                self._emit_inner_loop(dtypes, data, dimensions, steps)
+
+            try:
+                kernel = decorator(emit_kernel)
+            except Exception, error:
+                signature = "%s->%s" % (
+                    "".join(d.char for d in dtypes[:self._nin]),
+                    "".join(d.char for d in dtypes[self._nin:]),
+                    )
+
+                raise TypeError("cannot compile loop %s of ufunc %s: %s" % (signature, name, error))
+
+            kernels.append(kernel)
+
+        # build the loop tables; NumPy keeps pointers into them
+        functions = (ctypes.c_void_p * len(kernels))(*[k.address for k in kernels])
+        data      = (ctypes.c_void_p * len(kernels))()
+        type_nums = (ctypes.c_char * (len(kernels) * (self._nin + self._nout)))(*[chr(d.num) for t in types for d in t])
+        name      = ctypes.c_char_p(name)
+        doc       = ctypes.c_char_p(doc)
+
+        exported_objects.append((kernels, functions, data, type_nums, name, doc))
+
+        return \
+            ufunc_from_func_and_data()(
+                ctypes.addressof(functions),
+                ctypes.addressof(data),
+                ctypes.addressof(type_nums),
+                len(kernels),
+                self._nin,
+                self._nout,
+                numpy_identities[identity],
+                name,
+                doc,
+                0,
+                )
+
+    def _emit_loop(self, loop_dtype, arrays):
+        """
+        Emit the elementwise loop over input and output arrays.
+        """
+
+        from qy import type_from_dtype
+
+        loop_type = type_from_dtype(loop_dtype)
+        arrays    = qy.StridedArrays(dict(enumerate(arrays)))
+
+        @arrays.loop_all(vector_width = self._vector_width, parallel = self._parallel, order = "auto", collapse = True)
+        def _(l):
+            self._emit_elements(l, loop_type)
+
+    def _emit_inner_loop(self, dtypes, data, dimensions, steps):
+        """
+        Emit the body of a NumPy inner loop over arguments of some dtypes.
+        """
+
+        from qy import (
+            type_from_dtype,
+            StridedArray,
+            )
+
+        count  = dimensions.load()
+        arrays = {}
+
+        for (i, dtype) in enumerate(dtypes):
+            pointer   = data.gep(i).load().cast_to(llvm.Type.pointer(type_from_dtype(dtype)))
+            arrays[i] = StridedArray.from_raw(pointer, [count], [steps.gep(i).load()])
+
+        arrays = qy.StridedArrays(arrays)
+
+        @arrays.loop_all(vector_width = self._vector_width)
+        def _(l):
+            self._emit_elements(l)
+
+    def _emit_elements(self, l, loop_type = None):
+        """
+        Emit the computation of one element (or vector of elements).
+
+        Input values are converted to the loop type, if any.
+        """
+
+        values = []
+
+        for i in xrange(self._nin):
+            value = l.arrays[i].data.load()
+
+            if loop_type is None:
+                values.append(value)
+            elif value.type_.kind == llvm.TYPE_VECTOR:
+                values.append(value.cast_to(llvm.Type.vector(loop_type, value.type_.count)))
+            else:
+                values.append(value.cast_to(loop_type))
+
+        results = self._emit(*values)
+
+        if self._nout == 1:
+            results = [results]
+
+        for (i, result) in enumerate(results):
+            output = l.arrays[self._nin + i]
+
+            qy.value_from_any(result).cast_to(output.element_type).store(output.data)
+
+    @property
+    def nin(self):
+        """
+        The number of inputs.
+        """
+
+        return self._nin
+
+    @property
+    def nout(self):
+        """
+        The number of outputs.
+        """
+
+        return self._nout
+
+    @property
+    def variants(self):
+        """
+        Dictionary mapping loop type and argument signatures to compiled loops.
+        """
+
+        variants = {}
+
+        for (loop_dtype, dispatcher) in self._dispatchers.items():
+            for (signature, kernel) in dispatcher.variants.items():
+                variants[(loop_dtype,) + signature] = kernel
+
+        return variants
+
+def ufunc(nin = None, nout = 1, otypes = None, vector_width = None, parallel = False, optimize = True, target = None):
+    """
+    Build a UFunc around a scalar emitter.
+    """
+
+    def decorator(emit):
+        """
+        Wrap the emitter.
+        """
+
+        return \
+            UFunc(
+                emit,
+                nin          = nin,
+                nout         = nout,
+                otypes       = otypes,
+                vector_width = vector_width,
+                parallel     = parallel,
+                optimize     = optimize,
+                target       = target,
+                )
+
+    return decorator
+
+def numpy_ufunc(types, nin = None, nout = 1, identity = None, name = None, vector_width = None, optimize = True, target = None):
+    """
+    Build a numpy.ufunc around a scalar emitter.
+
+    See UFunc.to_numpy().
+    """
+
+    def decorator(emit):
+        """
+        Wrap the emitter.
+        """
+
+        wrapped = \
+            UFunc(
+                emit,
+                nin          = nin,
+                nout         = nout,
+                vector_width = vector_width,
+                optimize     = optimize,
+                target       = target,
+                )
+
+        return wrapped.to_numpy(types, name = name, identity = identity)
+
+    return decorator
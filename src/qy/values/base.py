@@ -404,10 +404,12 @@ class Value(object):
         # generate an appropriate value type
         if value.type.kind == llvm.TYPE_INTEGER:
             return qy.IntegerValue(value)
-        elif value.type.kind == llvm.TYPE_DOUBLE:
+        elif value.type.kind in (llvm.TYPE_DOUBLE, llvm.TYPE_FLOAT):
             return qy.RealValue(value)
         elif value.type.kind == llvm.TYPE_POINTER:
             return qy.PointerValue(value)
+        elif value.type.kind == llvm.TYPE_VECTOR:
+            return qy.VectorValue(value)
         else:
             return qy.Value(value)
 
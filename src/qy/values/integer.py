@@ -9,6 +9,8 @@ __all__ = [
 import qy
 import qy.llvm as llvm
 
+from qy.values.base import CoercionError
+
 class IntegerValue(qy.Value):
     """
     Integer value in the wrapper language.
@@ -19,7 +21,7 @@ class IntegerValue(qy.Value):
         Return the result of bitwise inversion.
         """
 
-        return qy.get().builder.xor(self._value, LLVM_Constant.int(self.type_, -1))
+        return IntegerValue(qy.get().builder.xor(self._value, llvm.Constant.int(self.type_, -1)))
 
     def __eq__(self, other):
         """
@@ -175,7 +177,7 @@ class IntegerValue(qy.Value):
         type_     = qy.type_from_any(type_)
         low_value = None
 
-        if type_.kind == llvm.TYPE_DOUBLE:
+        if type_.kind in (llvm.TYPE_DOUBLE, llvm.TYPE_FLOAT):
             low_value = qy.get().builder.sitofp(self._value, type_, name)
         elif type_.kind == llvm.TYPE_INTEGER:
             if self.type_.width == type_.width:
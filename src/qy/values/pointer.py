@@ -9,6 +9,8 @@ __all__ = [
 import qy
 import qy.llvm as llvm
 
+from qy.values.base import CoercionError
+
 class PointerValue(qy.Value):
     """
     Pointer value in the wrapper language.
@@ -31,11 +33,20 @@ class PointerValue(qy.Value):
     def load(self, name = ""):
         """
         Load the value pointed to by this pointer.
+
+        Vector data is assumed to be aligned only to its element size.
         """
 
+        pointee = self.type_.pointee
+
+        if pointee.kind == llvm.TYPE_VECTOR:
+            align = qy.size_of_type(pointee.element)
+        else:
+            align = 0
+
         return \
             qy.Value.from_low(
-                qy.get().builder.load(self._value, name = name),
+                qy.get().builder.load(self._value, name = name, align = align),
                 )
 
     def gep(self, *indices):
@@ -5,9 +5,11 @@
 import qy
 import qy.llvm as llvm
 
+from qy.values.base import CoercionError
+
 class RealValue(qy.Value):
     """
-    Integer value in the wrapper language.
+    Real (single- or double-precision) value in the wrapper language.
     """
 
     def __eq__(self, other):
@@ -20,7 +22,7 @@ class RealValue(qy.Value):
                 qy.get().builder.fcmp(
                     llvm.FCMP_OEQ,
                     self._value,
-                    qy.value_from_any(other)._value,
+                    qy.value_from_any(other).cast_to(self.type_)._value,
                     ),
                 )
 
@@ -171,10 +173,13 @@ class RealValue(qy.Value):
         type_     = qy.type_from_any(type_)
         low_value = None
 
-        if type_.kind == llvm.TYPE_DOUBLE:
-            if self.type_.kind == llvm.TYPE_DOUBLE:
-                low_value = self._value
-        if type_.kind == llvm.TYPE_INTEGER:
+        if type_.kind == self.type_.kind:
+            return self
+        elif type_.kind == llvm.TYPE_DOUBLE and self.type_.kind == llvm.TYPE_FLOAT:
+            low_value = qy.get().builder.fpext(self._value, type_, name)
+        elif type_.kind == llvm.TYPE_FLOAT and self.type_.kind == llvm.TYPE_DOUBLE:
+            low_value = qy.get().builder.fptrunc(self._value, type_, name)
+        elif type_.kind == llvm.TYPE_INTEGER:
             low_value = qy.get().builder.fptosi(self._value, type_, name)
 
         if low_value is None:
@@ -194,5 +199,5 @@ class RealValue(qy.Value):
 
         float_from_double = Function.named("PyFloat_FromDouble", object_ptr_type, [float])
 
-        return float_from_double(self._value)
+        return float_from_double(self.cast_to(float)._value)
 
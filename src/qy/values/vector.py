@@ -0,0 +1,429 @@
+"""
+@author: Bryan Silverthorn <bcs@cargo-cult.org>
+"""
+
+__all__ = [
+    "VectorValue",
+    ]
+
+import qy
+import qy.llvm as llvm
+
+from qy.values.base import CoercionError
+
+def is_real_type(type_):
+    """
+    Is this a floating-point LLVM type?
+    """
+
+    return type_.kind in (llvm.TYPE_FLOAT, llvm.TYPE_DOUBLE)
+
+class VectorValue(qy.Value):
+    """
+    SIMD vector value in the wrapper language.
+
+    Operators apply lane by lane; scalar operands are broadcast to every lane.
+    """
+
+    def _coerce(self, other):
+        """
+        Return another operand as a vector of this type.
+        """
+
+        other = qy.value_from_any(other)
+
+        if other.type_.kind == llvm.TYPE_VECTOR:
+            if other.type_ != self.type_:
+                raise CoercionError(other.type_, self.type_)
+
+            return other
+        elif other.type_ == self.element_type:
+            return VectorValue.splat(other, self.width)
+        else:
+            return VectorValue.splat(other.cast_to(self.element_type), self.width)
+
+    def _binary(self, real_operator, integer_operator, other):
+        """
+        Emit a lane-wise binary operation.
+        """
+
+        builder = qy.get().builder
+        other   = self._coerce(other)
+
+        if is_real_type(self.element_type):
+            operator = real_operator
+        else:
+            operator = integer_operator
+
+        if operator is None:
+            raise TypeError("operator undefined for vectors of %s" % self.element_type)
+
+        return VectorValue(getattr(builder, operator)(self._value, other._value))
+
+    def _compare(self, real_predicate, integer_predicate, other):
+        """
+        Emit a lane-wise comparison.
+        """
+
+        builder = qy.get().builder
+        other   = self._coerce(other)
+
+        if is_real_type(self.element_type):
+            low_value = builder.fcmp(real_predicate, self._value, other._value)
+        else:
+            low_value = builder.icmp(integer_predicate, self._value, other._value)
+
+        return VectorValue(low_value)
+
+    def __eq__(self, other):
+        """
+        Return the result of a lane-wise equality comparison.
+        """
+
+        return self._compare(llvm.FCMP_OEQ, llvm.ICMP_EQ, other)
+
+    def __ne__(self, other):
+        """
+        Return the result of a lane-wise inequality comparison.
+        """
+
+        return self._compare(llvm.FCMP_ONE, llvm.ICMP_NE, other)
+
+    def __gt__(self, other):
+        """
+        Return the result of a lane-wise greater-than comparison.
+        """
+
+        return self._compare(llvm.FCMP_OGT, llvm.ICMP_SGT, other)
+
+    def __ge__(self, other):
+        """
+        Return the result of a lane-wise greater-than-or-equal comparison.
+        """
+
+        return self._compare(llvm.FCMP_OGE, llvm.ICMP_SGE, other)
+
+    def __lt__(self, other):
+        """
+        Return the result of a lane-wise less-than comparison.
+        """
+
+        return self._compare(llvm.FCMP_OLT, llvm.ICMP_SLT, other)
+
+    def __le__(self, other):
+        """
+        Return the result of a lane-wise less-than-or-equal comparison.
+        """
+
+        return self._compare(llvm.FCMP_OLE, llvm.ICMP_SLE, other)
+
+    def __add__(self, other):
+        """
+        Return the result of a lane-wise addition.
+        """
+
+        return self._binary("fadd", "add", other)
+
+    def __sub__(self, other):
+        """
+        Return the result of a lane-wise subtraction.
+        """
+
+        return self._binary("fsub", "sub", other)
+
+    def __mul__(self, other):
+        """
+        Return the result of a lane-wise multiplication.
+        """
+
+        return self._binary("fmul", "mul", other)
+
+    def __div__(self, other):
+        """
+        Return the result of a lane-wise division.
+        """
+
+        return self._binary("fdiv", "sdiv", other)
+
+    def __mod__(self, other):
+        """
+        Return the result of a lane-wise remainder.
+        """
+
+        return self._binary("frem", "srem", other)
+
+    def __and__(self, other):
+        """
+        Return the result of a lane-wise bitwise and.
+        """
+
+        return self._binary(None, "and_", other)
+
+    def __or__(self, other):
+        """
+        Return the result of a lane-wise bitwise or.
+        """
+
+        return self._binary(None, "or_", other)
+
+    def __xor__(self, other):
+        """
+        Return the result of a lane-wise bitwise xor.
+        """
+
+        return self._binary(None, "xor", other)
+
+    def __neg__(self):
+        """
+        Return the result of a lane-wise negation.
+        """
+
+        if is_real_type(self.element_type):
+            return self * llvm.Constant.real(self.element_type, -1.0)
+        else:
+            return self * llvm.Constant.int(self.element_type, -1)
+
+    def __invert__(self):
+        """
+        Return the result of a lane-wise bitwise inversion.
+        """
+
+        return self ^ llvm.Constant.int(self.element_type, -1)
+
+    def __abs__(self):
+        """
+        Return the lane-wise absolute value of this value.
+        """
+
+        return qy.select(self > 0, self, -self)
+
+    def __radd__(self, other):
+        """
+        Apply the "+" operator.
+        """
+
+        return self._coerce(other) + self
+
+    def __rsub__(self, other):
+        """
+        Apply the "-" operator.
+        """
+
+        return self._coerce(other) - self
+
+    def __rmul__(self, other):
+        """
+        Apply the "*" operator.
+        """
+
+        return self._coerce(other) * self
+
+    def __rdiv__(self, other):
+        """
+        Apply the "/" operator.
+        """
+
+        return self._coerce(other) / self
+
+    def __rmod__(self, other):
+        """
+        Apply the "%" operator.
+        """
+
+        return self._coerce(other) % self
+
+    def extract(self, lane):
+        """
+        Return the value of one lane.
+        """
+
+        return \
+            qy.Value.from_low(
+                qy.get().builder.extract_element(
+                    self._value,
+                    llvm.Constant.int(llvm.Type.int(32), lane),
+                    ),
+                )
+
+    def insert(self, lane, value):
+        """
+        Return a copy of this vector with one lane replaced.
+        """
+
+        value = qy.value_from_any(value).cast_to(self.element_type)
+
+        return \
+            VectorValue(
+                qy.get().builder.insert_element(
+                    self._value,
+                    value._value,
+                    llvm.Constant.int(llvm.Type.int(32), lane),
+                    ),
+                )
+
+    def elements(self):
+        """
+        Return the values of every lane.
+        """
+
+        return [self.extract(i) for i in xrange(self.width)]
+
+    def shuffle(self, lanes):
+        """
+        Return a vector of the given lanes of this vector.
+        """
+
+        mask = llvm.Constant.vector([llvm.Constant.int(llvm.Type.int(32), i) for i in lanes])
+
+        return \
+            VectorValue(
+                qy.get().builder.shuffle_vector(
+                    self._value,
+                    llvm.Constant.undef(self.type_),
+                    mask,
+                    ),
+                )
+
+    def reduce(self, combine):
+        """
+        Combine every lane into a scalar, pairwise.
+
+        The combining function receives two vectors of equal width, and is
+        applied to successive halves of this vector.
+        """
+
+        vector = self
+        width  = self.width
+
+        while width > 1 and width % 2 == 0:
+            half   = width // 2
+            vector = combine(vector.shuffle(range(half)), vector.shuffle(range(half, width)))
+            width  = half
+
+        lanes = vector.elements()
+        total = lanes[0]
+
+        for lane in lanes[1:]:
+            total = combine(total, lane)
+
+        return total
+
+    def sum(self):
+        """
+        Return the sum of every lane.
+        """
+
+        return self.reduce(lambda a, b: a + b)
+
+    def all(self):
+        """
+        Are all lanes of this boolean vector true?
+        """
+
+        return self.reduce(lambda a, b: a & b)
+
+    def any(self):
+        """
+        Is any lane of this boolean vector true?
+        """
+
+        return self.reduce(lambda a, b: a | b)
+
+    def store(self, pointer):
+        """
+        Store this value to the specified pointer.
+
+        Vector data is assumed to be aligned only to its element size.
+        """
+
+        from qy import size_of_type
+
+        return qy.get().builder.store(self._value, pointer._value, align = size_of_type(self.element_type))
+
+    def cast_to(self, type_, name = ""):
+        """
+        Cast this value to the specified type.
+
+        A boolean vector cast to a boolean is true if all its lanes are true.
+        """
+
+        type_     = qy.type_from_any(type_)
+        low_value = None
+        builder   = qy.get().builder
+
+        if type_ == self.type_:
+            return self
+        elif type_ == llvm.Type.int(1) and self.element_type == type_:
+            return self.all()
+        elif type_.kind == llvm.TYPE_VECTOR and type_.count == self.width:
+            (from_real, to_real) = (is_real_type(self.element_type), is_real_type(type_.element))
+
+            if from_real and to_real:
+                if type_.element.kind == llvm.TYPE_DOUBLE:
+                    low_value = builder.fpext(self._value, type_, name)
+                else:
+                    low_value = builder.fptrunc(self._value, type_, name)
+            elif from_real:
+                low_value = builder.fptosi(self._value, type_, name)
+            elif to_real:
+                low_value = builder.sitofp(self._value, type_, name)
+            elif type_.element.width > self.element_type.width:
+                low_value = builder.sext(self._value, type_, name)
+            else:
+                low_value = builder.trunc(self._value, type_, name)
+
+        if low_value is None:
+            raise CoercionError(self.type_, type_)
+        else:
+            return VectorValue(low_value)
+
+    @property
+    def is_nan(self):
+        """
+        Test each lane for nan.
+        """
+
+        return self._compare(llvm.FCMP_UNO, None, self)
+
+    @property
+    def width(self):
+        """
+        The number of lanes.
+        """
+
+        return self.type_.count
+
+    @property
+    def element_type(self):
+        """
+        The type of each lane.
+        """
+
+        return self.type_.element
+
+    @property
+    def kind(self):
+        """
+        Enum describing the general kind of this value.
+        """
+
+        return llvm.TYPE_VECTOR
+
+    @staticmethod
+    def splat(value, width):
+        """
+        Return a vector with every lane set to a scalar value.
+        """
+
+        value   = qy.value_from_any(value)
+        builder = qy.get().builder
+        type_   = llvm.Type.vector(value.type_, width)
+        single  = \
+            builder.insert_element(
+                llvm.Constant.undef(type_),
+                value._value,
+                llvm.Constant.int(llvm.Type.int(32), 0),
+                )
+        mask    = llvm.Constant.null(llvm.Type.vector(llvm.Type.int(32), width))
+
+        return VectorValue(builder.shuffle_vector(single, llvm.Constant.undef(type_), mask))